@@ -0,0 +1,95 @@
+"""Initial schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 09:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("hashed_password", sa.String(), nullable=False),
+        sa.Column("first_name", sa.String(), nullable=False),
+        sa.Column("last_name", sa.String(), nullable=False),
+        sa.Column("phone", sa.String()),
+        sa.Column("company", sa.String()),
+        sa.Column("is_active", sa.Boolean()),
+        sa.Column("is_admin", sa.Boolean()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True)),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "venues",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("description", sa.Text()),
+        sa.Column("address", sa.String(), nullable=False),
+        sa.Column("city", sa.String(), nullable=False),
+        sa.Column("postal_code", sa.String()),
+        sa.Column("capacity", sa.Integer(), nullable=False),
+        sa.Column("hourly_rate", sa.DECIMAL(10, 2), nullable=False),
+        sa.Column("amenities", sa.Text()),
+        sa.Column("image_url", sa.String()),
+        sa.Column("contact_email", sa.String()),
+        sa.Column("contact_phone", sa.String()),
+        sa.Column("is_active", sa.Boolean()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True)),
+    )
+    op.create_index("ix_venues_id", "venues", ["id"])
+    op.create_index("ix_venues_name", "venues", ["name"])
+    op.create_index("ix_venues_city", "venues", ["city"])
+
+    op.create_table(
+        "bookings",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("venue_id", sa.Integer(), sa.ForeignKey("venues.id"), nullable=False),
+        sa.Column("start_datetime", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("end_datetime", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("total_cost", sa.DECIMAL(10, 2), nullable=False),
+        sa.Column("status", sa.String()),
+        sa.Column("purpose", sa.String()),
+        sa.Column("notes", sa.Text()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True)),
+    )
+    op.create_index("ix_bookings_id", "bookings", ["id"])
+    op.create_index("ix_bookings_start_datetime", "bookings", ["start_datetime"])
+    op.create_index("ix_bookings_end_datetime", "bookings", ["end_datetime"])
+
+    op.create_table(
+        "booking_rollups",
+        sa.Column("venue_id", sa.Integer(), sa.ForeignKey("venues.id"), primary_key=True),
+        sa.Column("day", sa.Date(), primary_key=True),
+        sa.Column("booking_count", sa.Integer(), nullable=False),
+        sa.Column("booked_seconds", sa.BigInteger(), nullable=False),
+        sa.Column("revenue", sa.DECIMAL(12, 2), nullable=False),
+        sa.Column("confirmed_count", sa.Integer(), nullable=False),
+        sa.Column("confirmed_revenue", sa.DECIMAL(12, 2), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("booking_rollups")
+    op.drop_table("bookings")
+    op.drop_table("venues")
+    op.drop_table("users")
@@ -0,0 +1,51 @@
+"""Composite and partial indexes for the booking query shapes
+
+check_venue_availability filters on venue_id, active status and time;
+get_user_bookings and get_bookings_count filter on user_id; get_venue_bookings
+filters on venue_id and start time. On PostgreSQL the indexes are built
+CONCURRENTLY so the bookings table stays writable during the migration.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 09:30:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ACTIVE_BOOKING_PREDICATE = "status IN ('pending', 'confirmed')"
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index("ix_bookings_user_id", "bookings", ["user_id"], postgresql_concurrently=True)
+        op.create_index(
+            "ix_bookings_venue_id_start_datetime",
+            "bookings",
+            ["venue_id", "start_datetime"],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_bookings_active_venue_period",
+            "bookings",
+            ["venue_id", "start_datetime", "end_datetime"],
+            postgresql_where=sa.text(ACTIVE_BOOKING_PREDICATE),
+            sqlite_where=sa.text(ACTIVE_BOOKING_PREDICATE),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_bookings_active_venue_period", table_name="bookings", postgresql_concurrently=True)
+        op.drop_index("ix_bookings_venue_id_start_datetime", table_name="bookings", postgresql_concurrently=True)
+        op.drop_index("ix_bookings_user_id", table_name="bookings", postgresql_concurrently=True)
@@ -0,0 +1,37 @@
+"""Partial index on pending bookings for the expiry sweeper
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 11:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PENDING_BOOKING_PREDICATE = "status = 'pending'"
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_bookings_pending_created_at",
+            "bookings",
+            ["created_at"],
+            postgresql_where=sa.text(PENDING_BOOKING_PREDICATE),
+            sqlite_where=sa.text(PENDING_BOOKING_PREDICATE),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_bookings_pending_created_at", table_name="bookings", postgresql_concurrently=True)
@@ -0,0 +1,43 @@
+"""GiST index on booking periods for range overlap reads
+
+booking_overlaps() compares tstzrange(start_datetime, end_datetime) with &&
+on PostgreSQL. The index pairs it with venue_id, which needs btree_gist. Other
+databases keep using the composite B-tree indexes, so this is a no-op there.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 13:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_bookings_venue_period_gist",
+            "bookings",
+            ["venue_id", sa.text("tstzrange(start_datetime, end_datetime)")],
+            postgresql_using="gist",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_bookings_venue_period_gist", table_name="bookings", postgresql_concurrently=True)
@@ -0,0 +1,191 @@
+"""Monthly booking partitions and the bookings_archive table
+
+On PostgreSQL bookings is rebuilt as a table partitioned by the month of
+start_datetime, with a default partition and monthly partitions from the
+earliest booking to 12 months ahead. Its primary key becomes
+(id, start_datetime), as partitioning requires. The rows are
+copied, so bookings is unavailable while this runs; schedule it for a quiet
+moment. The archiver creates later partitions.
+
+Everywhere, bookings_archive is created for bookings the archiver moves out.
+Downgrading moves archived bookings back.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 15:00:00
+
+"""
+from datetime import date, datetime, timezone
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007"
+down_revision: Union[str, None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ACTIVE_BOOKING_PREDICATE = "status IN ('pending', 'confirmed')"
+PENDING_BOOKING_PREDICATE = "status = 'pending'"
+PARTITION_MONTHS_AHEAD = 12
+COLUMNS = (
+    "id, user_id, venue_id, start_datetime, end_datetime, total_cost, status, purpose, notes,"
+    " created_at, updated_at, version"
+)
+
+
+def _booking_columns(id_column: sa.Column) -> list:
+    return [
+        id_column,
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("venue_id", sa.Integer(), sa.ForeignKey("venues.id"), nullable=False),
+        sa.Column("start_datetime", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("end_datetime", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("total_cost", sa.DECIMAL(10, 2), nullable=False),
+        sa.Column("status", sa.String()),
+        sa.Column("purpose", sa.String()),
+        sa.Column("notes", sa.Text()),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True)),
+        sa.Column("version", sa.Integer(), nullable=False, server_default="1"),
+    ]
+
+
+def _create_booking_indexes() -> None:
+    op.create_index("ix_bookings_id", "bookings", ["id"])
+    op.create_index("ix_bookings_start_datetime", "bookings", ["start_datetime"])
+    op.create_index("ix_bookings_end_datetime", "bookings", ["end_datetime"])
+    op.create_index("ix_bookings_user_id", "bookings", ["user_id"])
+    op.create_index("ix_bookings_venue_id_start_datetime", "bookings", ["venue_id", "start_datetime"])
+    op.create_index(
+        "ix_bookings_active_venue_period",
+        "bookings",
+        ["venue_id", "start_datetime", "end_datetime"],
+        postgresql_where=sa.text(ACTIVE_BOOKING_PREDICATE),
+    )
+    op.create_index(
+        "ix_bookings_pending_created_at",
+        "bookings",
+        ["created_at"],
+        postgresql_where=sa.text(PENDING_BOOKING_PREDICATE),
+    )
+    op.create_index(
+        "ix_bookings_venue_period_gist",
+        "bookings",
+        ["venue_id", sa.text("tstzrange(start_datetime, end_datetime)")],
+        postgresql_using="gist",
+    )
+
+
+def _drop_booking_indexes(table: str) -> None:
+    for name in (
+        "ix_bookings_venue_period_gist", "ix_bookings_pending_created_at", "ix_bookings_active_venue_period",
+        "ix_bookings_venue_id_start_datetime", "ix_bookings_user_id", "ix_bookings_end_datetime",
+        "ix_bookings_start_datetime", "ix_bookings_id",
+    ):
+        op.drop_index(name, table_name=table)
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _partition_months(source: str) -> list:
+    today = datetime.now(timezone.utc).date()
+    first = last = date(today.year, today.month, 1)
+    if not context.is_offline_mode():
+        earliest = op.get_bind().execute(sa.text(
+            f"SELECT min(start_datetime AT TIME ZONE 'UTC'), max(start_datetime AT TIME ZONE 'UTC') FROM {source}"
+        )).one()
+        if earliest[0] is not None:
+            first = min(first, date(earliest[0].year, earliest[0].month, 1))
+            last = max(last, date(earliest[1].year, earliest[1].month, 1))
+    last = max(last, _add_months(date(today.year, today.month, 1), PARTITION_MONTHS_AHEAD))
+    months = []
+    while first <= last:
+        months.append(first)
+        first = _add_months(first, 1)
+    return months
+
+
+def _partition_bookings() -> None:
+    op.execute("ALTER TABLE bookings RENAME TO bookings_unpartitioned")
+    _drop_booking_indexes("bookings_unpartitioned")
+    op.execute("ALTER TABLE bookings_unpartitioned DROP CONSTRAINT bookings_pkey")
+    op.execute("ALTER SEQUENCE bookings_id_seq OWNED BY NONE")
+
+    op.create_table(
+        "bookings",
+        *_booking_columns(sa.Column(
+            "id", sa.Integer(), nullable=False, server_default=sa.text("nextval('bookings_id_seq')")
+        )),
+        postgresql_partition_by="RANGE (start_datetime)",
+    )
+    op.execute("ALTER SEQUENCE bookings_id_seq OWNED BY bookings.id")
+    op.create_primary_key("bookings_pkey", "bookings", ["id", "start_datetime"])
+    op.execute("CREATE TABLE bookings_default PARTITION OF bookings DEFAULT")
+    for month in _partition_months("bookings_unpartitioned"):
+        op.execute(
+            f"CREATE TABLE bookings_p{month:%Y_%m} PARTITION OF bookings"
+            f" FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{_add_months(month, 1).isoformat()} 00:00:00+00')"
+        )
+
+    op.execute(f"INSERT INTO bookings ({COLUMNS}) SELECT {COLUMNS} FROM bookings_unpartitioned")
+    op.drop_table("bookings_unpartitioned")
+    _create_booking_indexes()
+
+
+def _unpartition_bookings() -> None:
+    op.execute("ALTER TABLE bookings RENAME TO bookings_partitioned")
+    _drop_booking_indexes("bookings_partitioned")
+    op.execute("ALTER TABLE bookings_partitioned DROP CONSTRAINT bookings_pkey")
+    op.execute("ALTER SEQUENCE bookings_id_seq OWNED BY NONE")
+
+    op.create_table(
+        "bookings",
+        *_booking_columns(sa.Column(
+            "id", sa.Integer(), primary_key=True, server_default=sa.text("nextval('bookings_id_seq')")
+        )),
+    )
+    op.execute("ALTER SEQUENCE bookings_id_seq OWNED BY bookings.id")
+    op.execute(f"INSERT INTO bookings ({COLUMNS}) SELECT {COLUMNS} FROM bookings_partitioned")
+    op.drop_table("bookings_partitioned")
+    _create_booking_indexes()
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        _partition_bookings()
+
+    op.create_table(
+        "bookings_archive",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("venue_id", sa.Integer(), sa.ForeignKey("venues.id"), nullable=False),
+        sa.Column("start_datetime", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("end_datetime", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("total_cost", sa.DECIMAL(10, 2), nullable=False),
+        sa.Column("status", sa.String()),
+        sa.Column("purpose", sa.String()),
+        sa.Column("notes", sa.Text()),
+        sa.Column("created_at", sa.DateTime(timezone=True)),
+        sa.Column("updated_at", sa.DateTime(timezone=True)),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("archived_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index("ix_bookings_archive_user_id", "bookings_archive", ["user_id"])
+    op.create_index("ix_bookings_archive_venue_id_start_datetime", "bookings_archive", ["venue_id", "start_datetime"])
+
+
+def downgrade() -> None:
+    op.execute(f"INSERT INTO bookings ({COLUMNS}) SELECT {COLUMNS} FROM bookings_archive")
+    op.drop_index("ix_bookings_archive_venue_id_start_datetime", table_name="bookings_archive")
+    op.drop_index("ix_bookings_archive_user_id", table_name="bookings_archive")
+    op.drop_table("bookings_archive")
+
+    if op.get_bind().dialect.name == "postgresql":
+        _unpartition_bookings()
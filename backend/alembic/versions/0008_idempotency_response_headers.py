@@ -0,0 +1,28 @@
+"""Headers of stored idempotent responses
+
+Replays of a stored response carry its headers, the ETag among them.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 18:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008"
+down_revision: Union[str, None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("idempotency_keys", sa.Column("response_headers", sa.Text()))
+
+
+def downgrade() -> None:
+    op.drop_column("idempotency_keys", "response_headers")
@@ -0,0 +1,32 @@
+"""Calendar feed salts
+
+Feed URL tokens are signed with a per-user and per-venue salt, so a leaked
+URL can be revoked by rotating it. NULL keeps the URLs issued before this
+revision valid until the first rotation.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 20:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0009"
+down_revision: Union[str, None] = "0008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("users", sa.Column("calendar_feed_salt", sa.String()))
+    op.add_column("venues", sa.Column("calendar_feed_salt", sa.String()))
+
+
+def downgrade() -> None:
+    op.drop_column("venues", "calendar_feed_salt")
+    op.drop_column("users", "calendar_feed_salt")
@@ -1,32 +1,52 @@
 from typing import Any, List, Optional
-from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import get_db, get_read_db
 from app.crud import booking as crud_booking
-from app.schemas.schemas import Booking, BookingCreate, BookingUpdate, BookingList, User
+from app.schemas.schemas import (
+    Booking, BookingCreate, BookingUpdate, BookingList, BookingQuoteRequest, BookingQuoteList,
+    BookingBulkRequest, BookingBulkResult, User
+)
 from app.api.v1.endpoints.auth import get_current_active_user, get_current_admin_user
+from app.api.v1.etags import parse_if_match, precondition_failed, set_etag
+from app.api.v1.fieldsets import parse_fields, pick, with_fields
+from app.api.v1.idempotency import run_idempotent
 
 router = APIRouter()
 
 
 @router.get("/", response_model=BookingList)
 def read_bookings(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     skip: int = 0,
     limit: int = 100,
+    fields: Optional[str] = Query(None, description="Comma-separated booking fields to return"),
     current_user: User = Depends(get_current_active_user),
 ) -> Any:
     """
     Retrieve bookings. Admin sees all, users see only their own.
+    With ``fields``, only those fields are loaded and returned; ``user`` and ``venue`` only when named.
     """
+    booking_fields = parse_fields(fields, Booking)
     if current_user.is_admin:
-        bookings = crud_booking.get_bookings(db, skip=skip, limit=limit)
+        bookings = crud_booking.get_bookings(db, skip=skip, limit=limit, fields=booking_fields)
         total = crud_booking.get_bookings_count(db)
     else:
-        bookings = crud_booking.get_user_bookings(db, user_id=current_user.id, skip=skip, limit=limit)
+        bookings = crud_booking.get_user_bookings(
+            db, user_id=current_user.id, skip=skip, limit=limit, fields=booking_fields
+        )
         total = crud_booking.get_bookings_count(db, user_id=current_user.id)
     
+    if booking_fields is not None:
+        return JSONResponse({
+            "bookings": [pick(booking, Booking, booking_fields) for booking in bookings],
+            "total": total,
+            "page": skip // limit + 1,
+            "size": limit,
+        })
     return BookingList(
         bookings=bookings,
         total=total,
@@ -35,17 +55,118 @@ def read_bookings(
     )
 
 
+@router.post("/quote", response_model=BookingQuoteList)
+def quote_bookings(
+    *,
+    db: Session = Depends(get_read_db),
+    quote_in: BookingQuoteRequest,
+) -> Any:
+    """
+    Price a list of venue and time slot combinations without booking them.
+    """
+    if len(quote_in.items) > settings.BOOKING_QUOTE_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.BOOKING_QUOTE_MAX_ITEMS} items can be quoted at once"
+        )
+    # Naive and aware times cannot be compared or subtracted; naive ones are UTC
+    items = [
+        item.copy(update={"start_datetime": _as_utc(item.start_datetime), "end_datetime": _as_utc(item.end_datetime)})
+        for item in quote_in.items
+    ]
+    if any(item.end_datetime <= item.start_datetime for item in items):
+        raise HTTPException(status_code=400, detail="end_datetime must be after start_datetime")
+    
+    try:
+        quotes = crud_booking.quote_bookings(db, items=items)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    return BookingQuoteList(
+        quotes=quotes,
+        total_cost=sum(quote["total_cost"] for quote in quotes)
+    )
+
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _bulk_transition(db: Session, bulk_in: BookingBulkRequest, from_statuses: List[str], to_status: str) -> Any:
+    selects_by_filter = bulk_in.venue_id is not None or bulk_in.start_from or bulk_in.start_before
+    if bulk_in.ids is None and not selects_by_filter:
+        raise HTTPException(status_code=400, detail="Select bookings by ids, venue_id or start time window")
+    if bulk_in.ids is not None and len(bulk_in.ids) > settings.BOOKING_BULK_MAX_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.BOOKING_BULK_MAX_IDS} bookings can be changed at once"
+        )
+    
+    changed_ids = crud_booking.bulk_transition_bookings(
+        db,
+        from_statuses=from_statuses,
+        to_status=to_status,
+        ids=bulk_in.ids,
+        venue_id=bulk_in.venue_id,
+        start_from=bulk_in.start_from,
+        start_before=bulk_in.start_before
+    )
+    changed = set(changed_ids)
+    return BookingBulkResult(
+        changed_ids=changed_ids,
+        unchanged_ids=sorted(set(bulk_in.ids or []) - changed),
+        count=len(changed_ids)
+    )
+
+
+@router.post("/bulk/confirm", response_model=BookingBulkResult)
+def bulk_confirm_bookings(
+    *,
+    db: Session = Depends(get_db),
+    bulk_in: BookingBulkRequest,
+    current_user: User = Depends(get_current_admin_user),
+) -> Any:
+    """
+    Confirm all selected pending bookings with one statement. Admin only.
+    """
+    return _bulk_transition(db, bulk_in, ["pending"], "confirmed")
+
+
+@router.post("/bulk/cancel", response_model=BookingBulkResult)
+def bulk_cancel_bookings(
+    *,
+    db: Session = Depends(get_db),
+    bulk_in: BookingBulkRequest,
+    current_user: User = Depends(get_current_admin_user),
+) -> Any:
+    """
+    Cancel all selected pending or confirmed bookings with one statement. Admin only.
+    """
+    return _bulk_transition(db, bulk_in, ["pending", "confirmed"], "cancelled")
+
+
 @router.get("/{booking_id}", response_model=Booking)
 def read_booking(
     *,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
+    response: Response,
     booking_id: int,
+    fields: Optional[str] = Query(None, description="Comma-separated booking fields to return"),
     current_user: User = Depends(get_current_active_user),
 ) -> Any:
     """
     Get booking by ID. Users can only access their own bookings unless they're admin.
+    Archived bookings are still found here, read-only. With ``fields``, only those
+    fields are loaded and returned.
     """
-    booking = crud_booking.get_booking(db, booking_id=booking_id)
+    booking_fields = parse_fields(fields, Booking)
+    load = None if booking_fields is None else with_fields(booking_fields, "user_id", "version")
+    booking = (
+        crud_booking.get_booking(db, booking_id=booking_id, fields=load)
+        or crud_booking.get_archived_booking(db, booking_id)
+    )
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
     
@@ -53,56 +174,76 @@ def read_booking(
     if booking.user_id != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not enough permissions")
     
+    if booking_fields is not None:
+        response = JSONResponse(pick(booking, Booking, booking_fields))
+        set_etag(response, booking)
+        return response
+    set_etag(response, booking)
     return booking
 
 
 @router.post("/", response_model=Booking)
-def create_booking(
+async def create_booking(
     *,
     db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
     booking_in: BookingCreate,
     current_user: User = Depends(get_current_active_user),
+    idempotency_key: Optional[str] = Header(None),
 ) -> Any:
     """
-    Create new booking.
+    Create new booking. Retries with the same Idempotency-Key replay the first response.
     """
-    booking = crud_booking.create_booking(db, booking=booking_in, user_id=current_user.id)
-    if not booking:
-        raise HTTPException(
-            status_code=400, 
-            detail="Venue is not available for the selected time slot"
-        )
-    return booking
+    def create() -> Any:
+        booking = crud_booking.create_booking(db, booking=booking_in, user_id=current_user.id)
+        if not booking:
+            raise HTTPException(
+                status_code=400, 
+                detail="Venue is not available for the selected time slot"
+            )
+        set_etag(response, booking)
+        return booking
+
+    return await run_idempotent(db, request, response, current_user.id, idempotency_key, booking_in, create, Booking)
 
 
 @router.put("/{booking_id}", response_model=Booking)
-def update_booking(
+async def update_booking(
     *,
     db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
     booking_id: int,
     booking_in: BookingUpdate,
     current_user: User = Depends(get_current_active_user),
+    idempotency_key: Optional[str] = Header(None),
+    if_match: Optional[str] = Header(None),
 ) -> Any:
     """
     Update booking. Users can only update their own bookings.
+    With If-Match, only applies to that version of the booking.
     """
-    booking = crud_booking.get_booking(db, booking_id=booking_id)
-    if not booking:
-        raise HTTPException(status_code=404, detail="Booking not found")
-    
-    # Users can only update their own bookings unless they're admin
-    if booking.user_id != current_user.id and not current_user.is_admin:
-        raise HTTPException(status_code=403, detail="Not enough permissions")
-    
-    booking = crud_booking.update_booking(
-        db, booking_id=booking_id, booking_update=booking_in, user_id=current_user.id
-    )
-    if not booking:
-        raise HTTPException(
-            status_code=400, 
-            detail="Venue is not available for the selected time slot"
+    version = parse_if_match(if_match)
+
+    def update() -> Any:
+        booking = crud_booking.update_booking(
+            db,
+            booking_id=booking_id,
+            booking_update=booking_in,
+            user_id=None if current_user.is_admin else current_user.id,
+            version=version
         )
-    return booking
+        if not booking:
+            _check_booking_access(db, booking_id, current_user, version)
+            raise HTTPException(
+                status_code=400, 
+                detail="Venue is not available for the selected time slot"
+            )
+        set_etag(response, booking)
+        return booking
+
+    return await run_idempotent(db, request, response, current_user.id, idempotency_key, booking_in, update, Booking)
 
 
 @router.delete("/{booking_id}", response_model=Booking)
@@ -115,15 +256,12 @@ def cancel_booking(
     """
     Cancel booking. Users can only cancel their own bookings.
     """
-    booking = crud_booking.get_booking(db, booking_id=booking_id)
+    booking = crud_booking.cancel_booking(
+        db, booking_id=booking_id, user_id=None if current_user.is_admin else current_user.id
+    )
     if not booking:
-        raise HTTPException(status_code=404, detail="Booking not found")
-    
-    # Users can only cancel their own bookings unless they're admin
-    if booking.user_id != current_user.id and not current_user.is_admin:
-        raise HTTPException(status_code=403, detail="Not enough permissions")
-    
-    booking = crud_booking.cancel_booking(db, booking_id=booking_id, user_id=current_user.id)
+        # Nothing to cancel: report why, or return the booking as it is
+        booking = _check_booking_access(db, booking_id, current_user)
     return booking
 
 
@@ -137,21 +275,37 @@ def confirm_booking(
     """
     Confirm booking. Admin only.
     """
+    booking = crud_booking.confirm_booking(db, booking_id=booking_id)
+    if not booking:
+        _check_booking_access(db, booking_id, current_user)
+        raise HTTPException(status_code=400, detail="Cannot confirm this booking")
+    
+    return booking
+
+
+def _check_booking_access(db: Session, booking_id: int, current_user: User, version: Optional[int] = None):
+    """Explain a write that matched no row with 404, 403 or 412, otherwise return the booking.
+
+    Write paths fold these checks into their UPDATE, so this extra read only
+    happens when the write did not go through.
+    """
     booking = crud_booking.get_booking(db, booking_id=booking_id)
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
     
-    booking = crud_booking.confirm_booking(db, booking_id=booking_id)
-    if not booking:
-        raise HTTPException(status_code=400, detail="Cannot confirm this booking")
+    # Users can only change their own bookings unless they're admin
+    if booking.user_id != current_user.id and not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
     
+    if version is not None and booking.version != version:
+        raise precondition_failed("Booking", booking.version, version)
     return booking
 
 
 @router.get("/venue/{venue_id}", response_model=List[Booking])
 def read_venue_bookings(
     *,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     venue_id: int,
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None),
@@ -160,7 +314,8 @@ def read_venue_bookings(
     current_user: User = Depends(get_current_admin_user),
 ) -> Any:
     """
-    Get all bookings for a specific venue. Admin only.
+    Get all bookings for a specific venue, optionally only those overlapping
+    ``start_date`` to ``end_date``. Admin only.
     """
     start_datetime = None
     end_datetime = None
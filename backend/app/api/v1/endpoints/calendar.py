@@ -0,0 +1,113 @@
+from typing import Any, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.core import calendar_feeds
+from app.core.database import get_db
+from app.core.metrics import registry
+from app.core.security import calendar_feed_token, verify_calendar_feed_token
+from app.crud import calendar as crud_calendar
+from app.crud import venue as crud_venue
+from app.schemas.schemas import User
+from app.api.v1.endpoints.auth import get_current_active_user
+
+router = APIRouter()
+
+registry.describe("calendar_feed_requests_total", "Calendar feed polls by how they were served.")
+
+
+def _feed_url(request: Request, route: str, kind: str, owner: Any) -> str:
+    url = request.url_for(route, **{f"{kind}_id": owner.id})
+    return str(url.include_query_params(token=calendar_feed_token(kind, owner.id, owner.calendar_feed_salt or "")))
+
+
+@router.get("/links")
+def read_calendar_links(
+    *,
+    db: Session = Depends(get_db),
+    request: Request,
+    venue_id: Optional[int] = None,
+    current_user: User = Depends(get_current_active_user),
+) -> Any:
+    """
+    Subscription URLs for calendar clients: the current user's bookings, and
+    the schedule of ``venue_id`` when given. Anyone with a URL can read the feed.
+    """
+    links = {"bookings": _feed_url(request, "read_user_feed", "user", current_user)}
+    if venue_id is not None:
+        venue = crud_venue.get_venue(db, venue_id=venue_id)
+        if not venue:
+            raise HTTPException(status_code=404, detail="Venue not found")
+        links["venue"] = _feed_url(request, "read_venue_feed", "venue", venue)
+    return links
+
+
+@router.post("/links/rotate")
+def rotate_calendar_link(
+    *,
+    db: Session = Depends(get_db),
+    request: Request,
+    venue_id: Optional[int] = None,
+    current_user: User = Depends(get_current_active_user),
+) -> Any:
+    """
+    Revoke a subscription URL and return its replacement: the current user's
+    bookings feed, or the feed of ``venue_id`` (admin only).
+    """
+    if venue_id is None:
+        crud_calendar.rotate_feed_salt(db, "user", current_user)
+        return {"bookings": _feed_url(request, "read_user_feed", "user", current_user)}
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    venue = crud_venue.get_venue(db, venue_id=venue_id)
+    if not venue:
+        raise HTTPException(status_code=404, detail="Venue not found")
+    crud_calendar.rotate_feed_salt(db, "venue", venue)
+    return {"venue": _feed_url(request, "read_venue_feed", "venue", venue)}
+
+
+def _load_feed(key: calendar_feeds.FeedKey, token: str):
+    salt = calendar_feeds.load_salt(key)
+    if salt is None or not verify_calendar_feed_token(key.kind, key.id, salt, token):
+        return None, False
+    return calendar_feeds.load_feed(key)
+
+
+async def _serve_feed(key: calendar_feeds.FeedKey, token: str, if_none_match: Optional[str]) -> Response:
+    feed, rendered = await run_in_threadpool(_load_feed, key, token)
+    if feed is None:
+        raise HTTPException(status_code=404, detail="Calendar feed not found")
+
+    headers = {"ETag": feed.etag, "Cache-Control": "private, no-cache"}
+    if calendar_feeds.etag_matches(if_none_match, feed.etag):
+        result = "not_modified"
+        response = Response(status_code=304, headers=headers)
+    else:
+        result = "rendered" if rendered else "cached"
+        response = Response(content=feed.body, media_type="text/calendar; charset=utf-8", headers=headers)
+    registry.inc("calendar_feed_requests_total", (("kind", key.kind), ("result", result)))
+    return response
+
+
+@router.get("/venues/{venue_id}.ics")
+async def read_venue_feed(
+    venue_id: int,
+    token: str,
+    if_none_match: Optional[str] = Header(None),
+) -> Any:
+    """
+    iCalendar feed of a venue's booked slots, without booking details.
+    """
+    return await _serve_feed(calendar_feeds.FeedKey("venue", venue_id), token, if_none_match)
+
+
+@router.get("/users/{user_id}.ics")
+async def read_user_feed(
+    user_id: int,
+    token: str,
+    if_none_match: Optional[str] = Header(None),
+) -> Any:
+    """
+    iCalendar feed of a user's pending and confirmed bookings.
+    """
+    return await _serve_feed(calendar_feeds.FeedKey("user", user_id), token, if_none_match)
@@ -0,0 +1,68 @@
+from typing import Any, List, Optional
+from datetime import date, datetime
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from app.core.database import get_db, get_read_db
+from app.crud import analytics as crud_analytics
+from app.crud import report as crud_report
+from app.schemas.schemas import OccupancyHeatmap, RevenueReport, User
+from app.api.v1.endpoints.auth import get_current_admin_user
+
+router = APIRouter()
+
+
+@router.get("/revenue", response_model=RevenueReport)
+def read_revenue_report(
+    db: Session = Depends(get_read_db),
+    granularity: str = "day",
+    venue_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    current_user: User = Depends(get_current_admin_user),
+) -> Any:
+    """
+    Revenue and booked hours per venue per day, week or month. Admin only.
+    """
+    if granularity not in crud_report.GRANULARITIES:
+        raise HTTPException(status_code=400, detail="Invalid granularity")
+
+    rows = crud_report.get_revenue_report(
+        db,
+        granularity=granularity,
+        start_date=start_date,
+        end_date=end_date,
+        venue_id=venue_id
+    )
+    return RevenueReport(granularity=granularity, rows=rows)
+
+
+@router.get("/occupancy-heatmap", response_model=OccupancyHeatmap)
+def read_occupancy_heatmap(
+    db: Session = Depends(get_read_db),
+    start_datetime: datetime = Query(...),
+    end_datetime: datetime = Query(...),
+    venue_id: Optional[List[int]] = Query(None),
+    current_user: User = Depends(get_current_admin_user),
+) -> Any:
+    """
+    Hour-of-week x venue occupancy for the given period (UTC hours). Admin only.
+    """
+    if end_datetime <= start_datetime:
+        raise HTTPException(status_code=400, detail="end_datetime must be after start_datetime")
+
+    return crud_analytics.get_occupancy_heatmap(
+        db, start_datetime, end_datetime, venue_ids=venue_id
+    )
+
+
+@router.post("/rollups/rebuild")
+def rebuild_rollups(
+    db: Session = Depends(get_db),
+    venue_id: Optional[int] = None,
+    current_user: User = Depends(get_current_admin_user),
+) -> Any:
+    """
+    Recompute the booking rollups from scratch. Admin only.
+    """
+    rows = crud_report.rebuild_rollups(db, venue_id=venue_id)
+    return {"venue_id": venue_id, "rows": rows}
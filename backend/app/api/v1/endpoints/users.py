@@ -1,10 +1,11 @@
-from typing import Any, List
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Any, List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
 from sqlalchemy.orm import Session
 from app.core.database import get_db
 from app.crud import user as crud_user
 from app.schemas.schemas import User, UserUpdate
 from app.api.v1.endpoints.auth import get_current_active_user, get_current_admin_user
+from app.api.v1.etags import parse_if_match, precondition_failed, set_etag
 
 router = APIRouter()
 
@@ -27,6 +28,7 @@ def read_users(
 def read_user(
     *,
     db: Session = Depends(get_db),
+    response: Response,
     user_id: int,
     current_user: User = Depends(get_current_active_user),
 ) -> Any:
@@ -41,6 +43,7 @@ def read_user(
     if user_id != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not enough permissions")
     
+    set_etag(response, user)
     return user
 
 
@@ -48,22 +51,28 @@ def read_user(
 def update_user(
     *,
     db: Session = Depends(get_db),
+    response: Response,
     user_id: int,
     user_in: UserUpdate,
     current_user: User = Depends(get_current_active_user),
+    if_match: Optional[str] = Header(None),
 ) -> Any:
     """
     Update user. Users can only update their own data unless they're admin.
+    With If-Match, only applies to that version of the user.
     """
-    user = crud_user.get_user(db, user_id=user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
     # Users can only update their own data unless they're admin
     if user_id != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not enough permissions")
     
-    user = crud_user.update_user(db, user_id=user_id, user_update=user_in)
+    version = parse_if_match(if_match)
+    user = crud_user.update_user(db, user_id=user_id, user_update=user_in, version=version)
+    if not user:
+        user = crud_user.get_user(db, user_id=user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        raise precondition_failed("User", user.version, version)
+    set_etag(response, user)
     return user
 
 
@@ -77,9 +86,8 @@ def delete_user(
     """
     Deactivate user. Admin only.
     """
-    user = crud_user.get_user(db, user_id=user_id)
+    user = crud_user.deactivate_user(db, user_id=user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    user = crud_user.deactivate_user(db, user_id=user_id)
     return user
@@ -1,17 +1,23 @@
-from typing import Any, List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Any, List, Optional, Tuple
+from datetime import datetime
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from starlette.concurrency import run_in_threadpool
+from app.core import availability, typeahead, venue_cache
+from app.core.database import SessionLocal, get_db, get_read_db
 from app.crud import venue as crud_venue
-from app.schemas.schemas import Venue, VenueCreate, VenueUpdate, VenueList, VenueSearch, User
+from app.schemas.schemas import Venue, VenueCreate, VenueUpdate, VenueList, VenueSearch, VenueSuggestionList, User
 from app.api.v1.endpoints.auth import get_current_active_user, get_current_admin_user
+from app.api.v1.etags import parse_if_match, precondition_failed, set_etag
+from app.api.v1.fieldsets import parse_fields, pick, with_fields
 
 router = APIRouter()
 
 
 @router.get("/", response_model=VenueList)
 def read_venues(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     skip: int = 0,
     limit: int = 100,
     city: Optional[str] = Query(None),
@@ -19,10 +25,15 @@ def read_venues(
     max_capacity: Optional[int] = Query(None),
     min_rate: Optional[float] = Query(None),
     max_rate: Optional[float] = Query(None),
+    include_facets: bool = False,
+    fields: Optional[str] = Query(None, description="Comma-separated venue fields to return"),
 ) -> Any:
     """
-    Retrieve venues with optional filtering.
+    Retrieve venues with optional filtering. Responses are cached until a venue changes.
+    With ``include_facets``, also counts venues by city, capacity and hourly rate range.
+    With ``fields``, only those venue fields are loaded and returned.
     """
+    venue_fields = parse_fields(fields, Venue)
     search_params = VenueSearch(
         city=city,
         min_capacity=min_capacity,
@@ -30,30 +41,73 @@ def read_venues(
         min_rate=min_rate,
         max_rate=max_rate
     )
+    key = venue_cache.search_key(search_params, skip, limit, facets=include_facets, fields=venue_fields)
+    body = venue_cache.venue_search_cache.get(key)
+    if body is None:
+        generation = venue_cache.venue_search_cache.generation
+        venues = crud_venue.get_venues(db, skip=skip, limit=limit, search=search_params, fields=venue_fields)
+        facets = None
+        if include_facets:
+            facets = crud_venue.get_venue_facets(db, search=search_params)
+            total = facets.pop("total")
+        else:
+            total = crud_venue.get_venues_count(db, search=search_params)
+        if venue_fields is None:
+            body = VenueList(
+                venues=venues,
+                total=total,
+                page=skip // limit + 1,
+                size=limit,
+                facets=facets
+            ).json().encode()
+        else:
+            body = JSONResponse({
+                "venues": [pick(venue, Venue, venue_fields) for venue in venues],
+                "total": total,
+                "page": skip // limit + 1,
+                "size": limit,
+                "facets": facets,
+            }).body
+        venue_cache.venue_search_cache.put(key, body, generation)
     
-    venues = crud_venue.get_venues(db, skip=skip, limit=limit, search=search_params)
-    total = crud_venue.get_venues_count(db, search=search_params)
-    
-    return VenueList(
-        venues=venues,
-        total=total,
-        page=skip // limit + 1,
-        size=limit
-    )
+    return Response(content=body, media_type="application/json")
+
+
+@router.get("/autocomplete", response_model=VenueSuggestionList)
+async def autocomplete_venues(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+) -> Any:
+    """
+    Typeahead suggestions: cities and venues with a word starting with ``q``,
+    ignoring case and accents. Served from memory.
+    """
+    if not typeahead.index.loaded:
+        await run_in_threadpool(typeahead.ensure_loaded)
+    return {"suggestions": typeahead.index.suggest(q, limit)}
 
 
 @router.get("/{venue_id}", response_model=Venue)
 def read_venue(
     *,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
+    response: Response,
     venue_id: int,
+    fields: Optional[str] = Query(None, description="Comma-separated venue fields to return"),
 ) -> Any:
     """
-    Get venue by ID.
+    Get venue by ID. With ``fields``, only those fields are loaded and returned.
     """
-    venue = crud_venue.get_venue(db, venue_id=venue_id)
+    venue_fields = parse_fields(fields, Venue)
+    load = None if venue_fields is None else with_fields(venue_fields, "version")
+    venue = crud_venue.get_venue(db, venue_id=venue_id, fields=load)
     if not venue:
         raise HTTPException(status_code=404, detail="Venue not found")
+    if venue_fields is not None:
+        response = JSONResponse(pick(venue, Venue, venue_fields))
+        set_etag(response, venue)
+        return response
+    set_etag(response, venue)
     return venue
 
 
@@ -75,18 +129,23 @@ def create_venue(
 def update_venue(
     *,
     db: Session = Depends(get_db),
+    response: Response,
     venue_id: int,
     venue_in: VenueUpdate,
     current_user: User = Depends(get_current_admin_user),
+    if_match: Optional[str] = Header(None),
 ) -> Any:
     """
-    Update venue. Admin only.
+    Update venue. Admin only. With If-Match, only applies to that version of the venue.
     """
-    venue = crud_venue.get_venue(db, venue_id=venue_id)
+    version = parse_if_match(if_match)
+    venue = crud_venue.update_venue(db, venue_id=venue_id, venue_update=venue_in, version=version)
     if not venue:
-        raise HTTPException(status_code=404, detail="Venue not found")
-    
-    venue = crud_venue.update_venue(db, venue_id=venue_id, venue_update=venue_in)
+        venue = crud_venue.get_venue(db, venue_id=venue_id)
+        if not venue:
+            raise HTTPException(status_code=404, detail="Venue not found")
+        raise precondition_failed("Venue", venue.version, version)
+    set_etag(response, venue)
     return venue
 
 
@@ -100,18 +159,17 @@ def delete_venue(
     """
     Delete venue (mark as inactive). Admin only.
     """
-    venue = crud_venue.get_venue(db, venue_id=venue_id)
+    venue = crud_venue.delete_venue(db, venue_id=venue_id)
     if not venue:
         raise HTTPException(status_code=404, detail="Venue not found")
     
-    venue = crud_venue.delete_venue(db, venue_id=venue_id)
     return venue
 
 
 @router.get("/city/{city}", response_model=List[Venue])
 def read_venues_by_city(
     *,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     city: str,
 ) -> Any:
     """
@@ -121,10 +179,19 @@ def read_venues_by_city(
     return venues
 
 
+def _parse_time_range(start_datetime: str, end_datetime: str) -> Tuple[datetime, datetime]:
+    try:
+        start_dt = datetime.fromisoformat(start_datetime.replace('Z', '+00:00'))
+        end_dt = datetime.fromisoformat(end_datetime.replace('Z', '+00:00'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid datetime format")
+    return start_dt, end_dt
+
+
 @router.get("/{venue_id}/availability")
 def check_venue_availability(
     *,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     venue_id: int,
     start_datetime: str,
     end_datetime: str,
@@ -132,13 +199,7 @@ def check_venue_availability(
     """
     Check if venue is available for the given time slot.
     """
-    from datetime import datetime
-    
-    try:
-        start_dt = datetime.fromisoformat(start_datetime.replace('Z', '+00:00'))
-        end_dt = datetime.fromisoformat(end_datetime.replace('Z', '+00:00'))
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid datetime format")
+    start_dt, end_dt = _parse_time_range(start_datetime, end_datetime)
     
     venue = crud_venue.get_venue(db, venue_id=venue_id)
     if not venue:
@@ -147,3 +208,45 @@ def check_venue_availability(
     is_available = crud_venue.check_venue_availability(db, venue_id, start_dt, end_dt)
     
     return {"venue_id": venue_id, "available": is_available}
+
+
+@router.get("/{venue_id}/availability/stream")
+async def stream_venue_availability(
+    *,
+    venue_id: int,
+    start_datetime: str,
+    end_datetime: str,
+) -> Any:
+    """
+    Server-Sent Events with the booked slots of a venue in the given range:
+    a ``snapshot`` event first, then a ``change`` event whenever a booking
+    write books or releases a slot in the range. Replaces polling the
+    availability endpoint.
+    """
+    start_dt, end_dt = _parse_time_range(start_datetime, end_datetime)
+    if end_dt <= start_dt:
+        raise HTTPException(status_code=400, detail="End must be after start")
+
+    def load_booked_slots():
+        # A short-lived session per snapshot: a stream must not hold a connection while it waits
+        db = SessionLocal()
+        try:
+            return crud_venue.get_booked_slots(db, venue_id, start_dt, end_dt)
+        finally:
+            db.close()
+
+    def venue_exists() -> bool:
+        db = SessionLocal()
+        try:
+            return crud_venue.get_venue(db, venue_id=venue_id) is not None
+        finally:
+            db.close()
+
+    if not await run_in_threadpool(venue_exists):
+        raise HTTPException(status_code=404, detail="Venue not found")
+
+    return StreamingResponse(
+        availability.availability_events(venue_id, start_dt, end_dt, load_booked_slots),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,43 @@
+"""
+ETag and If-Match handling for optimistic concurrency.
+
+The ETag of a user, venue or booking is its version. Writes sent with
+``If-Match`` only apply while the row still has that version; otherwise they
+fail with 412 and the client should reload the resource and retry. A write
+that loses against a concurrent one without If-Match fails with 409.
+"""
+from typing import Optional
+from fastapi import HTTPException, Response
+
+# Body of the 409 for a write that lost against a concurrent one at flush
+CONFLICT_DETAIL = "The resource was modified by another request; reload it and retry"
+
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def set_etag(response: Response, obj) -> None:
+    response.headers["ETag"] = etag(obj.version)
+
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """The version an If-Match header asks for, or None when any version will do"""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    tag = if_match.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    if not tag.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid If-Match header")
+    return int(tag)
+
+
+def precondition_failed(kind: str, current: int, wanted: int) -> HTTPException:
+    """The error for a write whose If-Match names a version the row no longer has"""
+    return HTTPException(
+        status_code=412,
+        detail=f"{kind} is at version {current}, not {wanted}; reload it and retry",
+        headers={"ETag": etag(current)},
+    )
@@ -0,0 +1,41 @@
+"""
+Sparse fieldsets: ``?fields=id,name,city`` on list and detail endpoints.
+
+Only the named fields of the resource are loaded and returned. Related objects
+(``user`` and ``venue`` of a booking) count as fields: they are loaded when
+named and left out otherwise. Without ``fields`` the full resource is returned.
+"""
+from typing import Iterable, List, Optional, Type
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+
+def parse_fields(fields: Optional[str], schema: Type[BaseModel]) -> Optional[List[str]]:
+    """The fields of ``schema`` a ``fields`` parameter names, in schema order, or None for all"""
+    if fields is None:
+        return None
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    if not names:
+        raise HTTPException(status_code=400, detail="fields must name at least one field")
+    unknown = names - set(schema.__fields__)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return [name for name in schema.__fields__ if name in names]
+
+
+def with_fields(fields: List[str], *required: str) -> List[str]:
+    """``fields`` plus those the endpoint itself reads, e.g. the version for the ETag"""
+    return list(dict.fromkeys([*fields, *required]))
+
+
+def pick(obj, schema: Type[BaseModel], fields: Iterable[str]) -> dict:
+    """``obj`` serialized as ``schema``, but with only ``fields``"""
+    data = {}
+    for name in fields:
+        value = getattr(obj, name)
+        field_type = schema.__fields__[name].type_
+        if value is not None and isinstance(field_type, type) and issubclass(field_type, BaseModel):
+            value = field_type.from_orm(value)
+        data[name] = value
+    return jsonable_encoder(data)
@@ -0,0 +1,188 @@
+"""
+Idempotency-Key handling for booking writes.
+
+The first request with a key claims it and runs. Its response, status, body
+and headers (success or client error), is stored in the same transaction as
+its write, so a write is never committed without the response to replay. It
+is replayed for every later request with the same key and body. A duplicate
+that arrives while the first one is still running waits for it instead of
+racing it through the availability check. The wait holds no thread or
+connection: it sleeps on the event loop until the key's notification (see
+app.core.notifications) or the next poll.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+from fastapi import HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+from app.api.v1.etags import CONFLICT_DETAIL
+from app.core import notifications
+from app.core.config import settings
+from app.core.database import held_commits
+from app.crud import idempotency as crud_idempotency
+
+MAX_KEY_LENGTH = 255
+# Waiters are woken by the key's notification; polling only covers a missed one
+POLL_INTERVAL_SECONDS = 1.0
+
+# (user_id, key) -> events of the requests waiting for that key, with their loops
+_waiters: Dict[Tuple[int, str], List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+_waiters_lock = threading.Lock()
+
+
+def request_fingerprint(method: str, path: str, body: BaseModel) -> str:
+    payload = json.dumps(jsonable_encoder(body), sort_keys=True)
+    return hashlib.sha256(f"{method} {path} {payload}".encode()).hexdigest()
+
+
+def _wake(waiting: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]) -> None:
+    for loop, finished in waiting:
+        try:
+            loop.call_soon_threadsafe(finished.set)
+        except RuntimeError:
+            pass  # the loop is closed; its requests are gone too
+
+
+def _key_finished(payload: str) -> None:
+    user_id, _, key = payload.partition(":")
+    with _waiters_lock:
+        waiting = list(_waiters.get((int(user_id), key), ()))
+    _wake(waiting)
+
+
+def _wake_all() -> None:
+    with _waiters_lock:
+        waiting = [waiter for group in _waiters.values() for waiter in group]
+    _wake(waiting)
+
+
+notifications.register(crud_idempotency.NOTIFY_CHANNEL, _key_finished, resync=_wake_all)
+
+
+def _headers(response: Response) -> Dict[str, str]:
+    return {name: value for name, value in response.headers.items() if name != "content-length"}
+
+
+def _replay(record) -> JSONResponse:
+    return JSONResponse(
+        status_code=record.response_status,
+        content=json.loads(record.response_body),
+        headers={**json.loads(record.response_headers or "{}"), "Idempotent-Replayed": "true"}
+    )
+
+
+def _execute(
+    db: Session, record, handler: Callable[[], Any], response_model: Type[BaseModel], response: Response
+) -> Any:
+    try:
+        with held_commits(db):
+            result = handler()
+            body = jsonable_encoder(response_model.from_orm(result))
+        headers = _headers(response)
+        # Commits the handler's write too: both are stored, or neither
+        crud_idempotency.complete_idempotency_key(db, record, 200, json.dumps(body), headers)
+    except HTTPException as e:
+        db.rollback()
+        if e.status_code < 500:
+            crud_idempotency.complete_idempotency_key(
+                db, record, e.status_code, json.dumps({"detail": e.detail}), dict(e.headers or {})
+            )
+        else:
+            crud_idempotency.release_idempotency_key(db, record)
+        raise
+    except StaleDataError:
+        # Answered with 409 by the app's handler; a retry would lose the same way
+        db.rollback()
+        crud_idempotency.complete_idempotency_key(db, record, 409, json.dumps({"detail": CONFLICT_DETAIL}), {})
+        raise
+    except Exception:
+        db.rollback()
+        crud_idempotency.release_idempotency_key(db, record)
+        raise
+
+    return JSONResponse(content=body, headers=headers)
+
+
+def _claim(db: Session, user_id: int, key: str, fingerprint: str):
+    record, claimed = crud_idempotency.claim_idempotency_key(db, user_id, key, fingerprint)
+    if not claimed:
+        record = _end_read(db, record)
+    return record, claimed
+
+
+def _reread(db: Session, user_id: int, key: str):
+    return _end_read(db, crud_idempotency.get_idempotency_key(db, user_id, key))
+
+
+def _end_read(db: Session, record):
+    """Give the connection back while waiting; ``record`` stays readable, detached"""
+    if record is not None:
+        db.expunge(record)
+    db.rollback()
+    return record
+
+
+async def run_idempotent(
+    db: Session,
+    request: Request,
+    response: Response,
+    user_id: int,
+    key: Optional[str],
+    body: BaseModel,
+    handler: Callable[[], Any],
+    response_model: Type[BaseModel]
+) -> Any:
+    """Run ``handler`` once per Idempotency-Key and replay its response for duplicates.
+
+    ``handler`` runs in the threadpool; the headers it sets on ``response`` are
+    stored and replayed with the body.
+    """
+    if key is None:
+        return await run_in_threadpool(handler)
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+
+    fingerprint = request_fingerprint(request.method, request.url.path, body)
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    waiter = (asyncio.get_running_loop(), asyncio.Event())
+    with _waiters_lock:
+        _waiters.setdefault((user_id, key), []).append(waiter)
+    try:
+        while True:
+            record, claimed = await run_in_threadpool(_claim, db, user_id, key, fingerprint)
+            if claimed:
+                return await run_in_threadpool(_execute, db, record, handler, response_model, response)
+
+            if record is not None and record.request_fingerprint != fingerprint:
+                raise HTTPException(
+                    status_code=422, detail="Idempotency-Key was already used for a different request"
+                )
+            while record is not None and record.status != crud_idempotency.COMPLETED:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise HTTPException(
+                        status_code=409, detail="A request with this Idempotency-Key is still in progress"
+                    )
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), min(remaining, POLL_INTERVAL_SECONDS))
+                except asyncio.TimeoutError:
+                    pass
+                waiter[1].clear()
+                record = await run_in_threadpool(_reread, db, user_id, key)
+            if record is not None:
+                return _replay(record)
+            # The first attempt failed and gave the key up; run the request ourselves
+    finally:
+        with _waiters_lock:
+            waiting = _waiters[(user_id, key)]
+            waiting.remove(waiter)
+            if not waiting:
+                del _waiters[(user_id, key)]
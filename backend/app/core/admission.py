@@ -0,0 +1,240 @@
+"""
+Admission control and load shedding.
+
+Every API request belongs to a route class (booking writes, auth, other writes
+such as venue and user changes, reads) with
+its own in-flight limit, queue length and maximum queueing time, on top of a
+worker-wide in-flight limit sized to the threadpool. Requests that cannot start
+right away wait in a priority queue where booking writes go first and catalog
+reads last. A request that would wait longer than its class allows is turned
+away early with 429/503 and ``Retry-After`` instead of joining the pile-up in
+the threadpool, which keeps latency bounded for the requests that are accepted.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import Labels, MetricsRegistry, registry as metrics_registry
+
+QUEUE_FULL = "queue_full"
+QUEUE_TIMEOUT = "queue_timeout"
+SHED = "shed"
+
+REJECTIONS = {
+    QUEUE_FULL: (429, "Too many concurrent requests, retry later"),
+    QUEUE_TIMEOUT: (503, "Server is overloaded, retry later"),
+    SHED: (503, "Server is overloaded, retry later"),
+}
+
+
+class RouteClass:
+    def __init__(
+        self,
+        name: str,
+        priority: int,
+        max_in_flight: int,
+        max_queue_length: int,
+        max_queue_wait: float,
+        shed_when_outranked: bool = False
+    ):
+        self.name = name
+        self.priority = priority
+        self.max_in_flight = max_in_flight
+        self.max_queue_length = max_queue_length
+        self.max_queue_wait = max_queue_wait
+        # Reject at once, instead of queueing, while a higher priority class is waiting
+        self.shed_when_outranked = shed_when_outranked
+        self.in_flight = 0
+        self.waiting = 0
+
+    @property
+    def retry_after(self) -> int:
+        return max(math.ceil(self.max_queue_wait), 1)
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int, classes: List[RouteClass]):
+        self.max_in_flight = max_in_flight
+        self.classes: Dict[str, RouteClass] = {route_class.name: route_class for route_class in classes}
+        self.in_flight = 0
+        self._waiters: List[Tuple[int, int, RouteClass, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+    def _has_room(self, route_class: RouteClass) -> bool:
+        return self.in_flight < self.max_in_flight and route_class.in_flight < route_class.max_in_flight
+
+    def _start(self, route_class: RouteClass) -> None:
+        self.in_flight += 1
+        route_class.in_flight += 1
+
+    def _waiting_ahead(self, route_class: RouteClass, strictly: bool = False) -> bool:
+        """Whether a class of higher (or equal) priority is queued only for lack of worker-wide slots"""
+        return any(
+            other.waiting and other.in_flight < other.max_in_flight and (
+                other.priority < route_class.priority or
+                (not strictly and other.priority == route_class.priority)
+            )
+            for other in self.classes.values()
+        )
+
+    async def acquire(self, route_class: RouteClass) -> Tuple[Optional[str], float]:
+        """Wait for a slot; returns the rejection reason (None when admitted) and the time spent queued"""
+        if self._has_room(route_class) and not self._waiting_ahead(route_class):
+            self._start(route_class)
+            return None, 0.0
+        if route_class.shed_when_outranked and self._waiting_ahead(route_class, strictly=True):
+            return SHED, 0.0
+        if route_class.waiting >= route_class.max_queue_length:
+            return QUEUE_FULL, 0.0
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (route_class.priority, next(self._sequence), route_class, future))
+        route_class.waiting += 1
+        queued_at = time.perf_counter()
+        try:
+            await asyncio.wait({future}, timeout=route_class.max_queue_wait)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(route_class)
+            raise
+        finally:
+            route_class.waiting -= 1
+            if not future.done():
+                future.cancel()
+        waited = time.perf_counter() - queued_at
+        if future.cancelled():
+            return QUEUE_TIMEOUT, waited
+        return None, waited
+
+    def release(self, route_class: RouteClass) -> None:
+        self.in_flight -= 1
+        route_class.in_flight -= 1
+        self._grant()
+
+    def _grant(self) -> None:
+        """Hand free slots to the highest priority waiters whose class still has room"""
+        skipped = []
+        while self._waiters and self.in_flight < self.max_in_flight:
+            waiter = heapq.heappop(self._waiters)
+            route_class, future = waiter[2], waiter[3]
+            if future.done():
+                continue
+            if route_class.in_flight >= route_class.max_in_flight:
+                skipped.append(waiter)
+                continue
+            self._start(route_class)
+            future.set_result(None)
+        for waiter in skipped:
+            heapq.heappush(self._waiters, waiter)
+
+
+def default_controller() -> AdmissionController:
+    return AdmissionController(settings.ADMISSION_MAX_IN_FLIGHT, [
+        RouteClass(
+            "booking_writes", 0,
+            settings.ADMISSION_WRITE_MAX_IN_FLIGHT,
+            settings.ADMISSION_MAX_QUEUE_LENGTH,
+            settings.ADMISSION_WRITE_MAX_QUEUE_WAIT_MS / 1000,
+        ),
+        RouteClass(
+            "auth", 1,
+            settings.ADMISSION_AUTH_MAX_IN_FLIGHT,
+            settings.ADMISSION_MAX_QUEUE_LENGTH,
+            settings.ADMISSION_AUTH_MAX_QUEUE_WAIT_MS / 1000,
+        ),
+        RouteClass(
+            "other_writes", 2,
+            settings.ADMISSION_OTHER_WRITE_MAX_IN_FLIGHT,
+            settings.ADMISSION_MAX_QUEUE_LENGTH,
+            settings.ADMISSION_WRITE_MAX_QUEUE_WAIT_MS / 1000,
+        ),
+        RouteClass(
+            "reads", 3,
+            settings.ADMISSION_READ_MAX_IN_FLIGHT,
+            settings.ADMISSION_MAX_QUEUE_LENGTH,
+            settings.ADMISSION_READ_MAX_QUEUE_WAIT_MS / 1000,
+            shed_when_outranked=True,
+        ),
+    ])
+
+
+def route_class_name(method: str, path: str) -> Optional[str]:
+    """Route class of an API request, or None for requests that are never limited"""
+    prefix = settings.API_V1_STR
+    if not path.startswith(prefix + "/"):
+        return None
+    if path.endswith("/availability/stream"):
+        return None  # long-lived and idle almost all the time; must not hold a slot
+    if path.startswith(prefix + "/auth/"):
+        return "auth"
+    if method in ("GET", "HEAD") or path == prefix + "/bookings/quote":
+        return "reads"
+    if path.startswith(prefix + "/bookings/"):
+        return "booking_writes"
+    return "other_writes"
+
+
+class AdmissionControlMiddleware:
+    """Pure ASGI middleware limiting in-flight API requests per route class"""
+
+    def __init__(
+        self,
+        app,
+        controller: Optional[AdmissionController] = None,
+        registry: MetricsRegistry = metrics_registry
+    ):
+        self.app = app
+        self.controller = controller or default_controller()
+        self.registry = registry
+        registry.describe("admission_rejected_total", "Requests turned away by admission control.")
+        registry.describe("admission_queue_wait_seconds", "Time requests waited for admission.")
+        registry.register_gauge(
+            "admission_in_flight", "Admitted requests in flight by route class.", self._in_flight
+        )
+
+    def _in_flight(self) -> Dict[Labels, float]:
+        return {
+            (("class", route_class.name),): route_class.in_flight
+            for route_class in self.controller.classes.values()
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        name = route_class_name(scope["method"], scope["path"])
+        route_class = self.controller.classes.get(name)
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        rejection, waited = await self.controller.acquire(route_class)
+        labels: Labels = (("class", route_class.name),)
+        self.registry.observe("admission_queue_wait_seconds", labels, waited)
+        if rejection is not None:
+            self.registry.inc("admission_rejected_total", labels + (("reason", rejection),))
+            await self._reject(send, rejection, route_class)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(route_class)
+
+    async def _reject(self, send, rejection: str, route_class: RouteClass) -> None:
+        status_code, detail = REJECTIONS[rejection]
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(route_class.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
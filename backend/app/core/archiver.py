@@ -0,0 +1,100 @@
+"""
+Background archiver for old bookings, and booking partition upkeep.
+
+Almost all traffic touches upcoming bookings, so the archiver keeps
+``bookings`` (and its indexes) down to the bookings that still matter. It
+moves bookings that ended more than BOOKING_ARCHIVE_AFTER_DAYS ago, and
+cancelled or expired ones untouched for BOOKING_ARCHIVE_INACTIVE_AFTER_DAYS,
+to ``bookings_archive``. It works in batches of BOOKING_ARCHIVE_BATCH_SIZE,
+each in its own short transaction. On PostgreSQL every run also creates the
+coming monthly partitions of bookings and drops past ones left empty (see
+app.core.partitions). Every worker runs the archiver, but a run only goes
+ahead in the worker that takes its advisory lock (see
+app.core.database.job_lock); the others skip that interval.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from starlette.concurrency import run_in_threadpool
+from app.core import partitions
+from app.core.config import settings
+from app.core.database import SessionLocal, engine, job_lock
+from app.core.metrics import registry
+from app.crud import booking as crud_booking
+
+logger = logging.getLogger(__name__)
+
+registry.describe("bookings_archived_total", "Bookings moved to bookings_archive.")
+registry.describe("booking_archive_run_duration_seconds", "Duration of archiver runs.")
+
+
+def archive_old_bookings() -> int:
+    """Archive every booking past its retention, batch by batch; returns how many were archived"""
+    if settings.BOOKING_ARCHIVE_AFTER_DAYS <= 0:
+        return 0
+
+    now = datetime.now(timezone.utc)
+    ended_before = now - timedelta(days=settings.BOOKING_ARCHIVE_AFTER_DAYS)
+    inactive_before = now - timedelta(days=settings.BOOKING_ARCHIVE_INACTIVE_AFTER_DAYS)
+    batch_size = settings.BOOKING_ARCHIVE_BATCH_SIZE
+    archived = 0
+    db = SessionLocal()
+    try:
+        for _ in range(settings.BOOKING_ARCHIVE_MAX_BATCHES):
+            count = crud_booking.archive_bookings(db, ended_before, inactive_before, batch_size)
+            archived += count
+            if count < batch_size:
+                break
+    finally:
+        db.close()
+        registry.inc("bookings_archived_total", amount=archived)
+
+    if archived:
+        logger.info("Archived %d bookings", archived)
+    return archived
+
+
+def maintain_partitions() -> None:
+    """Create the coming monthly booking partitions and drop the emptied past ones"""
+    if engine.dialect.name != "postgresql":
+        return
+    today = datetime.now(timezone.utc).date()
+    with engine.connect() as connection:
+        created = partitions.ensure_booking_partitions(
+            connection,
+            partitions.month_start(today),
+            partitions.add_months(partitions.month_start(today), settings.BOOKING_PARTITION_MONTHS_AHEAD),
+        )
+    if settings.BOOKING_ARCHIVE_AFTER_DAYS > 0:
+        with engine.connect() as connection:
+            dropped = partitions.drop_empty_booking_partitions(
+                connection, today - timedelta(days=settings.BOOKING_ARCHIVE_AFTER_DAYS)
+            )
+    else:
+        dropped = []
+    if created or dropped:
+        logger.info("Booking partitions created: %s; dropped: %s", created, dropped)
+
+
+def run_archive() -> int:
+    with job_lock("booking_archiver") as acquired:
+        if not acquired:
+            logger.debug("Booking archive run skipped; another worker is running it")
+            return 0
+        started = time.perf_counter()
+        try:
+            maintain_partitions()
+            return archive_old_bookings()
+        finally:
+            registry.observe("booking_archive_run_duration_seconds", (), time.perf_counter() - started)
+
+
+async def run_archiver() -> None:
+    """Archive and maintain partitions every BOOKING_ARCHIVE_INTERVAL_SECONDS until cancelled"""
+    while True:
+        try:
+            await run_in_threadpool(run_archive)
+        except Exception:
+            logger.exception("Booking archive run failed")
+        await asyncio.sleep(settings.BOOKING_ARCHIVE_INTERVAL_SECONDS)
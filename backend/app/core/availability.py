@@ -0,0 +1,250 @@
+"""
+Live availability push for venue pages.
+
+Instead of polling ``GET /venues/{venue_id}/availability``, a venue page opens
+``GET /venues/{venue_id}/availability/stream``, gets a snapshot of the booked
+slots in its date range and then one Server-Sent Event per committed booking
+write that books or releases a slot in that range.
+
+Every booking write hands its changes to ``track_booking_changes`` through
+app.crud.booking.record_booking_changes. They reach the broker of every worker once the
+write commits (see app.core.notifications). A commit hops onto the event loop
+once and the loop fans the change out to the subscribers of that venue;
+nothing is queried per subscriber.
+"""
+import asyncio
+import json
+import threading
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.core import notifications
+from app.core.config import settings
+from app.core.metrics import Labels, registry
+from app.models.models import ACTIVE_BOOKING_STATUSES
+
+NOTIFY_CHANNEL = "booking_availability"
+
+Slot = Tuple[datetime, datetime]
+
+registry.describe("availability_events_total", "Availability changes delivered to stream subscribers.")
+registry.describe("availability_resyncs_total", "Stream subscribers resynced after falling behind.")
+
+
+def _utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _overlaps(slot: Slot, start: datetime, end: datetime) -> bool:
+    return slot[0] < end and slot[1] > start
+
+
+class AvailabilityChange(NamedTuple):
+    venue_id: int
+    booked: List[Slot]
+    released: List[Slot]
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "venue_id": self.venue_id,
+            "booked": [[start.isoformat(), end.isoformat()] for start, end in self.booked],
+            "released": [[start.isoformat(), end.isoformat()] for start, end in self.released],
+        })
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "AvailabilityChange":
+        return cls(
+            data["venue_id"],
+            [(datetime.fromisoformat(start), datetime.fromisoformat(end)) for start, end in data["booked"]],
+            [(datetime.fromisoformat(start), datetime.fromisoformat(end)) for start, end in data["released"]],
+        )
+
+
+def changes_by_venue(changes) -> List[AvailabilityChange]:
+    """Collapse (before, after) booking snapshots into one availability change per venue"""
+    by_venue: Dict[int, AvailabilityChange] = {}
+    for before, after in changes:
+        blocked_before = before is not None and before.status in ACTIVE_BOOKING_STATUSES
+        blocked_after = after is not None and after.status in ACTIVE_BOOKING_STATUSES
+        before_slot = (_utc(before.start_datetime), _utc(before.end_datetime)) if blocked_before else None
+        after_slot = (_utc(after.start_datetime), _utc(after.end_datetime)) if blocked_after else None
+        if before_slot == after_slot:
+            continue
+        venue_id = (after or before).venue_id
+        change = by_venue.setdefault(venue_id, AvailabilityChange(venue_id, [], []))
+        if before_slot is not None:
+            change.released.append(before_slot)
+        if after_slot is not None:
+            change.booked.append(after_slot)
+    return list(by_venue.values())
+
+
+class Subscription:
+    """One open stream: a venue, a date range and a bounded queue of changes"""
+
+    def __init__(self, venue_id: int, start: datetime, end: datetime, queue_size: int):
+        self.venue_id = venue_id
+        self.start = _utc(start)
+        self.end = _utc(end)
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # Set when changes were dropped; the stream then sends a fresh snapshot
+        self.overflowed = False
+
+    def deliver(self, change: AvailabilityChange) -> None:
+        booked = [slot for slot in change.booked if _overlaps(slot, self.start, self.end)]
+        released = [slot for slot in change.released if _overlaps(slot, self.start, self.end)]
+        if not booked and not released:
+            return
+        try:
+            self.queue.put_nowait(AvailabilityChange(change.venue_id, booked, released))
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def request_resync(self) -> None:
+        """Send a fresh snapshot next, e.g. after changes may have been missed"""
+        self.overflowed = True
+        try:
+            self.queue.put_nowait(None)  # wakes the stream
+        except asyncio.QueueFull:
+            pass
+
+
+class AvailabilityBroker:
+    def __init__(self):
+        self._subscriptions: Dict[int, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscriptions.setdefault(subscription.venue_id, set()).add(subscription)
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.venue_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.venue_id]
+
+    def publish(self, change: AvailabilityChange) -> None:
+        """Hand a change to the venue's subscribers; safe to call from any thread"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(change.venue_id, ()))
+        by_loop: Dict[asyncio.AbstractEventLoop, List[Subscription]] = {}
+        for subscription in subscriptions:
+            by_loop.setdefault(subscription.loop, []).append(subscription)
+        for loop, group in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(self._fan_out, group, change)
+            except RuntimeError:
+                pass  # the loop is closed; its streams are gone too
+
+    def resync_all(self) -> None:
+        """Have every open stream send a fresh snapshot; safe to call from any thread"""
+        with self._lock:
+            subscriptions = [subscription for group in self._subscriptions.values() for subscription in group]
+        self._resync(subscriptions)
+
+    def resync_venue(self, venue_id: int) -> None:
+        """Have the venue's open streams send a fresh snapshot; safe to call from any thread"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(venue_id, ()))
+        self._resync(subscriptions)
+
+    @staticmethod
+    def _resync(subscriptions: List[Subscription]) -> None:
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.request_resync)
+            except RuntimeError:
+                pass
+
+    @staticmethod
+    def _fan_out(subscriptions: List[Subscription], change: AvailabilityChange) -> None:
+        for subscription in subscriptions:
+            subscription.deliver(change)
+        registry.inc("availability_events_total", amount=len(subscriptions))
+
+    def subscriber_counts(self) -> Dict[Labels, float]:
+        with self._lock:
+            return {(): sum(len(subscriptions) for subscriptions in self._subscriptions.values())}
+
+
+broker = AvailabilityBroker()
+registry.register_gauge("availability_subscribers", "Open availability streams.", broker.subscriber_counts)
+
+
+def track_booking_changes(db: Session, changes) -> None:
+    """Publish availability changes of booking writes once ``db`` commits.
+
+    A change too big for one NOTIFY, e.g. a bulk cancel on a busy venue, is
+    sent as a resync of that venue: its streams send a fresh snapshot.
+    """
+    for change in changes_by_venue(changes):
+        payload = change.to_json()
+        if len(payload.encode()) > notifications.MAX_PAYLOAD_BYTES:
+            payload = json.dumps({"venue_id": change.venue_id, "resync": True})
+        notifications.publish_on_commit(db, NOTIFY_CHANNEL, payload)
+
+
+def _receive(payload: str) -> None:
+    data = json.loads(payload)
+    if data.get("resync"):
+        broker.resync_venue(data["venue_id"])
+    else:
+        broker.publish(AvailabilityChange.from_dict(data))
+
+
+notifications.register(NOTIFY_CHANNEL, _receive, resync=broker.resync_all)
+
+
+def _sse(event_name: str, data: str) -> str:
+    return f"event: {event_name}\ndata: {data}\n\n"
+
+
+async def availability_events(
+    venue_id: int,
+    start: datetime,
+    end: datetime,
+    load_booked_slots: Callable[[], Iterable[Slot]],
+    keepalive: Optional[float] = None
+) -> AsyncIterator[str]:
+    """Server-Sent Events for a venue and range: a snapshot, then every change.
+
+    ``load_booked_slots`` runs in the threadpool for the initial snapshot, and
+    again whenever this subscriber fell too far behind to catch up change by change.
+    """
+    keepalive = settings.AVAILABILITY_STREAM_KEEPALIVE_SECONDS if keepalive is None else keepalive
+    subscription = Subscription(venue_id, start, end, settings.AVAILABILITY_STREAM_QUEUE_SIZE)
+    # Subscribe before the snapshot so no commit falls between the two
+    broker.subscribe(subscription)
+    try:
+        resync = True
+        while True:
+            if resync:
+                slots = await run_in_threadpool(lambda: list(load_booked_slots()))
+                yield _sse("snapshot", json.dumps({
+                    "venue_id": venue_id,
+                    "start_datetime": subscription.start.isoformat(),
+                    "end_datetime": subscription.end.isoformat(),
+                    "booked": [[_utc(s).isoformat(), _utc(e).isoformat()] for s, e in slots],
+                }))
+                resync = False
+            try:
+                change = await asyncio.wait_for(subscription.queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if subscription.overflowed:
+                subscription.overflowed = False
+                subscription.queue = asyncio.Queue(maxsize=subscription.queue.maxsize)
+                registry.inc("availability_resyncs_total")
+                resync = True
+                continue
+            yield _sse("change", change.to_json())
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,305 @@
+"""
+iCalendar feeds of venue schedules and of users' own bookings.
+
+Calendar clients poll subscribed feeds often, so each worker caches rendered
+feeds. A feed stays cached until one of its bookings changes: every booking
+write calls ``track_booking_changes`` through
+app.crud.booking.record_booking_changes, which reaches every worker on commit
+(see app.core.notifications). A feed also expires after
+CALENDAR_FEED_MAX_AGE_SECONDS, which picks up renamed venues and the moving
+window. Feed URL tokens are signed with the owner's feed salt, which is cached
+per worker too and dropped with the feed when ``track_feed_rotation`` publishes
+a new one. A poll whose If-None-Match matches the cached feed gets a 304 without
+touching the database. When a feed is rebuilt, only bookings whose version
+changed are rendered again; the rest reuse their cached VEVENT.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+from sqlalchemy.orm import Session
+from app.core import notifications
+from app.core.config import settings
+from app.core.database import SessionLocal
+
+NOTIFY_CHANNEL = "calendar_feeds"
+PRODID = "-//South Moravia Conference Booking//Bookings//EN"
+UID_DOMAIN = "conference-booking.southmoravia"
+
+
+class FeedKey(NamedTuple):
+    kind: str  # "venue" or "user"
+    id: int
+
+
+class CachedFeed(NamedTuple):
+    body: bytes
+    etag: str
+    expires_at: float
+
+
+def _escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    """Fold a content line into chunks of at most 75 octets (RFC 5545, 3.1)"""
+    if len(line.encode()) <= 75:
+        return line
+    chunks, current, size = [], "", 0
+    for char in line:
+        width = len(char.encode())
+        if size + width > (75 if not chunks else 74):
+            chunks.append(current)
+            current, size = "", 0
+        current += char
+        size += width
+    chunks.append(current)
+    return "\r\n ".join(chunks)
+
+
+def _timestamp(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def render_event(booking, venue_feed: bool) -> str:
+    """One VEVENT; venue feeds show busy slots only, user feeds the booking's details"""
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:booking-{booking.id}@{UID_DOMAIN}",
+        f"DTSTAMP:{_timestamp(booking.updated_at or booking.created_at or booking.start_datetime)}",
+        f"DTSTART:{_timestamp(booking.start_datetime)}",
+        f"DTEND:{_timestamp(booking.end_datetime)}",
+        f"SEQUENCE:{booking.version}",
+        f"STATUS:{'CONFIRMED' if booking.status == 'confirmed' else 'TENTATIVE'}",
+    ]
+    if venue_feed:
+        lines.append("SUMMARY:Booked")
+    else:
+        summary = booking.venue_name + (f" - {booking.purpose}" if booking.purpose else "")
+        lines.append(f"SUMMARY:{_escape(summary)}")
+        lines.append(f"LOCATION:{_escape(f'{booking.venue_name}, {booking.venue_address}, {booking.venue_city}')}")
+        if booking.notes:
+            lines.append(f"DESCRIPTION:{_escape(booking.notes)}")
+    lines.append("END:VEVENT")
+    return "".join(_fold(line) + "\r\n" for line in lines)
+
+
+def render_calendar(name: str, events: Iterable[str]) -> bytes:
+    refresh = f"PT{settings.CALENDAR_FEED_REFRESH_MINUTES}M"
+    header = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_escape(name)}",
+        f"REFRESH-INTERVAL;VALUE=DURATION:{refresh}",
+        f"X-PUBLISHED-TTL:{refresh}",
+    ]
+    head = "".join(_fold(line) + "\r\n" for line in header)
+    return (head + "".join(events) + "END:VCALENDAR\r\n").encode()
+
+
+class FeedCache:
+    """LRU caches of rendered feeds, feed salts and rendered VEVENTs, shared by all feeds of a worker"""
+
+    def __init__(self, max_feeds: int, max_events: int, max_age: float):
+        self.max_feeds = max_feeds
+        self.max_events = max_events
+        self.max_age = max_age
+        self._feeds: "OrderedDict[FeedKey, CachedFeed]" = OrderedDict()
+        self._events: "OrderedDict[tuple, str]" = OrderedDict()
+        self._salts: "OrderedDict[FeedKey, str]" = OrderedDict()
+        # Bumped by invalidate() and clear(), so a render that raced with a booking write is not cached
+        self._generations: Dict[FeedKey, int] = {}
+        self._clears = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: FeedKey) -> Optional[CachedFeed]:
+        with self._lock:
+            feed = self._feeds.get(key)
+            if feed is None:
+                return None
+            if feed.expires_at <= time.monotonic():
+                del self._feeds[key]
+                return None
+            self._feeds.move_to_end(key)
+            return feed
+
+    def generation(self, key: FeedKey) -> Tuple[int, int]:
+        return self._clears, self._generations.get(key, 0)
+
+    def put(self, key: FeedKey, body: bytes, generation: Tuple[int, int]) -> CachedFeed:
+        feed = CachedFeed(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"', time.monotonic() + self.max_age)
+        with self._lock:
+            if self.generation(key) == generation:
+                self._feeds[key] = feed
+                self._feeds.move_to_end(key)
+                while len(self._feeds) > self.max_feeds:
+                    self._feeds.popitem(last=False)
+        return feed
+
+    def salt(self, key: FeedKey) -> Optional[str]:
+        with self._lock:
+            salt = self._salts.get(key)
+            if salt is not None:
+                self._salts.move_to_end(key)
+            return salt
+
+    def put_salt(self, key: FeedKey, salt: str, generation: Tuple[int, int]) -> None:
+        with self._lock:
+            if self.generation(key) == generation:
+                self._salts[key] = salt
+                self._salts.move_to_end(key)
+                while len(self._salts) > self.max_events:
+                    self._salts.popitem(last=False)
+
+    def event(self, cache_key: tuple, render: Callable[[], str]) -> str:
+        with self._lock:
+            rendered = self._events.get(cache_key)
+            if rendered is not None:
+                self._events.move_to_end(cache_key)
+                return rendered
+        rendered = render()
+        with self._lock:
+            self._events[cache_key] = rendered
+            while len(self._events) > self.max_events:
+                self._events.popitem(last=False)
+        return rendered
+
+    def invalidate(self, keys: Iterable[FeedKey]) -> None:
+        with self._lock:
+            for key in keys:
+                self._generations[key] = self._generations.get(key, 0) + 1
+                self._feeds.pop(key, None)
+                self._salts.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._feeds.clear()
+            self._events.clear()
+            self._salts.clear()
+            self._clears += 1
+
+
+feed_cache = FeedCache(
+    settings.CALENDAR_FEED_CACHE_SIZE, settings.CALENDAR_EVENT_CACHE_SIZE, settings.CALENDAR_FEED_MAX_AGE_SECONDS
+)
+
+
+def track_booking_changes(db: Session, changes) -> None:
+    """Invalidate the venue and user feeds of changed bookings once ``db`` commits"""
+    keys = set()
+    for before, after in changes:
+        for booking in (before, after):
+            if booking is None:
+                continue
+            keys.add(("venue", booking.venue_id))
+            if booking.user_id is not None:
+                keys.add(("user", booking.user_id))
+    # Bulk writes touch many feeds: send them in payloads NOTIFY takes
+    chunk: list = []
+    size = 2
+    for key in sorted(keys):
+        key_size = len(json.dumps(key)) + 2
+        if chunk and size + key_size > notifications.MAX_PAYLOAD_BYTES:
+            notifications.publish_on_commit(db, NOTIFY_CHANNEL, json.dumps(chunk))
+            chunk, size = [], 2
+        chunk.append(key)
+        size += key_size
+    if chunk:
+        notifications.publish_on_commit(db, NOTIFY_CHANNEL, json.dumps(chunk))
+
+
+def track_feed_rotation(db: Session, key: FeedKey) -> None:
+    """Drop the feed and the salt of ``key`` in every worker once ``db`` commits its new salt"""
+    notifications.publish_on_commit(db, NOTIFY_CHANNEL, json.dumps([list(key)]))
+
+
+notifications.register(
+    NOTIFY_CHANNEL,
+    lambda payload: feed_cache.invalidate(FeedKey(kind, feed_id) for kind, feed_id in json.loads(payload)),
+    resync=feed_cache.clear,
+)
+
+
+def _render_venue_feed(db: Session, venue_id: int, since: datetime) -> Optional[bytes]:
+    from app.crud import calendar as crud_calendar
+    from app.crud import venue as crud_venue
+    venue = crud_venue.get_venue(db, venue_id=venue_id)
+    if venue is None:
+        return None
+    events = [
+        feed_cache.event(("venue", booking.id, booking.version), lambda: render_event(booking, venue_feed=True))
+        for booking in crud_calendar.get_venue_feed_bookings(db, venue_id, since)
+    ]
+    return render_calendar(venue.name, events)
+
+
+def _render_user_feed(db: Session, user_id: int, since: datetime) -> Optional[bytes]:
+    from app.crud import calendar as crud_calendar
+    events = [
+        feed_cache.event(
+            ("user", booking.id, booking.version, booking.venue_version),
+            lambda: render_event(booking, venue_feed=False)
+        )
+        for booking in crud_calendar.get_user_feed_bookings(db, user_id, since)
+    ]
+    return render_calendar("My conference bookings", events)
+
+
+RENDERERS = {"venue": _render_venue_feed, "user": _render_user_feed}
+
+
+def load_feed(key: FeedKey) -> Tuple[Optional[CachedFeed], bool]:
+    """The feed for ``key`` (None if its venue does not exist) and whether it had to be rendered"""
+    feed = feed_cache.get(key)
+    if feed is not None:
+        return feed, False
+
+    generation = feed_cache.generation(key)
+    since = datetime.now(timezone.utc) - timedelta(days=settings.CALENDAR_FEED_PAST_DAYS)
+    db = SessionLocal()
+    try:
+        body = RENDERERS[key.kind](db, key.id, since)
+    finally:
+        db.close()
+    if body is None:
+        return None, True
+    return feed_cache.put(key, body, generation), True
+
+
+def load_salt(key: FeedKey) -> Optional[str]:
+    """The salt the tokens of ``key`` are signed with, or None if its owner does not exist"""
+    salt = feed_cache.salt(key)
+    if salt is not None:
+        return salt
+
+    from app.crud import calendar as crud_calendar
+    generation = feed_cache.generation(key)
+    db = SessionLocal()
+    try:
+        salt = crud_calendar.get_feed_salt(db, key.kind, key.id)
+    finally:
+        db.close()
+    if salt is not None:
+        feed_cache.put_salt(key, salt, generation)
+    return salt
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(
+        (candidate[2:] if candidate.startswith("W/") else candidate) == etag for candidate in candidates
+    )
@@ -15,12 +15,95 @@ class Settings(BaseSettings):
     DATABASE_NAME: str = "conference_booking"
     DATABASE_USER: str
     DATABASE_PASSWORD: str
+    DATABASE_REPLICA_URLS: List[str] = []
+    REPLICA_STICKINESS_SECONDS: float = 10.0
+    REPLICA_UNHEALTHY_COOLDOWN_SECONDS: float = 30.0
     
+    # Observability
+    METRICS_ENABLED: bool = True
+    SQL_INSTRUMENTATION_ENABLED: bool = True
+    SQL_REPEATED_STATEMENT_THRESHOLD: int = 10
+
+    # Admission control (in-flight limits per worker process)
+    ADMISSION_CONTROL_ENABLED: bool = True
+    ADMISSION_MAX_IN_FLIGHT: int = 40
+    ADMISSION_AUTH_MAX_IN_FLIGHT: int = 8
+    ADMISSION_READ_MAX_IN_FLIGHT: int = 32
+    ADMISSION_WRITE_MAX_IN_FLIGHT: int = 40
+    ADMISSION_OTHER_WRITE_MAX_IN_FLIGHT: int = 8
+    ADMISSION_MAX_QUEUE_LENGTH: int = 200
+    ADMISSION_AUTH_MAX_QUEUE_WAIT_MS: int = 1000
+    ADMISSION_READ_MAX_QUEUE_WAIT_MS: int = 250
+    ADMISSION_WRITE_MAX_QUEUE_WAIT_MS: int = 2000
+
+    # Idempotency-Key support on booking writes
+    IDEMPOTENCY_KEY_TTL_SECONDS: int = 24 * 60 * 60
+    IDEMPOTENCY_LOCK_SECONDS: int = 60
+    IDEMPOTENCY_WAIT_SECONDS: float = 10.0
+
+    # Pending bookings hold their slot this long before the sweeper expires them (0 keeps them forever)
+    PENDING_BOOKING_HOLD_MINUTES: int = 48 * 60
+    EXPIRY_SWEEP_INTERVAL_SECONDS: int = 60
+    EXPIRY_SWEEP_BATCH_SIZE: int = 500
+    EXPIRY_SWEEP_MAX_BATCHES: int = 100
+
+    # Archiver: bookings that ended BOOKING_ARCHIVE_AFTER_DAYS ago, and cancelled or expired ones
+    # untouched for BOOKING_ARCHIVE_INACTIVE_AFTER_DAYS, move to bookings_archive (0 keeps them).
+    # Each run also keeps monthly booking partitions this many months ahead (PostgreSQL)
+    BOOKING_ARCHIVE_AFTER_DAYS: int = 365
+    BOOKING_ARCHIVE_INACTIVE_AFTER_DAYS: int = 30
+    BOOKING_ARCHIVE_INTERVAL_SECONDS: int = 3600
+    BOOKING_ARCHIVE_BATCH_SIZE: int = 500
+    BOOKING_ARCHIVE_MAX_BATCHES: int = 100
+    BOOKING_PARTITION_MONTHS_AHEAD: int = 12
+
+    # Availability stream: subscribers get a keepalive comment this often, and
+    # are resynced with a fresh snapshot when this many events pile up unread
+    AVAILABILITY_STREAM_KEEPALIVE_SECONDS: float = 15.0
+    AVAILABILITY_STREAM_QUEUE_SIZE: int = 100
+
+    # iCalendar feeds: bookings ending in the last CALENDAR_FEED_PAST_DAYS and later. Rendered
+    # feeds are cached until their bookings change, or for at most CALENDAR_FEED_MAX_AGE_SECONDS
+    CALENDAR_FEED_PAST_DAYS: int = 90
+    CALENDAR_FEED_MAX_EVENTS: int = 5000
+    CALENDAR_FEED_MAX_AGE_SECONDS: int = 3600
+    CALENDAR_FEED_CACHE_SIZE: int = 1000
+    CALENDAR_EVENT_CACHE_SIZE: int = 50000
+    CALENDAR_FEED_REFRESH_MINUTES: int = 15
+
+    # Warm-up before a worker accepts traffic: pooled connections, crypto backend, OpenAPI schema
+    STARTUP_WARMUP_ENABLED: bool = True
+    STARTUP_WARM_DB_CONNECTIONS: int = 5
+
+    # Production server (serve.py); 0 workers sizes the pool to the available CPU cores
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: int = 0
+    SERVER_PRELOAD_APP: bool = True
+    SERVER_BACKLOG: int = 2048
+    SERVER_KEEPALIVE_SECONDS: int = 5
+    SERVER_GRACEFUL_TIMEOUT_SECONDS: int = 30
+    # Recycle a worker after this many requests, with jitter so they do not restart together (0 never)
+    SERVER_MAX_REQUESTS: int = 0
+    SERVER_MAX_REQUESTS_JITTER: int = 100
+
+    # Public venue search responses, cached per worker until a venue changes
+    VENUE_SEARCH_CACHE_MAX_BYTES: int = 16 * 1024 * 1024
+    VENUE_SEARCH_CACHE_TTL_SECONDS: int = 300
+    # Range facets of venue search: each bound starts a new range
+    VENUE_CAPACITY_FACET_BOUNDS: List[int] = [20, 50, 100, 200, 500]
+    VENUE_RATE_FACET_BOUNDS: List[int] = [500, 1000, 2000, 5000]
+
+    # Pricing
+    VENUE_RATE_CACHE_TTL_SECONDS: int = 60
+    BOOKING_QUOTE_MAX_ITEMS: int = 100
+    BOOKING_BULK_MAX_IDS: int = 1000
+
     # CORS
     BACKEND_CORS_ORIGINS: List[str] = []
 
-    @validator("BACKEND_CORS_ORIGINS", pre=True)
-    def assemble_cors_origins(cls, v: Union[str, List[str]]) -> Union[List[str], str]:
+    @validator("BACKEND_CORS_ORIGINS", "DATABASE_REPLICA_URLS", pre=True)
+    def split_comma_separated(cls, v: Union[str, List[str]]) -> Union[List[str], str]:
         if isinstance(v, str) and not v.startswith("["):
             return [i.strip() for i in v.split(",")]
         elif isinstance(v, (list, str)):
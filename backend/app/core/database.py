@@ -1,15 +1,238 @@
-from sqlalchemy import create_engine
+"""
+Database engines and sessions.
+
+Writes always go to the primary. Read-only endpoints depend on ``get_read_db``,
+which hands out a session on one of the replicas from DATABASE_REPLICA_URLS,
+except for clients that wrote something in the last few seconds (they read
+from the primary so they see their own writes) or when no replica is healthy.
+
+A client's last write is carried by the client itself, so any worker can
+tell: responses to requests that committed a write set the ``last_write``
+cookie, the commit time signed together with the caller.
+"""
+import hashlib
+import hmac
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+from fastapi import Depends, Request
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from app.core.config import settings
+from app.core import query_stats
 
 engine = create_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+if settings.SQL_INSTRUMENTATION_ENABLED:
+    query_stats.instrument_engine(engine)
+
+
+class WriteSession(Session):
+    """Session whose commits can be held back, see ``held_commits``"""
+
+    def commit(self) -> None:
+        if self.info.get("hold_commits"):
+            self.flush()
+            return
+        super().commit()
+
+
+@contextmanager
+def held_commits(db: Session) -> Iterator[Session]:
+    """Turn commits of ``db`` into flushes inside the block, so the writes made
+    in it only commit with the caller's next commit, or roll back with it
+    """
+    db.info["hold_commits"] = True
+    try:
+        yield db
+    finally:
+        db.info.pop("hold_commits", None)
+
+
+# Objects stay loaded after commit: write paths return the new row from UPDATE ... RETURNING
+# and nothing needs to be re-read just to serialize the response
+SessionLocal = sessionmaker(
+    class_=WriteSession, autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+)
 
 Base = declarative_base()
 
-def get_db():
+
+@contextmanager
+def job_lock(name: str) -> Iterator[bool]:
+    """Whether this worker may run background job ``name`` now. On PostgreSQL it
+    holds a transaction-level advisory lock for the block, on a connection of
+    its own, so only one worker at a time runs the job; racing workers get
+    False and skip the run. Elsewhere there is only one process to run it.
+    """
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+    key = int.from_bytes(hashlib.sha256(f"job:{name}".encode()).digest()[:8], "big", signed=True)
+    with engine.connect() as connection, connection.begin():
+        yield connection.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": key}).scalar()
+
+
+class ReplicaRouter:
+    """Round-robin over replica engines, skipping replicas that recently failed"""
+
+    def __init__(self, engines: List[Engine], cooldown: float):
+        self.engines = engines
+        self.cooldown = cooldown
+        self._unhealthy_until: Dict[int, float] = {}
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        for replica in engines:
+            event.listen(replica, "handle_error", self._handle_error)
+
+    def pick(self) -> Optional[Engine]:
+        if not self.engines:
+            return None
+        now = time.monotonic()
+        start = next(self._next)
+        for offset in range(len(self.engines)):
+            replica = self.engines[(start + offset) % len(self.engines)]
+            if self._unhealthy_until.get(id(replica), 0) <= now:
+                return replica
+        return None
+
+    def mark_unhealthy(self, replica: Engine) -> None:
+        with self._lock:
+            self._unhealthy_until[id(replica)] = time.monotonic() + self.cooldown
+
+    def _handle_error(self, context) -> None:
+        if context.is_disconnect or context.connection is None:
+            self.mark_unhealthy(context.engine)
+
+
+def _create_replica_engine(url: str) -> Engine:
+    replica = create_engine(url, pool_pre_ping=True)
+    if settings.SQL_INSTRUMENTATION_ENABLED:
+        query_stats.instrument_engine(replica)
+    return replica
+
+
+replica_router = ReplicaRouter(
+    [_create_replica_engine(url) for url in settings.DATABASE_REPLICA_URLS],
+    settings.REPLICA_UNHEALTHY_COOLDOWN_SECONDS,
+)
+ReplicaSession = sessionmaker(autocommit=False, autoflush=False)
+
+
+def dispose_pools() -> None:
+    """Forget pooled connections inherited from a parent process, without closing them under it"""
+    for pooled_engine in [engine] + replica_router.engines:
+        pooled_engine.dispose(close=False)
+
+
+WRITE_COOKIE = "last_write"
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _remember_writer(session: Session) -> None:
+    request_state = session.info.get("request_state")
+    if request_state is not None:
+        request_state["written_at"] = time.time()
+
+
+def client_key(request: Request) -> str:
+    """Identify the caller for read-your-writes: the bearer token, or the client address"""
+    authorization = request.headers.get("authorization")
+    if authorization:
+        return hashlib.sha256(authorization.encode()).hexdigest()
+    return request.client.host if request.client else ""
+
+
+def _sign(client_key: str, stamp: str) -> str:
+    message = f"{client_key}:{stamp}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def write_cookie(client_key: str, written_at: float) -> str:
+    stamp = f"{written_at:.3f}"
+    return f"{stamp}.{_sign(client_key, stamp)}"
+
+
+def wrote_recently(request: Request) -> bool:
+    """Whether the caller's ``last_write`` cookie is within REPLICA_STICKINESS_SECONDS.
+
+    The timestamp is wall-clock time, so worker clocks only need to agree to
+    well within the window.
+    """
+    stamp, _, signature = request.cookies.get(WRITE_COOKIE, "").rpartition(".")
+    if not stamp or not hmac.compare_digest(signature, _sign(client_key(request), stamp)):
+        return False
+    try:
+        written_at = float(stamp)
+    except ValueError:
+        return False
+    return time.time() - written_at < settings.REPLICA_STICKINESS_SECONDS
+
+
+class ReadYourWritesMiddleware:
+    """Sets the ``last_write`` cookie on responses to requests that committed a write"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Shared with request.state, where get_db's sessions note their commits
+        state = scope.setdefault("state", {})
+
+        async def send_with_cookie(message):
+            written_at = state.get("written_at")
+            if message["type"] == "http.response.start" and written_at is not None and replica_router.engines:
+                cookie = (
+                    f"{WRITE_COOKIE}={write_cookie(client_key(Request(scope)), written_at)}; "
+                    f"Max-Age={math.ceil(settings.REPLICA_STICKINESS_SECONDS)}; Path=/; HttpOnly; SameSite=Lax"
+                )
+                headers = [*message.get("headers", []), (b"set-cookie", cookie.encode("latin-1"))]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+
+def get_db(request: Request):
     db = SessionLocal()
+    db.info["request_state"] = request.scope.setdefault("state", {})
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_db(request: Request, primary: Session = Depends(get_db)):
+    """Session for read-only endpoints, on a replica when one is healthy.
+
+    Falls back to the request's primary session, which the auth dependencies
+    share, so nothing they already loaded is queried twice.
+    """
+    replica = None
+    if not wrote_recently(request):
+        replica = replica_router.pick()
+    if replica is None:
+        yield primary
+        return
+
+    db = ReplicaSession(bind=replica)
+    try:
+        db.connection()
+    except DBAPIError:
+        db.close()
+        replica_router.mark_unhealthy(replica)
+        yield primary
+        return
+
     try:
         yield db
     finally:
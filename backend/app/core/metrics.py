@@ -0,0 +1,179 @@
+"""
+Process-local request metrics, exposed in the Prometheus text format.
+
+Each worker process keeps its own counters; Prometheus scrapes every worker
+(or sums them through a sidecar) the same way it does for any multi-process app.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+GaugeCallback = Callable[[], Dict[Labels, float]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels) + "}"
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._gauges: Dict[str, GaugeCallback] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def inc(self, name: str, labels: Labels = (), amount: float = 1) -> None:
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram()
+            histogram.observe(value)
+
+    def register_gauge(self, name: str, help_text: str, callback: GaugeCallback) -> None:
+        """Register a gauge whose values are collected when the metrics are rendered"""
+        self._help[name] = help_text
+        self._gauges[name] = callback
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        def header(name: str, kind: str) -> None:
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {
+                name: {labels: (list(h.counts), h.total, h.count) for labels, h in series.items()}
+                for name, series in self._histograms.items()
+            }
+
+        for name, series in sorted(counters.items()):
+            header(name, "counter")
+            for labels, value in series.items():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for name, series in sorted(histograms.items()):
+            header(name, "histogram")
+            for labels, (counts, total, count) in series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(LATENCY_BUCKETS + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        for name, callback in sorted(self._gauges.items()):
+            try:
+                values = callback()
+            except Exception:
+                continue
+            header(name, "gauge")
+            for labels, value in values.items():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+registry.describe("http_requests_total", "HTTP requests by method, route template and status code.")
+registry.describe("http_request_duration_seconds", "HTTP request latency by method and route template.")
+
+
+def threadpool_gauges() -> Dict[Labels, float]:
+    """Borrowed and total tokens of the AnyIO thread limiter that runs sync endpoints"""
+    from anyio import to_thread
+
+    limiter = to_thread.current_default_thread_limiter()
+    return {
+        (("state", "busy"),): limiter.borrowed_tokens,
+        (("state", "limit"),): limiter.total_tokens,
+    }
+
+
+def pool_gauges(engine) -> Callable[[], Dict[Labels, float]]:
+    def collect() -> Dict[Labels, float]:
+        pool = engine.pool
+        values = {}
+        for state in ("size", "checkedout", "checkedin", "overflow"):
+            method = getattr(pool, state, None)
+            if method is not None:
+                values[(("state", state),)] = method()
+        return values
+
+    return collect
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware counting requests and timing them per route template"""
+
+    def __init__(self, app, registry: MetricsRegistry = registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            self.registry.inc(
+                "http_requests_total",
+                (("method", method), ("route", template), ("status", str(status_code))),
+            )
+            self.registry.observe(
+                "http_request_duration_seconds",
+                (("method", method), ("route", template)),
+                time.perf_counter() - start,
+            )
@@ -0,0 +1,234 @@
+"""
+Commit-time notifications for per-process caches and streams.
+
+A module registers a handler for a channel, and writes call
+``publish_on_commit`` with a payload. Handlers only ever see payloads of
+committed transactions. The payloads are kept on the session and handed to
+this worker's handlers from an after_commit hook, on every backend.
+
+On PostgreSQL they also have to reach the other workers. They are sent with
+one NOTIFY statement (``pg_notify`` over ``unnest``) just before the writing
+transaction commits, each prefixed with ``<worker id>:``. Each worker runs one
+LISTEN connection (``listener``) and dispatches what the others sent,
+skipping its own. When that connection drops, the listener reconnects. It
+then calls each channel's resync callback, because anything sent in between
+was missed.
+
+PostgreSQL rejects NOTIFY payloads of 8000 bytes or more, which would fail the
+whole commit. Channels whose payloads can grow keep them under
+``MAX_PAYLOAD_BYTES``; any payload still over it reaches the other workers as
+the bare worker id, with no ``:``, and they call the channel's resync callback
+instead.
+"""
+import logging
+import os
+import select
+import threading
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from app.core.database import SessionLocal, engine
+from app.core.metrics import Labels, registry
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[str], None]
+
+# Tells this worker's NOTIFYs apart from the others'; its own were dispatched on commit
+WORKER_ID = uuid.uuid4().hex
+
+# Largest payload sent as it is: PostgreSQL takes under 8000 bytes, "<worker id>:" included
+MAX_PAYLOAD_BYTES = 7999 - len(WORKER_ID) - 1
+
+handlers: Dict[str, Handler] = {}
+resync_handlers: Dict[str, Callable[[], None]] = {}
+
+registry.describe("notification_listener_reconnects_total", "Times the LISTEN connection was re-established.")
+registry.describe(
+    "notification_oversized_payloads_total", "Payloads too big for NOTIFY, sent to other workers as a resync instead."
+)
+
+
+def register(channel: str, handler: Handler, resync: Optional[Callable[[], None]] = None) -> None:
+    """Call ``handler`` with every committed payload of ``channel``, and ``resync``
+    when payloads from other workers may have been missed
+    """
+    handlers[channel] = handler
+    if resync is not None:
+        resync_handlers[channel] = resync
+
+
+def publish_on_commit(db: Session, channel: str, payload: str) -> None:
+    """Hand ``payload`` to the channel's handlers in every worker once ``db`` commits"""
+    db.info.setdefault("notifications", []).append((channel, payload))
+
+
+def _dispatch(channel: str, payload: str) -> None:
+    handler = handlers.get(channel)
+    if handler is None:
+        return
+    try:
+        handler(payload)
+    except Exception:
+        logger.exception("Handler for %s notification failed", channel)
+
+
+def _messages(pending: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """The NOTIFY message of each pending payload, with oversized ones replaced by one resync per channel"""
+    messages = []
+    resynced = set()
+    for channel, payload in pending:
+        if len(payload.encode()) <= MAX_PAYLOAD_BYTES:
+            messages.append((channel, f"{WORKER_ID}:{payload}"))
+            continue
+        registry.inc("notification_oversized_payloads_total", (("channel", channel),))
+        logger.warning(
+            "%s notification of %d bytes is too big for NOTIFY; resyncing instead", channel, len(payload.encode())
+        )
+        if channel not in resynced:
+            resynced.add(channel)
+            messages.append((channel, WORKER_ID))
+    return messages
+
+
+@event.listens_for(SessionLocal, "before_commit")
+def _notify_other_workers(session: Session) -> None:
+    pending = session.info.get("notifications")
+    if not pending or session.in_nested_transaction() or session.get_bind().dialect.name != "postgresql":
+        return
+    messages = _messages(pending)
+    session.execute(
+        text(
+            "SELECT pg_notify(channel, message)"
+            " FROM unnest(CAST(:channels AS text[]), CAST(:messages AS text[])) AS sent (channel, message)"
+        ),
+        {
+            "channels": [channel for channel, _ in messages],
+            "messages": [message for _, message in messages],
+        },
+    )
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _dispatch_committed(session: Session) -> None:
+    for channel, payload in session.info.pop("notifications", ()):
+        _dispatch(channel, payload)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_rolled_back(session: Session) -> None:
+    session.info.pop("notifications", None)
+
+
+def _resync(channel: str) -> None:
+    callback = resync_handlers.get(channel)
+    if callback is None:
+        return
+    try:
+        callback()
+    except Exception:
+        logger.exception("Resync of %s failed", channel)
+
+
+def resync() -> None:
+    for channel in list(resync_handlers):
+        _resync(channel)
+
+
+class Listener:
+    """The LISTEN connection of this worker, on a thread of its own (PostgreSQL only)"""
+
+    def __init__(self, poll_seconds: float = 5.0, max_retry_seconds: float = 30.0):
+        self.poll_seconds = poll_seconds
+        self.max_retry_seconds = max_retry_seconds
+        # Set while LISTEN is active
+        self.listening = threading.Event()
+        self.backend_pid: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        # Wakes the listener out of select() on stop(); made per worker, after any fork
+        self._wake_read, self._wake_write = os.pipe()
+        self._thread = threading.Thread(target=self._run, name="notification-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        os.write(self._wake_write, b"x")
+        self._thread.join()
+        self._thread = None
+        os.close(self._wake_read)
+        os.close(self._wake_write)
+
+    def _run(self) -> None:
+        connected_before = False
+        retry_seconds = 1.0
+        while not self._stop.is_set():
+            try:
+                self._listen(connected_before)
+            except Exception:
+                logger.warning(
+                    "Notification listener lost its connection; reconnecting in %.0fs", retry_seconds, exc_info=True
+                )
+            finally:
+                if self.listening.is_set():
+                    connected_before = True
+                    retry_seconds = 1.0
+                self.listening.clear()
+                self.backend_pid = None
+            if self._stop.wait(retry_seconds):
+                break
+            retry_seconds = min(retry_seconds * 2, self.max_retry_seconds)
+
+    def _listen(self, reconnected: bool) -> None:
+        connection = engine.raw_connection()
+        connection.detach()  # held for the life of the worker, so keep it out of the pool
+        try:
+            dbapi_connection = connection.dbapi_connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                for channel in handlers:
+                    cursor.execute(f"LISTEN {channel}")
+                cursor.execute("SELECT pg_backend_pid()")
+                self.backend_pid = cursor.fetchone()[0]
+            if reconnected:
+                registry.inc("notification_listener_reconnects_total")
+                logger.info("Notification listener reconnected; resyncing caches")
+                resync()
+            self.listening.set()
+            while not self._stop.is_set():
+                readable, _, _ = select.select([dbapi_connection, self._wake_read], [], [], self.poll_seconds)
+                if not readable:
+                    # Quiet for a while: make sure the connection is still there
+                    with dbapi_connection.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                    continue
+                if dbapi_connection not in readable:
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    notification = dbapi_connection.notifies.pop(0)
+                    sender, separator, payload = notification.payload.partition(":")
+                    if sender == WORKER_ID:
+                        continue
+                    if separator:
+                        _dispatch(notification.channel, payload)
+                    else:
+                        _resync(notification.channel)
+        finally:
+            connection.close()
+
+    def gauges(self) -> Dict[Labels, float]:
+        return {(): 1 if self.listening.is_set() else 0}
+
+
+listener = Listener()
+registry.register_gauge(
+    "notification_listener_connected", "Whether this worker is listening for other workers' notifications.",
+    listener.gauges
+)
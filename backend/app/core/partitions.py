@@ -0,0 +1,120 @@
+"""
+Monthly partitions of the bookings table (PostgreSQL only).
+
+On PostgreSQL ``bookings`` is partitioned by the UTC month of
+``start_datetime``, so reads bounded by start time only scan the months they
+can match, and each month's indexes stay small. Rows outside every monthly
+partition land in ``bookings_default``. The archiver keeps partitions
+BOOKING_PARTITION_MONTHS_AHEAD months ahead of today; when it creates a
+month, that month's rows move out of the default partition. It also drops past
+partitions once archiving has emptied them. Each partition is created or
+dropped in a transaction of its own, so one that cannot get its lock leaves
+the ones done before it in place. Elsewhere bookings is a plain
+table and these functions do nothing.
+"""
+import logging
+from datetime import date
+from typing import List, Set
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Transaction
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger(__name__)
+
+TABLE = "bookings"
+DEFAULT_PARTITION = "bookings_default"
+# Partition DDL locks bookings; give up and retry on the next run rather than queue behind traffic
+LOCK_TIMEOUT = "2s"
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_p{month:%Y_%m}"
+
+
+def is_partition(table_name: str) -> bool:
+    """Whether ``table_name`` is one of the partitions of bookings, which the models do not describe"""
+    return table_name == DEFAULT_PARTITION or table_name.startswith(f"{TABLE}_p")
+
+
+def _bound(month: date) -> str:
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def _transaction(connection: Connection) -> Transaction:
+    """A transaction of its own, or a savepoint when the caller already has one open"""
+    return connection.begin_nested() if connection.in_transaction() else connection.begin()
+
+
+def existing_partitions(connection: Connection) -> Set[str]:
+    return set(connection.execute(text(
+        "SELECT child.relname FROM pg_inherits"
+        " JOIN pg_class child ON child.oid = pg_inherits.inhrelid"
+        " WHERE pg_inherits.inhparent = CAST(:table AS regclass)"
+    ), {"table": TABLE}).scalars())
+
+
+def create_month_partition(connection: Connection, month: date) -> None:
+    """Attach the partition for ``month``, taking over its rows from the default partition"""
+    name, lower, upper = partition_name(month), _bound(month), _bound(add_months(month, 1))
+    in_month = f"start_datetime >= {lower} AND start_datetime < {upper}"
+    connection.execute(text(f"CREATE TABLE IF NOT EXISTS {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    connection.execute(text(f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_month}"))
+    connection.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_month}"))
+    connection.execute(text(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ({lower}) TO ({upper})"))
+
+
+def ensure_booking_partitions(connection: Connection, first_month: date, last_month: date) -> List[str]:
+    """Create the missing monthly partitions from ``first_month`` through ``last_month``.
+    Pass a connection outside a transaction to commit each month as it is
+    created, or one inside a transaction to create them in savepoints of it.
+    """
+    if connection.dialect.name != "postgresql":
+        return []
+    created = []
+    month = month_start(first_month)
+    while month <= last_month:
+        name = partition_name(month)
+        try:
+            with _transaction(connection):
+                if name not in existing_partitions(connection):
+                    connection.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+                    create_month_partition(connection, month)
+                    created.append(name)
+        except OperationalError:
+            logger.warning("Could not lock bookings to create partition %s; retrying next run", name)
+            break
+        month = add_months(month, 1)
+    return created
+
+
+def drop_empty_booking_partitions(connection: Connection, before: date) -> List[str]:
+    """Drop the monthly partitions that end on or before ``before`` and hold no rows"""
+    if connection.dialect.name != "postgresql":
+        return []
+    with _transaction(connection):
+        names = sorted(existing_partitions(connection) - {DEFAULT_PARTITION})
+    dropped = []
+    for name in names:
+        year, month = name[len(TABLE) + 2:].split("_")
+        if add_months(date(int(year), int(month), 1), 1) > before:
+            continue
+        try:
+            with _transaction(connection):
+                if connection.execute(text(f"SELECT EXISTS (SELECT 1 FROM {name})")).scalar():
+                    continue
+                connection.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+                connection.execute(text(f"DROP TABLE IF EXISTS {name}"))
+        except OperationalError:
+            logger.warning("Could not lock bookings to drop partition %s; retrying next run", name)
+            break
+        dropped.append(name)
+    return dropped
@@ -0,0 +1,105 @@
+"""
+Per-request SQL statistics collected from SQLAlchemy engine events.
+
+The middleware starts a QueryStats for every HTTP request in a context variable.
+Sync endpoints and dependencies run in the threadpool with a copy of that
+context, so every statement they execute is attributed to the request.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_current_stats: ContextVar[Optional["QueryStats"]] = ContextVar("query_stats", default=None)
+
+SERVER_TIMING_PATTERN = re.compile(r'db;desc="(\d+) queries"')
+
+
+class QueryStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.duration = 0.0
+        self.statements: Counter = Counter()
+
+    def record(self, statement: str, duration: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.duration += duration
+            self.statements[statement] += 1
+
+    def server_timing(self) -> str:
+        return f'db;desc="{self.count} queries";dur={self.duration * 1000:.2f}'
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current_stats.get()
+
+
+def instrument_engine(engine) -> None:
+    """Attribute every statement executed on ``engine`` to the current request"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current_stats.get() is not None:
+            conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = _current_stats.get()
+        starts = conn.info.get("query_start")
+        if stats is not None and starts:
+            stats.record(statement, time.perf_counter() - starts.pop())
+
+
+def query_count(server_timing: Optional[str]) -> Optional[int]:
+    """Read the query count back out of a ``Server-Timing`` header value"""
+    match = SERVER_TIMING_PATTERN.search(server_timing or "")
+    return int(match.group(1)) if match else None
+
+
+class QueryStatsMiddleware:
+    """Adds a ``Server-Timing`` header with query count and DB time and warns about N+1 patterns"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current_stats.set(stats)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", stats.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_stats.reset(token)
+            self._check_repeats(scope, stats)
+
+    def _check_repeats(self, scope, stats: QueryStats) -> None:
+        threshold = settings.SQL_REPEATED_STATEMENT_THRESHOLD
+        if not threshold or not stats.statements:
+            return
+        statement, repeats = stats.statements.most_common(1)[0]
+        if repeats > threshold:
+            route = getattr(scope.get("route"), "path", scope.get("path"))
+            logger.warning(
+                "Possible N+1 query: %s %s ran the same statement %d times (%d queries total): %s",
+                scope["method"], route, repeats, stats.count, " ".join(statement.split())[:200]
+            )
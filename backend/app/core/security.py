@@ -1,3 +1,6 @@
+import base64
+import hashlib
+import hmac
 from datetime import datetime, timedelta
 from typing import Any, Union
 from jose import jwt
@@ -26,3 +29,15 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
+
+def calendar_feed_token(kind: str, feed_id: int, salt: str) -> str:
+    """
+    Token for a calendar feed URL; calendar clients cannot send a bearer token.
+    Rotating the feed owner's salt revokes every URL signed with the old one.
+    """
+    message = f"calendar:{kind}:{feed_id}" + (f":{salt}" if salt else "")
+    digest = hmac.new(settings.SECRET_KEY.encode(), message.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:18]).decode()
+
+def verify_calendar_feed_token(kind: str, feed_id: int, salt: str, token: str) -> bool:
+    return hmac.compare_digest(calendar_feed_token(kind, feed_id, salt), token)
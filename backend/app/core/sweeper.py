@@ -0,0 +1,72 @@
+"""
+Background sweeper for pending bookings whose hold ran out.
+
+Pending bookings block their slot until an admin confirms them. Once a
+booking has been pending for longer than PENDING_BOOKING_HOLD_MINUTES the
+sweeper marks it ``expired`` so the slot frees up. Work is done in batches of
+EXPIRY_SWEEP_BATCH_SIZE, each in its own short transaction, so no sweep holds
+locks on many rows at once. Expired idempotency keys are purged on the same schedule.
+Every worker runs the sweeper, but only the one that takes its advisory lock
+(see app.core.database.job_lock) sweeps in a given interval.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.core.database import SessionLocal, job_lock
+from app.core.metrics import registry
+from app.crud import booking as crud_booking
+from app.crud import idempotency as crud_idempotency
+
+logger = logging.getLogger(__name__)
+
+registry.describe("bookings_expired_total", "Pending bookings expired by the sweeper.")
+registry.describe("booking_expiry_batches_total", "UPDATE batches run by the expiry sweeper.")
+registry.describe("booking_expiry_sweep_duration_seconds", "Duration of expiry sweeps.")
+
+
+def sweep_expired_bookings() -> int:
+    """Expire every pending booking past its hold, batch by batch; returns how many were expired"""
+    if settings.PENDING_BOOKING_HOLD_MINUTES <= 0:
+        return 0
+    with job_lock("booking_expiry_sweep") as acquired:
+        if not acquired:
+            logger.debug("Expiry sweep skipped; another worker is running it")
+            return 0
+        return _sweep()
+
+
+def _sweep() -> int:
+    started = time.perf_counter()
+    cutoff = datetime.now(timezone.utc) - timedelta(minutes=settings.PENDING_BOOKING_HOLD_MINUTES)
+    batch_size = settings.EXPIRY_SWEEP_BATCH_SIZE
+    expired = 0
+    db = SessionLocal()
+    try:
+        for _ in range(settings.EXPIRY_SWEEP_MAX_BATCHES):
+            count = crud_booking.expire_pending_bookings(db, cutoff, batch_size)
+            registry.inc("booking_expiry_batches_total")
+            expired += count
+            if count < batch_size:
+                break
+        crud_idempotency.delete_expired_idempotency_keys(db)
+    finally:
+        db.close()
+        registry.inc("bookings_expired_total", amount=expired)
+        registry.observe("booking_expiry_sweep_duration_seconds", (), time.perf_counter() - started)
+
+    if expired:
+        logger.info("Expired %d pending bookings older than %s", expired, cutoff.isoformat())
+    return expired
+
+
+async def run_sweeper() -> None:
+    """Sweep every EXPIRY_SWEEP_INTERVAL_SECONDS until cancelled"""
+    while True:
+        try:
+            await run_in_threadpool(sweep_expired_bookings)
+        except Exception:
+            logger.exception("Expiry sweep failed")
+        await asyncio.sleep(settings.EXPIRY_SWEEP_INTERVAL_SECONDS)
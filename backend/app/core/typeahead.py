@@ -0,0 +1,176 @@
+"""
+Typeahead suggestions for venue names and cities.
+
+The search box asks for suggestions on every keystroke, so they are answered
+from memory without touching the database. The index is a sorted list of
+folded terms, meaning lowercased with accents removed: "Břeclav" is found as
+"brec". Every word of a venue name starts a term, so "Hotel Avanti" is found
+by "ava" as well. A prefix lookup is a binary search. The index is loaded once
+per worker (at warm-up, or on the first lookup). After that, every venue write
+updates it in every worker when it commits (see app.core.notifications). It is
+loaded again when changes from other workers may have been missed.
+"""
+import json
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Callable, Dict, Hashable, Iterable, List, Tuple
+from sqlalchemy.orm import Session
+from app.core import notifications
+
+NOTIFY_CHANNEL = "venue_typeahead"
+
+WORD = re.compile(r"\w+")
+
+# (term, word position, kind, key): kind "city" keys on the folded city, "venue" on the venue id
+Term = Tuple[str, int, str, Hashable]
+
+
+def fold(value: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold().strip()
+
+
+def _terms(value: str, kind: str, key: Hashable) -> List[Term]:
+    folded = fold(value)
+    return [(folded[match.start():], position, kind, key) for position, match in enumerate(WORD.finditer(folded))]
+
+
+class TypeaheadIndex:
+    def __init__(self):
+        self._terms: List[Term] = []
+        self._venues: Dict[int, Tuple[str, str]] = {}
+        # folded city -> {venue_id: city as spelled by that venue}
+        self._cities: Dict[str, Dict[int, str]] = {}
+        self._loaded = False
+        # Changes committed while the index loads, replayed on top of what it loaded
+        self._pending: List[dict] = []
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self, venues: Callable[[], Iterable[Tuple[int, str, str]]]) -> None:
+        """Fill the index from ``venues`` (id, name, city of the active venues) unless already loaded"""
+        with self._load_lock:
+            if self._loaded:
+                return
+            rows = list(venues())
+            with self._lock:
+                for venue_id, name, city in rows:
+                    self._add(venue_id, name, city, insert=list.append)
+                self._terms.sort()
+                for change in self._pending:
+                    self._apply(change)
+                self._pending = []
+                self._loaded = True
+
+    def reset(self) -> None:
+        """Forget every venue; the next lookup loads the index again"""
+        with self._load_lock, self._lock:
+            self._terms = []
+            self._venues = {}
+            self._cities = {}
+            self._pending = []
+            self._loaded = False
+
+    def apply(self, change: dict) -> None:
+        """Apply a venue's new state: ``{"id", "name", "city", "is_active"}``"""
+        with self._lock:
+            if self._loaded:
+                self._apply(change)
+            else:
+                self._pending.append(change)
+
+    def _apply(self, change: dict) -> None:
+        self._remove(change["id"])
+        if change["is_active"]:
+            self._add(change["id"], change["name"], change["city"])
+
+    def _add(self, venue_id: int, name: str, city: str, insert: Callable[[list, Term], None] = insort) -> None:
+        self._venues[venue_id] = (name, city)
+        for term in _terms(name, "venue", venue_id):
+            insert(self._terms, term)
+        spellings = self._cities.setdefault(fold(city), {})
+        if not spellings:
+            for term in _terms(city, "city", fold(city)):
+                insert(self._terms, term)
+        spellings[venue_id] = city
+
+    def _remove(self, venue_id: int) -> None:
+        venue = self._venues.pop(venue_id, None)
+        if venue is None:
+            return
+        name, city = venue
+        for term in _terms(name, "venue", venue_id):
+            self._discard(term)
+        spellings = self._cities.get(fold(city), {})
+        spellings.pop(venue_id, None)
+        if not spellings:
+            self._cities.pop(fold(city), None)
+            for term in _terms(city, "city", fold(city)):
+                self._discard(term)
+
+    def _discard(self, term: Term) -> None:
+        index = bisect_left(self._terms, term)
+        if index < len(self._terms) and self._terms[index] == term:
+            del self._terms[index]
+
+    def suggest(self, query: str, limit: int) -> List[dict]:
+        """Cities and venues with a word starting with ``query``, in alphabetical order of the match"""
+        prefix = fold(query)
+        if not prefix:
+            return []
+        suggestions = []
+        seen = set()
+        with self._lock:
+            index = bisect_left(self._terms, (prefix,))
+            while index < len(self._terms) and len(suggestions) < limit:
+                term, _, kind, key = self._terms[index]
+                index += 1
+                if not term.startswith(prefix):
+                    break
+                if (kind, key) in seen:
+                    continue
+                seen.add((kind, key))
+                if kind == "city":
+                    spellings = self._cities[key]
+                    suggestions.append({
+                        "type": "city",
+                        "value": min(spellings.values()),
+                        "venue_count": len(spellings),
+                    })
+                else:
+                    name, city = self._venues[key]
+                    suggestions.append({"type": "venue", "value": name, "venue_id": key, "city": city})
+        return suggestions
+
+
+index = TypeaheadIndex()
+
+
+def _load_active_venues() -> List[Tuple[int, str, str]]:
+    from app.core.database import SessionLocal
+    from app.models.models import Venue
+    db = SessionLocal()
+    try:
+        return [tuple(row) for row in db.query(Venue.id, Venue.name, Venue.city).filter(Venue.is_active == True)]
+    finally:
+        db.close()
+
+
+def ensure_loaded() -> None:
+    index.load(_load_active_venues)
+
+
+def track_venue_write(db: Session, venue) -> None:
+    """Update the typeahead index of every worker with ``venue``'s new state once ``db`` commits"""
+    notifications.publish_on_commit(db, NOTIFY_CHANNEL, json.dumps({
+        "id": venue.id, "name": venue.name, "city": venue.city, "is_active": bool(venue.is_active),
+    }))
+
+
+notifications.register(NOTIFY_CHANNEL, lambda payload: index.apply(json.loads(payload)), resync=index.reset)
@@ -0,0 +1,122 @@
+"""
+Cache of public venue search responses.
+
+``GET /venues/`` is the busiest route, and the same few searches repeat. Each
+worker keeps serialized VenueList responses, keyed by the normalized search
+and page, in an LRU bounded to VENUE_SEARCH_CACHE_MAX_BYTES. Entries expire
+after VENUE_SEARCH_CACHE_TTL_SECONDS. Any venue write also clears the cache
+in every worker once it commits (see app.core.notifications). Hits and misses
+are counted in ``venue_search_cache_requests_total``.
+"""
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Dict, Hashable, Iterable, NamedTuple, Optional, Tuple
+from sqlalchemy.orm import Session
+from app.core import notifications
+from app.core.config import settings
+from app.core.metrics import Labels, registry
+from app.schemas.schemas import VenueSearch
+
+NOTIFY_CHANNEL = "venue_search"
+
+registry.describe("venue_search_cache_requests_total", "Venue searches by whether the cache answered them.")
+
+
+def _rate(value: Optional[Decimal]) -> Optional[str]:
+    # Filters skip falsy values, so 0 searches like no filter at all
+    return str(Decimal(value).normalize()) if value else None
+
+
+def search_key(
+    search: VenueSearch, skip: int, limit: int, facets: bool = False, fields: Optional[Iterable[str]] = None
+) -> Tuple:
+    """Searches that run the same query share a key: city case (VenueSearch strips padding), 0 vs. no filter"""
+    city = (search.city or "").lower() or None
+    return (
+        city,
+        search.min_capacity or None,
+        search.max_capacity or None,
+        _rate(search.min_rate),
+        _rate(search.max_rate),
+        skip,
+        limit,
+        facets,
+        None if fields is None else tuple(fields),
+    )
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    expires_at: float
+
+
+class ResponseCache:
+    """LRU of serialized responses bounded by their total size"""
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._size = 0
+        # Bumped by clear(), so a response built before a write is not cached after it
+        self.generation = 0
+        self._cleared_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        registry.inc("venue_search_cache_requests_total", (("result", "miss" if entry is None else "hit"),))
+        return None if entry is None else entry.body
+
+    def put(self, key: Hashable, body: bytes, generation: int) -> None:
+        if len(body) > self.max_bytes:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if generation != self.generation:
+                return
+            # Replicas may still lag behind the write that cleared the cache
+            if settings.DATABASE_REPLICA_URLS and now - self._cleared_at < settings.REPLICA_STICKINESS_SECONDS:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CachedResponse(body, now + self.ttl)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Hashable) -> None:
+        self._size -= len(self._entries.pop(key).body)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.generation += 1
+            self._cleared_at = time.monotonic()
+
+    def gauges(self) -> Dict[Labels, float]:
+        with self._lock:
+            return {(("state", "entries"),): len(self._entries), (("state", "bytes"),): self._size}
+
+
+venue_search_cache = ResponseCache(settings.VENUE_SEARCH_CACHE_MAX_BYTES, settings.VENUE_SEARCH_CACHE_TTL_SECONDS)
+registry.register_gauge("venue_search_cache", "Entries and bytes held by the venue search cache.", venue_search_cache.gauges)
+
+
+def track_venue_write(db: Session) -> None:
+    """Clear the venue search cache of every worker once ``db`` commits"""
+    notifications.publish_on_commit(db, NOTIFY_CHANNEL, "")
+
+
+notifications.register(
+    NOTIFY_CHANNEL, lambda payload: venue_search_cache.clear(), resync=venue_search_cache.clear
+)
@@ -0,0 +1,98 @@
+"""
+Startup warm-up and the startup-time report.
+
+Work that would otherwise land on the first requests a new worker serves is
+done before it accepts traffic: opening database connections, loading the
+bcrypt backend and the JWT code, loading the venue typeahead index, and
+building the OpenAPI schema. Each step is timed; the timings (and the import
+time of the app) are logged, exported as ``app_startup_seconds`` and served
+by ``/health/startup``. A failing step
+is logged and skipped, so a slow dependency delays nothing but itself.
+"""
+import logging
+import time
+from typing import Callable, Dict, List
+from fastapi import FastAPI
+from app.core.config import settings
+from app.core.database import engine, replica_router
+from app.core.metrics import Labels, registry
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    def __init__(self, import_seconds: float):
+        self.phases: Dict[str, float] = {"import": import_seconds}
+        self.failed: List[str] = []
+        self.ready = False
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.phases.values())
+
+    def as_dict(self) -> dict:
+        return {
+            "ready": self.ready,
+            "total_seconds": round(self.total_seconds, 4),
+            "phases": {phase: round(seconds, 4) for phase, seconds in self.phases.items()},
+            "failed": self.failed,
+        }
+
+    def gauge(self) -> Dict[Labels, float]:
+        return {(("phase", phase),): seconds for phase, seconds in self.phases.items()}
+
+
+def warm_database_pool() -> None:
+    """Open STARTUP_WARM_DB_CONNECTIONS primary connections (one per replica) and keep them pooled"""
+    connections = []
+    count = settings.STARTUP_WARM_DB_CONNECTIONS
+    if hasattr(engine.pool, "size"):
+        count = min(count, engine.pool.size())  # more would only be closed again as overflow
+    try:
+        for _ in range(count):
+            connections.append(engine.connect())
+        for replica in replica_router.engines:
+            connections.append(replica.connect())
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def warm_security() -> None:
+    from app.core.security import ALGORITHM, create_access_token, pwd_context
+    from jose import jwt
+    pwd_context.handler().get_backend()
+    jwt.decode(create_access_token("warmup"), settings.SECRET_KEY, algorithms=[ALGORITHM])
+
+
+def warm_typeahead() -> None:
+    from app.core import typeahead
+    typeahead.ensure_loaded()
+
+
+def warm_up(app: FastAPI, report: StartupReport) -> None:
+    """Run the warm-up steps, recording how long each took"""
+    steps: List[tuple] = [
+        ("database_pool", warm_database_pool),
+        ("security", warm_security),
+        ("typeahead", warm_typeahead),
+        ("openapi", app.openapi),
+    ]
+    for phase, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception("Warm-up step %s failed", phase)
+            report.failed.append(phase)
+        report.phases[phase] = time.perf_counter() - started
+
+
+def finish(report: StartupReport) -> None:
+    report.ready = True
+    registry.register_gauge("app_startup_seconds", "Time spent starting the worker, by phase.", report.gauge)
+    logger.info(
+        "Worker ready in %.3fs (%s)",
+        report.total_seconds,
+        ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in report.phases.items())
+    )
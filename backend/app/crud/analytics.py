@@ -0,0 +1,138 @@
+from typing import Optional, List, TYPE_CHECKING
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, func, select
+from datetime import datetime, timezone
+from app.models.models import Booking
+from app.crud.queries import active_bookings, booking_overlaps
+
+# numpy is imported where it is used, so workers only load it once a heatmap is requested
+if TYPE_CHECKING:
+    import numpy as np
+
+HOURS_PER_WEEK = 7 * 24
+VENUE_CHUNK_SIZE = 256
+# Venue-hours rasterized at once; bounds the working arrays (tens of MB) for any period length
+MAX_CHUNK_SLOTS = 2 ** 20
+
+
+def _epoch(db: Session, column):
+    if db.get_bind().dialect.name == "postgresql":
+        return func.extract("epoch", column)
+    return (func.julianday(column) - 2440587.5) * 86400
+
+
+def _utc_timestamp(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def load_booking_intervals(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    venue_ids: Optional[List[int]] = None
+) -> "np.ndarray":
+    """Active bookings overlapping ``[start, end)`` as an (n, 3) array of venue id, start and end epoch seconds"""
+    query = select(
+        Booking.venue_id,
+        _epoch(db, Booking.start_datetime),
+        _epoch(db, Booking.end_datetime),
+    ).where(
+        and_(
+            active_bookings(),
+            booking_overlaps(db, start, end),
+        )
+    )
+    if venue_ids:
+        query = query.where(Booking.venue_id.in_(venue_ids))
+
+    import numpy as np
+
+    rows = db.execute(query).all()
+    return np.array(rows, dtype=np.float64).reshape(len(rows), 3)
+
+
+def rasterize_hour_of_week(
+    intervals: "np.ndarray",
+    start: datetime,
+    end: datetime,
+    venue_ids: Optional[List[int]] = None
+) -> dict:
+    """Fold booking intervals into a venue x hour-of-week (UTC) occupancy matrix.
+
+    Every venue gets an hourly bitmap over the period. A slot is occupied when
+    any active booking touches it, so overlapping bookings count once. Each
+    cell is the share of that hour-of-week's occurrences that were occupied.
+    """
+    import numpy as np
+
+    origin = np.floor(_utc_timestamp(start) / 3600) * 3600
+    slot_count = max(int(np.ceil((_utc_timestamp(end) - origin) / 3600)), 0)
+
+    interval_venues = intervals[:, 0].astype(np.int64)
+    if venue_ids:
+        venues = np.unique(np.asarray(venue_ids, dtype=np.int64))
+        known = np.isin(interval_venues, venues)
+        intervals = intervals[known]
+        venue_index = np.searchsorted(venues, interval_venues[known])
+    else:
+        venues, venue_index = np.unique(interval_venues, return_inverse=True)
+
+    first_slot = np.clip(np.floor((intervals[:, 1] - origin) / 3600), 0, slot_count).astype(np.int64)
+    last_slot = np.clip(np.ceil((intervals[:, 2] - origin) / 3600), 0, slot_count).astype(np.int64)
+
+    origin_utc = datetime.fromtimestamp(origin, tz=timezone.utc)
+    origin_hour = origin_utc.weekday() * 24 + origin_utc.hour
+    hour_of_week = (origin_hour + np.arange(slot_count)) % HOURS_PER_WEEK
+    occurrences = np.bincount(hour_of_week, minlength=HOURS_PER_WEEK)
+
+    padded_slots = -(-(origin_hour + slot_count) // HOURS_PER_WEEK) * HOURS_PER_WEEK
+    occupied = np.zeros((len(venues), HOURS_PER_WEEK), dtype=np.int64)
+    # Long periods rasterize fewer venues at a time, down to one
+    chunk_size = max(1, min(VENUE_CHUNK_SIZE, MAX_CHUNK_SLOTS // (padded_slots + 1)))
+    for chunk_start in range(0, len(venues), chunk_size):
+        chunk_end = min(chunk_start + chunk_size, len(venues))
+        in_chunk = (venue_index >= chunk_start) & (venue_index < chunk_end)
+        rows = venue_index[in_chunk] - chunk_start
+
+        # +1 where a booking starts, -1 where it ends; a running sum gives the bitmap
+        size = (chunk_end - chunk_start) * (slot_count + 1)
+        offsets = rows * (slot_count + 1)
+        edges = np.bincount(offsets + first_slot[in_chunk], minlength=size) - \
+            np.bincount(offsets + last_slot[in_chunk], minlength=size)
+        edges = edges.reshape(chunk_end - chunk_start, slot_count + 1)
+        bitmap = np.cumsum(edges, axis=1)[:, :slot_count] > 0
+
+        # Pad the bitmap to whole weeks starting on Monday 00:00, then fold the weeks
+        weeks = np.zeros((chunk_end - chunk_start, padded_slots), dtype=np.int32)
+        weeks[:, origin_hour:origin_hour + slot_count] = bitmap
+        occupied[chunk_start:chunk_end] = weeks.reshape(
+            chunk_end - chunk_start, -1, HOURS_PER_WEEK
+        ).sum(axis=1)
+
+    occupancy = np.divide(
+        occupied,
+        occurrences,
+        out=np.zeros(occupied.shape, dtype=np.float64),
+        where=occurrences > 0
+    )
+
+    return {
+        "venue_ids": venues.tolist(),
+        "occurrences": occurrences.tolist(),
+        "occupied_hours": occupied.tolist(),
+        "occupancy": np.round(occupancy, 4).tolist(),
+    }
+
+
+def get_occupancy_heatmap(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    venue_ids: Optional[List[int]] = None
+) -> dict:
+    intervals = load_booking_intervals(db, start, end, venue_ids)
+    heatmap = rasterize_hour_of_week(intervals, start, end, venue_ids)
+    heatmap.update(start=start, end=end)
+    return heatmap
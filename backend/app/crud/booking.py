@@ -1,23 +1,52 @@
-from typing import Optional, List
+from typing import Iterable, Optional, List, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy import and_, or_, delete, func, insert, select, update
 from datetime import datetime
 from decimal import Decimal
-from app.models.models import Booking, Venue
-from app.schemas.schemas import BookingCreate, BookingUpdate
-from app.crud.venue import check_venue_availability
+import math
+from app.models.models import ACTIVE_BOOKING_STATUSES, Booking, BookingArchive
+from app.crud.queries import active_bookings, booking_overlaps, load_fields, pending_bookings
+from app.schemas.schemas import BookingCreate, BookingUpdate, BookingQuoteItem
+from app.crud.venue import check_venue_availability, get_venue_rates
+from app.core import availability, calendar_feeds
+from app.crud import report
 
 
-def get_booking(db: Session, booking_id: int) -> Optional[Booking]:
-    return db.query(Booking).filter(Booking.id == booking_id).first()
+def record_booking_changes(
+    db: Session,
+    changes: Iterable[Tuple[Optional[report.BookingSnapshot], Optional[report.BookingSnapshot]]]
+) -> None:
+    """The hook every booking write calls with its (before, after) snapshots, before it commits.
 
+    Folds the changes into the rollups and has live availability streams and
+    calendar feeds hear about them once the write commits.
+    """
+    changes = list(changes)
+    report.apply_booking_changes(db, changes)
+    availability.track_booking_changes(db, changes)
+    calendar_feeds.track_booking_changes(db, changes)
 
-def get_bookings(db: Session, skip: int = 0, limit: int = 100) -> List[Booking]:
-    return db.query(Booking).offset(skip).limit(limit).all()
 
+def get_booking(db: Session, booking_id: int, fields: Optional[Iterable[str]] = None) -> Optional[Booking]:
+    return db.query(Booking).options(*load_fields(Booking, fields)).filter(Booking.id == booking_id).first()
 
-def get_user_bookings(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[Booking]:
-    return db.query(Booking).filter(Booking.user_id == user_id).offset(skip).limit(limit).all()
+
+def get_archived_booking(db: Session, booking_id: int) -> Optional[BookingArchive]:
+    return db.get(BookingArchive, booking_id)
+
+
+def get_bookings(
+    db: Session, skip: int = 0, limit: int = 100, fields: Optional[Iterable[str]] = None
+) -> List[Booking]:
+    return db.query(Booking).options(*load_fields(Booking, fields)).offset(skip).limit(limit).all()
+
+
+def get_user_bookings(
+    db: Session, user_id: int, skip: int = 0, limit: int = 100, fields: Optional[Iterable[str]] = None
+) -> List[Booking]:
+    query = db.query(Booking).options(*load_fields(Booking, fields)).filter(Booking.user_id == user_id)
+    return query.offset(skip).limit(limit).all()
 
 
 def get_venue_bookings(
@@ -28,31 +57,47 @@ def get_venue_bookings(
     skip: int = 0, 
     limit: int = 100
 ) -> List[Booking]:
+    """Bookings of a venue whose period overlaps ``[start_date, end_date)``, in start order"""
     query = db.query(Booking).filter(Booking.venue_id == venue_id)
     
-    if start_date:
-        query = query.filter(Booking.start_datetime >= start_date)
-    if end_date:
-        query = query.filter(Booking.end_datetime <= end_date)
+    if start_date or end_date:
+        query = query.filter(booking_overlaps(db, start_date, end_date))
     
-    return query.offset(skip).limit(limit).all()
+    return query.order_by(Booking.start_datetime).offset(skip).limit(limit).all()
+
+
+def billable_hours(start_datetime: datetime, end_datetime: datetime) -> int:
+    """Booking duration rounded up to the nearest hour for billing"""
+    duration = end_datetime - start_datetime
+    return math.ceil(duration.total_seconds() / 3600)
 
 
 def calculate_booking_cost(db: Session, venue_id: int, start_datetime: datetime, end_datetime: datetime) -> Decimal:
     """Calculate the total cost for a booking based on venue hourly rate and duration"""
-    venue = db.query(Venue).filter(Venue.id == venue_id).first()
-    if not venue:
+    hourly_rate = get_venue_rates(db, [venue_id]).get(venue_id)
+    if hourly_rate is None:
         raise ValueError("Venue not found")
     
-    # Calculate duration in hours
-    duration = end_datetime - start_datetime
-    hours = duration.total_seconds() / 3600
-    
-    # Round up to the nearest hour for billing
-    import math
-    hours = math.ceil(hours)
+    return hourly_rate * Decimal(billable_hours(start_datetime, end_datetime))
+
+
+def quote_bookings(db: Session, items: List[BookingQuoteItem]) -> List[dict]:
+    """Price several venue/time slot combinations with a single rate lookup"""
+    rates = get_venue_rates(db, [item.venue_id for item in items], active_only=True)
     
-    return venue.hourly_rate * Decimal(hours)
+    quotes = []
+    for item in items:
+        hourly_rate = rates.get(item.venue_id)
+        if hourly_rate is None:
+            raise ValueError(f"Venue {item.venue_id} not found")
+        hours = billable_hours(item.start_datetime, item.end_datetime)
+        quotes.append({
+            **item.dict(),
+            "hours": hours,
+            "hourly_rate": hourly_rate,
+            "total_cost": hourly_rate * Decimal(hours),
+        })
+    return quotes
 
 
 def create_booking(db: Session, booking: BookingCreate, user_id: int) -> Optional[Booking]:
@@ -75,21 +120,62 @@ def create_booking(db: Session, booking: BookingCreate, user_id: int) -> Optiona
     )
     
     db.add(db_booking)
+    record_booking_changes(db, [(None, report.snapshot(db_booking))])
     db.commit()
     db.refresh(db_booking)
     return db_booking
 
 
-def update_booking(db: Session, booking_id: int, booking_update: BookingUpdate, user_id: int) -> Optional[Booking]:
-    db_booking = db.query(Booking).filter(
-        and_(Booking.id == booking_id, Booking.user_id == user_id)
-    ).first()
-    
+# Changing any of these moves the booking between rollup buckets
+ROLLUP_FIELDS = {"start_datetime", "end_datetime", "status"}
+
+
+def _booking_filters(booking_id: int, user_id: Optional[int] = None, version: Optional[int] = None) -> list:
+    filters = [Booking.id == booking_id]
+    if user_id is not None:
+        filters.append(Booking.user_id == user_id)
+    if version is not None:
+        filters.append(Booking.version == version)
+    return filters
+
+
+def _update_returning(db: Session, filters: list, values: dict) -> Optional[Booking]:
+    """UPDATE the booking matching ``filters`` and return its new state in the same round trip"""
+    return db.execute(
+        update(Booking)
+        .where(*filters)
+        .values(**values, version=Booking.version + 1, updated_at=func.now())
+        .returning(Booking)
+    ).scalar_one_or_none()
+
+
+def update_booking(
+    db: Session,
+    booking_id: int,
+    booking_update: BookingUpdate,
+    user_id: Optional[int],
+    version: Optional[int] = None
+) -> Optional[Booking]:
+    """Update a booking of ``user_id`` (of anyone when None), at ``version`` if given.
+
+    Returns None when no such booking matched or the new time slot is taken.
+    Updates that leave time and status alone are a single UPDATE ... RETURNING.
+    """
+    update_data = booking_update.dict(exclude_unset=True)
+    filters = _booking_filters(booking_id, user_id, version)
+    if not update_data.keys() & ROLLUP_FIELDS:
+        db_booking = _update_returning(db, filters, update_data)
+        if db_booking is not None:
+            # Same time and status: nothing for rollups or availability, but the feeds show it
+            after = report.snapshot(db_booking)
+            record_booking_changes(db, [(after, after)])
+        db.commit()
+        return db_booking
+
+    db_booking = db.query(Booking).filter(*filters).first()
     if not db_booking:
         return None
     
-    update_data = booking_update.dict(exclude_unset=True)
-    
     # If datetime is being updated, check availability and recalculate cost
     if 'start_datetime' in update_data or 'end_datetime' in update_data:
         start_datetime = update_data.get('start_datetime', db_booking.start_datetime)
@@ -102,41 +188,188 @@ def update_booking(db: Session, booking_id: int, booking_update: BookingUpdate,
         total_cost = calculate_booking_cost(db, db_booking.venue_id, start_datetime, end_datetime)
         update_data['total_cost'] = total_cost
     
-    for key, value in update_data.items():
-        setattr(db_booking, key, value)
+    before = report.snapshot(db_booking)
+    read_version = db_booking.version
+    db_booking = _update_returning(db, _booking_filters(booking_id, version=read_version), update_data)
+    if db_booking is None:
+        raise StaleDataError(f"Booking {booking_id} changed after it was read at version {read_version}")
+    record_booking_changes(db, [(before, report.snapshot(db_booking))])
     
     db.commit()
-    db.refresh(db_booking)
     return db_booking
 
 
-def cancel_booking(db: Session, booking_id: int, user_id: int) -> Optional[Booking]:
-    db_booking = db.query(Booking).filter(
-        and_(Booking.id == booking_id, Booking.user_id == user_id)
-    ).first()
-    
-    if db_booking and db_booking.status in ["pending", "confirmed"]:
-        db_booking.status = "cancelled"
-        db.commit()
-        db.refresh(db_booking)
-    
+def cancel_booking(db: Session, booking_id: int, user_id: Optional[int]) -> Optional[Booking]:
+    """Cancel a pending or confirmed booking of ``user_id`` (of anyone when None).
+
+    Returns None when no such booking can be cancelled. On PostgreSQL this is
+    one UPDATE that also returns the previous status for the rollups, like
+    bulk_transition_bookings(). SQLite cannot return columns of the FROM
+    clause, so there it tries one previous status per UPDATE.
+    """
+    filters = _booking_filters(booking_id, user_id)
+    db_booking = status = None
+    if db.get_bind().dialect.name == "postgresql":
+        prior = select(Booking.id, Booking.status).where(active_bookings(), *filters).with_for_update().subquery()
+        row = db.execute(
+            update(Booking)
+            .where(Booking.id == prior.c.id)
+            .values(status="cancelled", version=Booking.version + 1, updated_at=func.now())
+            .returning(Booking, prior.c.status)
+        ).one_or_none()
+        if row is not None:
+            db_booking, status = row
+    else:
+        for status in ACTIVE_BOOKING_STATUSES:
+            db_booking = _update_returning(db, filters + [Booking.status == status], {"status": "cancelled"})
+            if db_booking is not None:
+                break
+    if db_booking is None:
+        return None
+    after = report.snapshot(db_booking)
+    record_booking_changes(db, [(after._replace(status=status), after)])
+    db.commit()
     return db_booking
 
 
 def confirm_booking(db: Session, booking_id: int) -> Optional[Booking]:
     """Admin function to confirm a booking"""
-    db_booking = db.query(Booking).filter(Booking.id == booking_id).first()
-    
-    if db_booking and db_booking.status == "pending":
-        db_booking.status = "confirmed"
+    filters = _booking_filters(booking_id) + [Booking.status == "pending"]
+    db_booking = _update_returning(db, filters, {"status": "confirmed"})
+    if db_booking is not None:
+        after = report.snapshot(db_booking)
+        record_booking_changes(db, [(after._replace(status="pending"), after)])
         db.commit()
-        db.refresh(db_booking)
-    
     return db_booking
 
 
+def expire_pending_bookings(db: Session, created_before: datetime, limit: int) -> int:
+    """Expire one batch of at most ``limit`` pending bookings created before ``created_before``.
+
+    Each batch is its own short transaction. On PostgreSQL rows locked by
+    a concurrent write are skipped instead of waited for.
+    """
+    stale = (
+        select(Booking.id)
+        .where(pending_bookings(), Booking.created_at < created_before)
+        .order_by(Booking.created_at)
+        .limit(limit)
+    )
+    if db.get_bind().dialect.name == "postgresql":
+        stale = stale.with_for_update(skip_locked=True)
+
+    rows = db.execute(
+        update(Booking)
+        .where(Booking.id.in_(stale.scalar_subquery()), pending_bookings())
+        .values(status="expired", version=Booking.version + 1, updated_at=func.now())
+        .returning(Booking.venue_id, Booking.start_datetime, Booking.end_datetime, Booking.total_cost, Booking.user_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    record_booking_changes(db, [
+        (report.BookingSnapshot(*row[:4], "pending", row.user_id), report.BookingSnapshot(*row[:4], "expired", row.user_id))
+        for row in rows
+    ])
+    db.commit()
+    return len(rows)
+
+
+def bulk_transition_bookings(
+    db: Session,
+    from_statuses: List[str],
+    to_status: str,
+    ids: Optional[List[int]] = None,
+    venue_id: Optional[int] = None,
+    start_from: Optional[datetime] = None,
+    start_before: Optional[datetime] = None
+) -> List[int]:
+    """Move every selected booking in one of ``from_statuses`` to ``to_status``; returns the changed ids.
+
+    PostgreSQL does it in a single UPDATE ... FROM that also returns each row's
+    previous status for the rollups. SQLite cannot return columns of the FROM
+    clause, so there it takes one UPDATE per previous status.
+    """
+    filters = []
+    if ids is not None:
+        filters.append(Booking.id.in_(ids))
+    if venue_id is not None:
+        filters.append(Booking.venue_id == venue_id)
+    if start_from is not None:
+        filters.append(Booking.start_datetime >= start_from)
+    if start_before is not None:
+        filters.append(Booking.start_datetime < start_before)
+
+    values = {"status": to_status, "version": Booking.version + 1, "updated_at": func.now()}
+    returned = (
+        Booking.id, Booking.venue_id, Booking.start_datetime, Booking.end_datetime, Booking.total_cost, Booking.user_id
+    )
+    changes = []
+    if db.get_bind().dialect.name == "postgresql":
+        prior = (
+            select(Booking.id, Booking.status)
+            .where(Booking.status.in_(from_statuses), *filters)
+            .with_for_update()
+            .subquery()
+        )
+        rows = db.execute(
+            update(Booking.__table__)
+            .where(Booking.id == prior.c.id)
+            .values(**values)
+            .returning(*returned, prior.c.status)
+        ).all()
+        changes = [(row[0], row[1:6], row[6]) for row in rows]
+    else:
+        for status in from_statuses:
+            rows = db.execute(
+                update(Booking.__table__)
+                .where(Booking.status == status, *filters)
+                .values(**values)
+                .returning(*returned)
+            ).all()
+            changes.extend((row[0], row[1:6], status) for row in rows)
+
+    record_booking_changes(db, [
+        (
+            report.BookingSnapshot(*columns[:4], status, columns[4]),
+            report.BookingSnapshot(*columns[:4], to_status, columns[4])
+        )
+        for _, columns, status in changes
+    ])
+    db.commit()
+    return sorted(booking_id for booking_id, _, _ in changes)
+
+
 def get_bookings_count(db: Session, user_id: Optional[int] = None) -> int:
-    query = db.query(Booking)
+    query = db.query(func.count(Booking.id))
     if user_id:
         query = query.filter(Booking.user_id == user_id)
-    return query.count()
+    return query.scalar()
+
+
+def archive_bookings(db: Session, ended_before: datetime, inactive_before: datetime, limit: int) -> int:
+    """Move one batch of at most ``limit`` bookings to bookings_archive.
+
+    Archives bookings that ended before ``ended_before``, and cancelled or
+    expired bookings last changed before ``inactive_before``. Rollups keep
+    counting archived bookings. On PostgreSQL rows locked by a concurrent
+    write are left for the next batch.
+    """
+    batch = (
+        select(Booking.id)
+        .where(or_(
+            Booking.end_datetime < ended_before,
+            and_(Booking.status.in_(("cancelled", "expired")), Booking.updated_at < inactive_before),
+        ))
+        .limit(limit)
+    )
+    if db.get_bind().dialect.name == "postgresql":
+        batch = batch.with_for_update(skip_locked=True)
+
+    ids = db.execute(batch).scalars().all()
+    if ids:
+        columns = [column.name for column in Booking.__table__.columns]
+        db.execute(insert(BookingArchive).from_select(
+            columns, select(*Booking.__table__.columns).where(Booking.id.in_(ids))
+        ))
+        db.execute(delete(Booking).where(Booking.id.in_(ids)).execution_options(synchronize_session=False))
+    db.commit()
+    return len(ids)
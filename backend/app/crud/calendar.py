@@ -0,0 +1,68 @@
+from typing import List, Optional, Union
+import secrets
+from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.engine import Row
+from datetime import datetime
+from app.core import calendar_feeds
+from app.core.config import settings
+from app.models.models import Booking, User, Venue
+from app.crud.queries import active_bookings, booking_overlaps
+
+FEED_COLUMNS = (
+    Booking.id,
+    Booking.version,
+    Booking.start_datetime,
+    Booking.end_datetime,
+    Booking.status,
+    Booking.created_at,
+    Booking.updated_at,
+)
+
+
+def get_venue_feed_bookings(db: Session, venue_id: int, since: datetime) -> List[Row]:
+    """Active bookings of a venue ending after ``since``, with only the columns a venue feed shows"""
+    return db.execute(
+        select(*FEED_COLUMNS)
+        .where(Booking.venue_id == venue_id, active_bookings(), booking_overlaps(db, since, None))
+        .order_by(Booking.start_datetime)
+        .limit(settings.CALENDAR_FEED_MAX_EVENTS)
+    ).all()
+
+
+def get_user_feed_bookings(db: Session, user_id: int, since: datetime) -> List[Row]:
+    """Active bookings of a user ending after ``since``, with their venue's name and address"""
+    return db.execute(
+        select(
+            *FEED_COLUMNS,
+            Booking.purpose,
+            Booking.notes,
+            Venue.name.label("venue_name"),
+            Venue.address.label("venue_address"),
+            Venue.city.label("venue_city"),
+            Venue.version.label("venue_version"),
+        )
+        .join(Venue, Venue.id == Booking.venue_id)
+        .where(Booking.user_id == user_id, active_bookings(), booking_overlaps(db, since, None))
+        .order_by(Booking.start_datetime)
+        .limit(settings.CALENDAR_FEED_MAX_EVENTS)
+    ).all()
+
+
+FEED_OWNERS = {"venue": Venue, "user": User}
+
+
+def get_feed_salt(db: Session, kind: str, feed_id: int) -> Optional[str]:
+    """The salt a feed's tokens are signed with ("" until first rotated), or None if its owner does not exist"""
+    owner = FEED_OWNERS[kind]
+    row = db.execute(select(owner.calendar_feed_salt).where(owner.id == feed_id)).first()
+    return None if row is None else row.calendar_feed_salt or ""
+
+
+def rotate_feed_salt(db: Session, kind: str, owner: Union[User, Venue]) -> str:
+    """Give ``owner`` a new feed salt, revoking the URLs signed with the old one in every worker"""
+    owner.calendar_feed_salt = secrets.token_urlsafe(16)
+    calendar_feeds.track_feed_rotation(db, calendar_feeds.FeedKey(kind, owner.id))
+    db.commit()
+    db.refresh(owner)
+    return owner.calendar_feed_salt
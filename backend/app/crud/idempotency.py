@@ -0,0 +1,86 @@
+import json
+from typing import Dict, Optional, Tuple
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta, timezone
+from app.core import notifications
+from app.core.config import settings
+from app.models.models import IdempotencyKey
+
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+
+# Payload "<user id>:<key>" once a claimed key completes or is released
+NOTIFY_CHANNEL = "idempotency_keys"
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def get_idempotency_key(db: Session, user_id: int, key: str) -> Optional[IdempotencyKey]:
+    """The unexpired record for a user's key, if any"""
+    return db.query(IdempotencyKey).filter(
+        IdempotencyKey.user_id == user_id,
+        IdempotencyKey.key == key,
+        IdempotencyKey.expires_at > _utcnow()
+    ).populate_existing().first()
+
+
+def claim_idempotency_key(
+    db: Session, user_id: int, key: str, fingerprint: str
+) -> Tuple[Optional[IdempotencyKey], bool]:
+    """Try to become the request that runs for this key.
+
+    Returns the new in-progress record and True when claimed, otherwise the
+    record of the request that got there first (None if it just went away) and False.
+    """
+    now = _utcnow()
+    db.query(IdempotencyKey).filter(
+        IdempotencyKey.user_id == user_id,
+        IdempotencyKey.key == key,
+        IdempotencyKey.expires_at <= now
+    ).delete(synchronize_session=False)
+
+    record = IdempotencyKey(
+        user_id=user_id,
+        key=key,
+        request_fingerprint=fingerprint,
+        status=IN_PROGRESS,
+        expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+    )
+    db.add(record)
+    try:
+        db.commit()
+        return record, True
+    except IntegrityError:
+        db.rollback()
+    return get_idempotency_key(db, user_id, key), False
+
+
+def complete_idempotency_key(
+    db: Session, record: IdempotencyKey, status_code: int, body: str, headers: Dict[str, str]
+) -> None:
+    """Store the response for the key; it commits with whatever else ``db`` has pending"""
+    record.status = COMPLETED
+    record.response_status = status_code
+    record.response_body = body
+    record.response_headers = json.dumps(headers)
+    record.expires_at = _utcnow() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS)
+    notifications.publish_on_commit(db, NOTIFY_CHANNEL, f"{record.user_id}:{record.key}")
+    db.commit()
+
+
+def release_idempotency_key(db: Session, record: IdempotencyKey) -> None:
+    """Forget a claim whose request failed, so a retry can run it again"""
+    notifications.publish_on_commit(db, NOTIFY_CHANNEL, f"{record.user_id}:{record.key}")
+    db.delete(record)
+    db.commit()
+
+
+def delete_expired_idempotency_keys(db: Session) -> int:
+    deleted = db.query(IdempotencyKey).filter(
+        IdempotencyKey.expires_at <= _utcnow()
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
@@ -0,0 +1,71 @@
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+from sqlalchemy import and_, bindparam, func, inspect, true
+from sqlalchemy.orm import Session, load_only, selectinload
+from app.models.models import ACTIVE_BOOKING_STATUSES, Booking, booking_period
+
+
+def active_bookings():
+    """Filter on active bookings with the statuses inlined into the SQL.
+
+    Inlined values (rather than bound parameters) let the planner match the
+    partial indexes that are restricted to active bookings.
+    """
+    return Booking.status.in_(
+        bindparam(None, ACTIVE_BOOKING_STATUSES, expanding=True, literal_execute=True)
+    )
+
+
+def pending_bookings():
+    """Filter on pending bookings, inlined like active_bookings()"""
+    return Booking.status == bindparam(None, "pending", literal_execute=True)
+
+
+def booking_overlaps(db: Session, start: Optional[datetime], end: Optional[datetime]):
+    """Filter on bookings whose period overlaps ``[start, end)``; a missing bound is unbounded.
+
+    This is the one overlap test for availability checks and range reads. On
+    PostgreSQL it is a range overlap backed by ix_bookings_venue_period_gist,
+    elsewhere the equivalent pair of comparisons on the composite indexes.
+    Bookings that only touch the range at an edge do not overlap it.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        # Aware binds fold into a constant tstzrange the GiST index can take as
+        # its condition; a naive bind is cast at run time and read in the
+        # session time zone. The range test stays the only predicate: a
+        # start_datetime bound next to it steers the planner to the btree
+        # indexes, with the overlap left as a filter.
+        return booking_period().op("&&")(func.tstzrange(_utc(start), _utc(end)))
+    conditions = []
+    if end is not None:
+        conditions.append(Booking.start_datetime < end)
+    if start is not None:
+        conditions.append(Booking.end_datetime > start)
+    return and_(true(), *conditions)
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    """``value`` as an aware UTC datetime; naive values are taken to be UTC already"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def load_fields(model, fields: Optional[Iterable[str]]) -> list:
+    """Query options that load only the ``fields`` of ``model``: its columns
+    among them (the primary key always), and the relationships among them in
+    one more query each. No options, so everything loads, when ``fields`` is None.
+    """
+    if fields is None:
+        return []
+    mapper = inspect(model)
+    columns = [name for name in fields if name in mapper.column_attrs]
+    related = [name for name in fields if name in mapper.relationships]
+    for name in related:
+        columns.extend(column.key for column in mapper.relationships[name].local_columns)
+    return [
+        load_only(*(getattr(model, name) for name in dict.fromkeys(columns))),
+        *(selectinload(getattr(model, name)) for name in related),
+    ]
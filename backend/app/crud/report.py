@@ -0,0 +1,200 @@
+from typing import Optional, List, Dict, Iterable, Tuple, NamedTuple
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, case, cast, delete, func, insert, select, union_all, BigInteger, Date
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from app.models.models import ACTIVE_BOOKING_STATUSES, Booking, BookingArchive, BookingRollup
+from app.crud.queries import active_bookings
+
+GRANULARITIES = ("day", "week", "month")
+ROLLUP_COLUMNS = ("booking_count", "booked_seconds", "revenue", "confirmed_count", "confirmed_revenue")
+
+
+class BookingSnapshot(NamedTuple):
+    venue_id: int
+    start_datetime: datetime
+    end_datetime: datetime
+    total_cost: Decimal
+    status: str
+    user_id: Optional[int] = None
+
+
+def snapshot(booking: Booking) -> BookingSnapshot:
+    return BookingSnapshot(
+        booking.venue_id,
+        booking.start_datetime,
+        booking.end_datetime,
+        booking.total_cost,
+        booking.status,
+        booking.user_id,
+    )
+
+
+def rollup_day(value: datetime) -> date:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+
+def _contribution(booking: BookingSnapshot, sign: int) -> Dict[str, object]:
+    confirmed = booking.status == "confirmed"
+    cost = Decimal(booking.total_cost) * sign
+    seconds = int((booking.end_datetime - booking.start_datetime).total_seconds())
+    return {
+        "booking_count": sign,
+        "booked_seconds": sign * seconds,
+        "revenue": cost,
+        "confirmed_count": sign if confirmed else 0,
+        "confirmed_revenue": cost if confirmed else Decimal(0),
+    }
+
+
+def _upsert_rollup(db: Session, venue_id: int, day: date, delta: Dict[str, object]) -> None:
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        rollup = db.get(BookingRollup, (venue_id, day))
+        if rollup is None:
+            rollup = BookingRollup(venue_id=venue_id, day=day, **delta)
+            db.add(rollup)
+        else:
+            for column, value in delta.items():
+                setattr(rollup, column, getattr(rollup, column) + value)
+        return
+
+    stmt = dialect_insert(BookingRollup).values(venue_id=venue_id, day=day, **delta)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["venue_id", "day"],
+        set_={column: getattr(BookingRollup, column) + stmt.excluded[column] for column in delta},
+    )
+    db.execute(stmt)
+
+
+def apply_booking_changes(
+    db: Session,
+    changes: Iterable[Tuple[Optional[BookingSnapshot], Optional[BookingSnapshot]]]
+) -> None:
+    """Fold the changes of bookings from ``before`` to ``after`` into the rollups.
+
+    Pass ``before=None`` for a new booking. There is one upsert per venue and
+    day, and nothing is committed, so this has to run inside the transaction
+    that writes the bookings themselves.
+    """
+    deltas: Dict[Tuple[int, date], Dict[str, object]] = {}
+    for before, after in changes:
+        for booking, sign in ((before, -1), (after, 1)):
+            if booking is None or booking.status not in ACTIVE_BOOKING_STATUSES:
+                continue
+            key = (booking.venue_id, rollup_day(booking.start_datetime))
+            contribution = _contribution(booking, sign)
+            if key in deltas:
+                for column, value in contribution.items():
+                    deltas[key][column] += value
+            else:
+                deltas[key] = contribution
+
+    for (venue_id, day), delta in deltas.items():
+        if any(delta.values()):
+            _upsert_rollup(db, venue_id, day, delta)
+
+
+def _day_expression(db: Session, start):
+    if db.get_bind().dialect.name == "postgresql":
+        return cast(func.timezone("UTC", start), Date)
+    return func.date(start)
+
+
+def _seconds_expression(db: Session, start, end):
+    if db.get_bind().dialect.name == "postgresql":
+        return func.extract("epoch", end - start)
+    return (func.julianday(end) - func.julianday(start)) * 86400
+
+
+def rebuild_rollups(db: Session, venue_id: Optional[int] = None) -> int:
+    """Recompute the rollups from live and archived bookings, for one venue or all of them"""
+    columns = ("venue_id", "start_datetime", "end_datetime", "total_cost", "status")
+    live = select(*[getattr(Booking, column) for column in columns]).where(active_bookings())
+    archived = select(*[getattr(BookingArchive, column) for column in columns]).where(
+        BookingArchive.status.in_(ACTIVE_BOOKING_STATUSES)
+    )
+    if venue_id:
+        live = live.where(Booking.venue_id == venue_id)
+        archived = archived.where(BookingArchive.venue_id == venue_id)
+    bookings = union_all(live, archived).subquery()
+
+    day = _day_expression(db, bookings.c.start_datetime).label("day")
+    seconds = _seconds_expression(db, bookings.c.start_datetime, bookings.c.end_datetime)
+    confirmed = bookings.c.status == "confirmed"
+    totals = select(
+        bookings.c.venue_id,
+        day,
+        func.count(),
+        cast(func.round(func.sum(seconds)), BigInteger),
+        func.sum(bookings.c.total_cost),
+        func.sum(case((confirmed, 1), else_=0)),
+        func.sum(case((confirmed, bookings.c.total_cost), else_=0)),
+    ).group_by(bookings.c.venue_id, day)
+    cleanup = delete(BookingRollup)
+    if venue_id:
+        cleanup = cleanup.where(BookingRollup.venue_id == venue_id)
+
+    db.execute(cleanup)
+    result = db.execute(
+        insert(BookingRollup).from_select(["venue_id", "day", *ROLLUP_COLUMNS], totals)
+    )
+    db.commit()
+    return result.rowcount
+
+
+def period_start(day: date, granularity: str) -> date:
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def get_revenue_report(
+    db: Session,
+    granularity: str = "day",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    venue_id: Optional[int] = None
+) -> List[dict]:
+    """Revenue and occupancy per venue and period, read from the rollups only"""
+    query = db.query(
+        BookingRollup.venue_id,
+        BookingRollup.day,
+        *[getattr(BookingRollup, column) for column in ROLLUP_COLUMNS]
+    )
+
+    filters = [BookingRollup.booking_count > 0]
+    if venue_id:
+        filters.append(BookingRollup.venue_id == venue_id)
+    if start_date:
+        filters.append(BookingRollup.day >= start_date)
+    if end_date:
+        filters.append(BookingRollup.day <= end_date)
+    query = query.filter(and_(*filters))
+
+    periods: Dict[Tuple[int, date], dict] = {}
+    for row in query.order_by(BookingRollup.day, BookingRollup.venue_id):
+        key = (row.venue_id, period_start(row.day, granularity))
+        period = periods.get(key)
+        if period is None:
+            period = periods[key] = {
+                "venue_id": row.venue_id,
+                "period_start": key[1],
+                **{column: 0 for column in ROLLUP_COLUMNS},
+            }
+        for column in ROLLUP_COLUMNS:
+            period[column] += getattr(row, column)
+
+    rows = []
+    for period in periods.values():
+        period["booked_hours"] = period.pop("booked_seconds") / 3600
+        rows.append(period)
+    return rows
@@ -1,6 +1,6 @@
 from typing import Optional, List
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, func, update
 from datetime import datetime
 from app.models.models import User
 from app.schemas.schemas import UserCreate, UserUpdate
@@ -35,14 +35,24 @@ def create_user(db: Session, user: UserCreate) -> User:
     return db_user
 
 
-def update_user(db: Session, user_id: int, user_update: UserUpdate) -> Optional[User]:
-    db_user = db.query(User).filter(User.id == user_id).first()
-    if db_user:
-        update_data = user_update.dict(exclude_unset=True)
-        for key, value in update_data.items():
-            setattr(db_user, key, value)
-        db.commit()
-        db.refresh(db_user)
+def update_user(
+    db: Session, user_id: int, user_update: UserUpdate, version: Optional[int] = None
+) -> Optional[User]:
+    """Single UPDATE ... RETURNING; None when no user matched ``user_id`` (at ``version`` if given)"""
+    filters = [User.id == user_id]
+    if version is not None:
+        filters.append(User.version == version)
+    return _update_returning(db, filters, user_update.dict(exclude_unset=True))
+
+
+def _update_returning(db: Session, filters: list, values: dict) -> Optional[User]:
+    db_user = db.execute(
+        update(User)
+        .where(*filters)
+        .values(**values, version=User.version + 1, updated_at=func.now())
+        .returning(User)
+    ).scalar_one_or_none()
+    db.commit()
     return db_user
 
 
@@ -56,9 +66,4 @@ def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
 
 
 def deactivate_user(db: Session, user_id: int) -> Optional[User]:
-    db_user = db.query(User).filter(User.id == user_id).first()
-    if db_user:
-        db_user.is_active = False
-        db.commit()
-        db.refresh(db_user)
-    return db_user
+    return _update_returning(db, [User.id == user_id], {"is_active": False})
@@ -1,85 +1,225 @@
-from typing import Optional, List
+from typing import Any, Optional, List, Dict, Iterable, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, case, func, true, update
 from datetime import datetime
 from decimal import Decimal
+import threading
+import time
+from app.core import notifications, typeahead, venue_cache
+from app.core.config import settings
 from app.models.models import Venue
+from app.crud.queries import active_bookings, booking_overlaps, load_fields
 from app.schemas.schemas import VenueCreate, VenueUpdate, VenueSearch
 
+RATES_CHANNEL = "venue_rates"
 
-def get_venue(db: Session, venue_id: int) -> Optional[Venue]:
-    return db.query(Venue).filter(Venue.id == venue_id).first()
+# venue_id -> (hourly_rate, is_active, expires_at). Venue writes drop their
+# entry in every worker once they commit; the TTL bounds staleness should a
+# notification be missed.
+_rate_cache: Dict[int, Tuple[Decimal, bool, float]] = {}
+_rate_cache_lock = threading.Lock()
+# Bumped by every invalidation, so rates read before a write are not cached after it
+_rate_generation = 0
+_rate_invalidated_at = float("-inf")
 
 
-def get_venues(
-    db: Session, 
-    skip: int = 0, 
-    limit: int = 100,
-    search: Optional[VenueSearch] = None
-) -> List[Venue]:
-    query = db.query(Venue).filter(Venue.is_active == True)
-    
+def get_venue(db: Session, venue_id: int, fields: Optional[Iterable[str]] = None) -> Optional[Venue]:
+    return db.query(Venue).options(*load_fields(Venue, fields)).filter(Venue.id == venue_id).first()
+
+
+def _search_conditions(search: Optional[VenueSearch]) -> Dict[str, list]:
+    """Filter conditions of a venue search, by the facet they narrow"""
+    conditions: Dict[str, list] = {"city": [], "capacity": [], "hourly_rate": []}
     if search:
         if search.city:
-            query = query.filter(Venue.city.ilike(f"%{search.city}%"))
+            conditions["city"].append(Venue.city.ilike(f"%{search.city}%"))
         if search.min_capacity:
-            query = query.filter(Venue.capacity >= search.min_capacity)
+            conditions["capacity"].append(Venue.capacity >= search.min_capacity)
         if search.max_capacity:
-            query = query.filter(Venue.capacity <= search.max_capacity)
+            conditions["capacity"].append(Venue.capacity <= search.max_capacity)
         if search.min_rate:
-            query = query.filter(Venue.hourly_rate >= search.min_rate)
+            conditions["hourly_rate"].append(Venue.hourly_rate >= search.min_rate)
         if search.max_rate:
-            query = query.filter(Venue.hourly_rate <= search.max_rate)
+            conditions["hourly_rate"].append(Venue.hourly_rate <= search.max_rate)
+    return conditions
+
+
+def get_venues(
+    db: Session, 
+    skip: int = 0, 
+    limit: int = 100,
+    search: Optional[VenueSearch] = None,
+    fields: Optional[Iterable[str]] = None
+) -> List[Venue]:
+    """Active venues matching ``search``; with ``fields``, only those attributes are loaded"""
+    query = db.query(Venue).options(*load_fields(Venue, fields)).filter(Venue.is_active == True)
+    for conditions in _search_conditions(search).values():
+        query = query.filter(*conditions)
     
     return query.offset(skip).limit(limit).all()
 
 
 def get_venues_count(db: Session, search: Optional[VenueSearch] = None) -> int:
-    query = db.query(Venue).filter(Venue.is_active == True)
-    
-    if search:
-        if search.city:
-            query = query.filter(Venue.city.ilike(f"%{search.city}%"))
-        if search.min_capacity:
-            query = query.filter(Venue.capacity >= search.min_capacity)
-        if search.max_capacity:
-            query = query.filter(Venue.capacity <= search.max_capacity)
-        if search.min_rate:
-            query = query.filter(Venue.hourly_rate >= search.min_rate)
-        if search.max_rate:
-            query = query.filter(Venue.hourly_rate <= search.max_rate)
+    query = db.query(func.count(Venue.id)).filter(Venue.is_active == True)
+    for conditions in _search_conditions(search).values():
+        query = query.filter(*conditions)
     
-    return query.count()
+    return query.scalar()
+
+
+def _bucket(column, bounds: List) -> Any:
+    """Index of the range of ``bounds`` that ``column`` falls in: 0 below bounds[0], len(bounds) from the last on"""
+    return case(*[(column < bound, index) for index, bound in enumerate(bounds)], else_=len(bounds))
+
+
+def _ranges(bounds: List, counts: Dict[int, int]) -> List[dict]:
+    edges = [None, *bounds, None]
+    return [
+        {"min": edges[index], "max": edges[index + 1], "count": counts.get(index, 0)}
+        for index in range(len(bounds) + 1)
+    ]
+
+
+def get_venue_facets(db: Session, search: Optional[VenueSearch] = None) -> Dict[str, Any]:
+    """Active venue counts by city, capacity range and hourly rate range, in one grouped query.
+
+    Each facet is counted under every filter of ``search`` except its own, so
+    the other values of a filtered facet still show how many venues they would
+    match. ``total`` counts the venues matching every filter.
+    """
+    conditions = _search_conditions(search)
+
+    def matching(*facets: str):
+        return func.sum(case((and_(true(), *[c for facet in facets for c in conditions[facet]]), 1), else_=0))
+
+    capacity_bucket = _bucket(Venue.capacity, settings.VENUE_CAPACITY_FACET_BOUNDS).label("capacity_bucket")
+    rate_bucket = _bucket(Venue.hourly_rate, settings.VENUE_RATE_FACET_BOUNDS).label("rate_bucket")
+    rows = db.query(
+        Venue.city,
+        capacity_bucket,
+        rate_bucket,
+        matching("city", "capacity", "hourly_rate"),
+        matching("capacity", "hourly_rate"),
+        matching("city", "hourly_rate"),
+        matching("city", "capacity"),
+    ).filter(Venue.is_active == True).group_by(Venue.city, capacity_bucket, rate_bucket).all()
+
+    total = 0
+    cities: Dict[str, int] = {}
+    capacities: Dict[int, int] = {}
+    rates: Dict[int, int] = {}
+    for city, capacity_index, rate_index, everything, by_city, by_capacity, by_rate in rows:
+        total += everything or 0
+        if by_city:
+            cities[city] = cities.get(city, 0) + by_city
+        capacities[capacity_index] = capacities.get(capacity_index, 0) + (by_capacity or 0)
+        rates[rate_index] = rates.get(rate_index, 0) + (by_rate or 0)
+
+    return {
+        "total": total,
+        "city": [
+            {"value": city, "count": count}
+            for city, count in sorted(cities.items(), key=lambda item: (-item[1], item[0]))
+        ],
+        "capacity": _ranges(settings.VENUE_CAPACITY_FACET_BOUNDS, capacities),
+        "hourly_rate": _ranges(settings.VENUE_RATE_FACET_BOUNDS, rates),
+    }
 
 
 def create_venue(db: Session, venue: VenueCreate) -> Venue:
     db_venue = Venue(**venue.dict())
     db.add(db_venue)
+    db.flush()
+    venue_cache.track_venue_write(db)
+    typeahead.track_venue_write(db, db_venue)
     db.commit()
     db.refresh(db_venue)
     return db_venue
 
 
-def update_venue(db: Session, venue_id: int, venue_update: VenueUpdate) -> Optional[Venue]:
-    db_venue = db.query(Venue).filter(Venue.id == venue_id).first()
-    if db_venue:
-        update_data = venue_update.dict(exclude_unset=True)
-        for key, value in update_data.items():
-            setattr(db_venue, key, value)
-        db.commit()
-        db.refresh(db_venue)
-    return db_venue
+def update_venue(
+    db: Session, venue_id: int, venue_update: VenueUpdate, version: Optional[int] = None
+) -> Optional[Venue]:
+    """Single UPDATE ... RETURNING; None when no venue matched ``venue_id`` (at ``version`` if given)"""
+    filters = [Venue.id == venue_id]
+    if version is not None:
+        filters.append(Venue.version == version)
+    return _update_returning(db, filters, venue_update.dict(exclude_unset=True))
 
 
 def delete_venue(db: Session, venue_id: int) -> Optional[Venue]:
-    db_venue = db.query(Venue).filter(Venue.id == venue_id).first()
+    return _update_returning(db, [Venue.id == venue_id], {"is_active": False})
+
+
+def _update_returning(db: Session, filters: list, values: dict) -> Optional[Venue]:
+    db_venue = db.execute(
+        update(Venue)
+        .where(*filters)
+        .values(**values, version=Venue.version + 1, updated_at=func.now())
+        .returning(Venue)
+    ).scalar_one_or_none()
     if db_venue:
-        db_venue.is_active = False
-        db.commit()
-        db.refresh(db_venue)
+        venue_cache.track_venue_write(db)
+        typeahead.track_venue_write(db, db_venue)
+        notifications.publish_on_commit(db, RATES_CHANNEL, str(db_venue.id))
+    db.commit()
     return db_venue
 
 
+def get_venue_rates(db: Session, venue_ids: Iterable[int], active_only: bool = False) -> Dict[int, Decimal]:
+    """Hourly rates for the given venues, served from the in-process rate cache.
+
+    Venues that do not exist, or are inactive with ``active_only``, are missing
+    from the result.
+    """
+    now = time.monotonic()
+    rates: Dict[int, Decimal] = {}
+    missing = []
+
+    with _rate_cache_lock:
+        generation = _rate_generation
+        for venue_id in set(venue_ids):
+            cached = _rate_cache.get(venue_id)
+            if cached and cached[2] > now:
+                if cached[1] or not active_only:
+                    rates[venue_id] = cached[0]
+            else:
+                missing.append(venue_id)
+
+    if missing:
+        rows = db.query(Venue.id, Venue.hourly_rate, Venue.is_active).filter(Venue.id.in_(missing)).all()
+        expires_at = now + settings.VENUE_RATE_CACHE_TTL_SECONDS
+        with _rate_cache_lock:
+            # A venue written since the read began may have been read as it was before;
+            # replicas may still lag behind the last write
+            keep = generation == _rate_generation and not (
+                settings.DATABASE_REPLICA_URLS and now - _rate_invalidated_at < settings.REPLICA_STICKINESS_SECONDS
+            )
+            for venue_id, hourly_rate, is_active in rows:
+                if keep:
+                    _rate_cache[venue_id] = (hourly_rate, is_active, expires_at)
+                if is_active or not active_only:
+                    rates[venue_id] = hourly_rate
+
+    return rates
+
+
+def invalidate_venue_rate(venue_id: Optional[int] = None) -> None:
+    global _rate_generation, _rate_invalidated_at
+    with _rate_cache_lock:
+        if venue_id is None:
+            _rate_cache.clear()
+        else:
+            _rate_cache.pop(venue_id, None)
+        _rate_generation += 1
+        _rate_invalidated_at = time.monotonic()
+
+
+notifications.register(
+    RATES_CHANNEL, lambda payload: invalidate_venue_rate(int(payload)), resync=invalidate_venue_rate
+)
+
+
 def get_venues_by_city(db: Session, city: str) -> List[Venue]:
     return db.query(Venue).filter(
         and_(Venue.city.ilike(f"%{city}%"), Venue.is_active == True)
@@ -96,25 +236,10 @@ def check_venue_availability(
     """Check if a venue is available for the given time slot"""
     from app.models.models import Booking
     
-    query = db.query(Booking).filter(
-        and_(
-            Booking.venue_id == venue_id,
-            Booking.status.in_(["pending", "confirmed"]),
-            or_(
-                and_(
-                    Booking.start_datetime <= start_datetime,
-                    Booking.end_datetime > start_datetime
-                ),
-                and_(
-                    Booking.start_datetime < end_datetime,
-                    Booking.end_datetime >= end_datetime
-                ),
-                and_(
-                    Booking.start_datetime >= start_datetime,
-                    Booking.end_datetime <= end_datetime
-                )
-            )
-        )
+    query = db.query(Booking.id).filter(
+        Booking.venue_id == venue_id,
+        active_bookings(),
+        booking_overlaps(db, start_datetime, end_datetime)
     )
     
     if exclude_booking_id:
@@ -122,3 +247,18 @@ def check_venue_availability(
     
     conflicting_booking = query.first()
     return conflicting_booking is None
+
+
+def get_booked_slots(
+    db: Session, venue_id: int, start_datetime: datetime, end_datetime: datetime
+) -> List[Tuple[datetime, datetime]]:
+    """Start and end of every active booking of a venue overlapping the given range"""
+    from app.models.models import Booking
+    
+    return [
+        tuple(row) for row in db.query(Booking.start_datetime, Booking.end_datetime).filter(
+            Booking.venue_id == venue_id,
+            active_bookings(),
+            booking_overlaps(db, start_datetime, end_datetime)
+        ).order_by(Booking.start_datetime)
+    ]
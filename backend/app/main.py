@@ -1,30 +1,117 @@
-from fastapi import FastAPI
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy.orm.exc import StaleDataError
+from starlette.concurrency import run_in_threadpool
+from app.core import admission, archiver, database, metrics, notifications, query_stats, sweeper, warmup
 from app.core.config import settings
+from app.core.database import engine
 from app.api.v1.api import api_router
+from app.api.v1.etags import CONFLICT_DETAIL
+
+LISTENER_STARTUP_TIMEOUT_SECONDS = 5.0
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    report = app.state.startup_report
+    # Listen before warming the caches, so nothing other workers commit meanwhile is missed
+    listening = engine.dialect.name == "postgresql"
+    if listening:
+        notifications.listener.start()
+        await run_in_threadpool(notifications.listener.listening.wait, LISTENER_STARTUP_TIMEOUT_SECONDS)
+    if settings.STARTUP_WARMUP_ENABLED:
+        await run_in_threadpool(warmup.warm_up, app, report)
+    warmup.finish(report)
+
+    expiry_sweeper = None
+    if settings.EXPIRY_SWEEP_INTERVAL_SECONDS > 0 and settings.PENDING_BOOKING_HOLD_MINUTES > 0:
+        expiry_sweeper = asyncio.create_task(sweeper.run_sweeper())
+    booking_archiver = None
+    if settings.BOOKING_ARCHIVE_INTERVAL_SECONDS > 0:
+        booking_archiver = asyncio.create_task(archiver.run_archiver())
+    yield
+    if listening:
+        await run_in_threadpool(notifications.listener.stop)
+    if expiry_sweeper is not None:
+        expiry_sweeper.cancel()
+    if booking_archiver is not None:
+        booking_archiver.cancel()
+
+
+async def version_conflict_handler(request: Request, exc: StaleDataError):
+    """A versioned write lost against a concurrent one at flush"""
+    return JSONResponse(
+        status_code=409,
+        content={"detail": CONFLICT_DETAIL}
+    )
+
 
-app = FastAPI(
-    title=settings.PROJECT_NAME,
-    version="1.0.0",
-    description="South Moravia Conference Booking API"
-)
-
-# Set up CORS
-if settings.BACKEND_CORS_ORIGINS:
-    app.add_middleware(
-        CORSMiddleware,
-        allow_origins=[str(origin) for origin in settings.BACKEND_CORS_ORIGINS],
-        allow_credentials=True,
-        allow_methods=["*"],
-        allow_headers=["*"],
+def create_app() -> FastAPI:
+    """Build the application; warm-up runs in its lifespan, before the first request"""
+    app = FastAPI(
+        title=settings.PROJECT_NAME,
+        version="1.0.0",
+        description="South Moravia Conference Booking API",
+        lifespan=lifespan
     )
+    app.state.startup_report = warmup.StartupReport(time.perf_counter() - IMPORT_STARTED)
+
+    # Set up CORS
+    if settings.BACKEND_CORS_ORIGINS:
+        app.add_middleware(
+            CORSMiddleware,
+            allow_origins=[str(origin) for origin in settings.BACKEND_CORS_ORIGINS],
+            allow_credentials=True,
+            allow_methods=["*"],
+            allow_headers=["*"],
+        )
+
+    if settings.SQL_INSTRUMENTATION_ENABLED:
+        app.add_middleware(query_stats.QueryStatsMiddleware)
+
+    app.add_middleware(database.ReadYourWritesMiddleware)
+
+    if settings.ADMISSION_CONTROL_ENABLED:
+        app.add_middleware(admission.AdmissionControlMiddleware)
+
+    if settings.METRICS_ENABLED:
+        app.add_middleware(metrics.MetricsMiddleware)
+        metrics.registry.register_gauge(
+            "threadpool_tokens", "Threads of the sync endpoint threadpool.", metrics.threadpool_gauges
+        )
+        metrics.registry.register_gauge(
+            "db_pool_connections", "Connections of the primary database pool.", metrics.pool_gauges(engine)
+        )
+
+    app.include_router(api_router, prefix=settings.API_V1_STR)
+    app.add_exception_handler(StaleDataError, version_conflict_handler)
+
+    @app.get("/")
+    async def root():
+        return {"message": "South Moravia Conference Booking API", "version": "1.0.0"}
+
+    @app.get("/health")
+    async def health_check():
+        return {"status": "healthy"}
+
+    @app.get("/health/startup")
+    async def startup_report():
+        """How long this worker took to start, by phase; 503 until warm-up finished"""
+        report = app.state.startup_report
+        return JSONResponse(status_code=200 if report.ready else 503, content=report.as_dict())
+
+    @app.get("/metrics", include_in_schema=False)
+    async def read_metrics():
+        return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
 
-app.include_router(api_router, prefix=settings.API_V1_STR)
+    return app
 
-@app.get("/")
-async def root():
-    return {"message": "South Moravia Conference Booking API", "version": "1.0.0"}
 
-@app.get("/health")
-async def health_check():
-    return {"status": "healthy"}
+app = create_app()
@@ -1,8 +1,16 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, DECIMAL
+from sqlalchemy import (
+    Column, Integer, BigInteger, String, Date, DateTime, Boolean, Text, ForeignKey, DECIMAL, Index, UniqueConstraint, text,
+    DDL, event
+)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
 
+# Bookings in these states hold their time slot
+ACTIVE_BOOKING_STATUSES = ("pending", "confirmed")
+ACTIVE_BOOKING_PREDICATE = "status IN ('pending', 'confirmed')"
+PENDING_BOOKING_PREDICATE = "status = 'pending'"
+
 
 class User(Base):
     __tablename__ = "users"
@@ -18,10 +26,16 @@ class User(Base):
     is_admin = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Bumped by every UPDATE, which only applies while the row still has the version it was read with
+    version = Column(Integer, nullable=False, server_default="1")
+    # Signs the user's calendar feed URL; replaced to revoke it, NULL until the first rotation
+    calendar_feed_salt = Column(String)
 
     # Relationships
     bookings = relationship("Booking", back_populates="user")
 
+    __mapper_args__ = {"version_id_col": version}
+
 
 class Venue(Base):
     __tablename__ = "venues"
@@ -41,10 +55,14 @@ class Venue(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    version = Column(Integer, nullable=False, server_default="1")
+    calendar_feed_salt = Column(String)
 
     # Relationships
     bookings = relationship("Booking", back_populates="venue")
 
+    __mapper_args__ = {"version_id_col": version}
+
 
 class Booking(Base):
     __tablename__ = "bookings"
@@ -60,7 +78,136 @@ class Booking(Base):
     notes = Column(Text)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    version = Column(Integer, nullable=False, server_default="1")
 
     # Relationships
     user = relationship("User", back_populates="bookings")
     venue = relationship("Venue", back_populates="bookings")
+
+    __mapper_args__ = {"version_id_col": version}
+
+    __table_args__ = (
+        Index("ix_bookings_user_id", "user_id"),
+        Index("ix_bookings_venue_id_start_datetime", "venue_id", "start_datetime"),
+        # Availability checks only look at bookings that still hold their slot
+        Index(
+            "ix_bookings_active_venue_period",
+            "venue_id", "start_datetime", "end_datetime",
+            postgresql_where=text(ACTIVE_BOOKING_PREDICATE),
+            sqlite_where=text(ACTIVE_BOOKING_PREDICATE),
+        ),
+        # The expiry sweeper looks for the oldest pending bookings
+        Index(
+            "ix_bookings_pending_created_at",
+            "created_at",
+            postgresql_where=text(PENDING_BOOKING_PREDICATE),
+            sqlite_where=text(PENDING_BOOKING_PREDICATE),
+        ),
+        # One partition per month of start time (see app.core.partitions); on SQLite,
+        # never reuse the id of a booking that was moved to bookings_archive
+        {"postgresql_partition_by": "RANGE (start_datetime)", "sqlite_autoincrement": True},
+    )
+
+
+# A partitioned table's primary key has to include the partition key, so on
+# PostgreSQL it is (id, start_datetime); ids still come from one sequence
+Booking.__table__.primary_key.ddl_if(callable_=lambda ddl, target, bind, dialect, **kw: dialect.name != "postgresql")
+event.listen(
+    Booking.__table__,
+    "after_create",
+    DDL("ALTER TABLE bookings ADD PRIMARY KEY (id, start_datetime)").execute_if(dialect="postgresql")
+)
+event.listen(
+    Booking.__table__,
+    "after_create",
+    DDL("CREATE TABLE bookings_default PARTITION OF bookings DEFAULT").execute_if(dialect="postgresql")
+)
+
+
+class BookingArchive(Base):
+    """Bookings moved out of ``bookings`` by the archiver, with their last state.
+
+    Bookings are archived once they ended long ago, or some time after they
+    were cancelled or expired. Archived bookings are read-only.
+    """
+    __tablename__ = "bookings_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    venue_id = Column(Integer, ForeignKey("venues.id"), nullable=False)
+    start_datetime = Column(DateTime(timezone=True), nullable=False)
+    end_datetime = Column(DateTime(timezone=True), nullable=False)
+    total_cost = Column(DECIMAL(10, 2), nullable=False)
+    status = Column(String)
+    purpose = Column(String)
+    notes = Column(Text)
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    version = Column(Integer, nullable=False)
+    archived_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    user = relationship("User")
+    venue = relationship("Venue")
+
+    __table_args__ = (
+        Index("ix_bookings_archive_user_id", "user_id"),
+        Index("ix_bookings_archive_venue_id_start_datetime", "venue_id", "start_datetime"),
+    )
+
+
+def booking_period():
+    """A booking's period as a PostgreSQL half-open ``[start, end)`` time range"""
+    return func.tstzrange(Booking.start_datetime, Booking.end_datetime)
+
+
+# Serves app.crud.queries.booking_overlaps() on PostgreSQL; btree_gist lets venue_id share the GiST index
+Index(
+    "ix_bookings_venue_period_gist", Booking.venue_id, booking_period(), postgresql_using="gist"
+).ddl_if(dialect="postgresql")
+event.listen(
+    Booking.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql")
+)
+
+
+class BookingRollup(Base):
+    """Per venue, per day booking totals maintained alongside booking writes.
+
+    Bookings are attributed to the UTC day they start on. Only pending and
+    confirmed bookings count towards the totals.
+    """
+    __tablename__ = "booking_rollups"
+
+    venue_id = Column(Integer, ForeignKey("venues.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    booking_count = Column(Integer, nullable=False, default=0)
+    booked_seconds = Column(BigInteger, nullable=False, default=0)
+    revenue = Column(DECIMAL(12, 2), nullable=False, default=0)
+    confirmed_count = Column(Integer, nullable=False, default=0)
+    confirmed_revenue = Column(DECIMAL(12, 2), nullable=False, default=0)
+
+
+class IdempotencyKey(Base):
+    """A client supplied Idempotency-Key and the response to replay for it.
+
+    While the first request runs the row is ``in_progress`` and expires after a
+    short lock period; once it completes the stored response is kept until
+    ``expires_at``.
+    """
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String(255), nullable=False)
+    request_fingerprint = Column(String(64), nullable=False)
+    status = Column(String, nullable=False, default="in_progress")  # in_progress, completed
+    response_status = Column(Integer)
+    response_body = Column(Text)
+    response_headers = Column(Text)  # JSON object
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_id_key"),
+    )
@@ -1,6 +1,6 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, validator
 from decimal import Decimal
 
 
@@ -30,6 +30,7 @@ class User(UserBase):
     is_admin: bool
     created_at: datetime
     updated_at: Optional[datetime] = None
+    version: int
 
     class Config:
         orm_mode = True
@@ -74,6 +75,7 @@ class Venue(VenueBase):
     is_active: bool
     created_at: datetime
     updated_at: Optional[datetime] = None
+    version: int
 
     class Config:
         orm_mode = True
@@ -107,6 +109,7 @@ class Booking(BookingBase):
     status: str
     created_at: datetime
     updated_at: Optional[datetime] = None
+    version: int
     
     # Include related objects
     user: Optional[User] = None
@@ -116,6 +119,41 @@ class Booking(BookingBase):
         orm_mode = True
 
 
+class BookingQuoteItem(BaseModel):
+    venue_id: int
+    start_datetime: datetime
+    end_datetime: datetime
+
+
+class BookingQuoteRequest(BaseModel):
+    items: List[BookingQuoteItem]
+
+
+class BookingQuote(BookingQuoteItem):
+    hours: int
+    hourly_rate: Decimal
+    total_cost: Decimal
+
+
+class BookingQuoteList(BaseModel):
+    quotes: List[BookingQuote]
+    total_cost: Decimal
+
+
+class BookingBulkRequest(BaseModel):
+    """Selects bookings by id, or by venue and start time window"""
+    ids: Optional[List[int]] = None
+    venue_id: Optional[int] = None
+    start_from: Optional[datetime] = None
+    start_before: Optional[datetime] = None
+
+
+class BookingBulkResult(BaseModel):
+    changed_ids: List[int]
+    unchanged_ids: List[int] = []
+    count: int
+
+
 # Authentication Schemas
 class Token(BaseModel):
     access_token: str
@@ -142,13 +180,51 @@ class VenueSearch(BaseModel):
     start_time: Optional[datetime] = None
     end_time: Optional[datetime] = None
 
+    @validator("city")
+    def strip_city(cls, city: Optional[str]) -> Optional[str]:
+        """Padding is not part of the city: the query and the search cache key both go without it"""
+        if city is None:
+            return None
+        return city.strip() or None
+
 
 # Response Schemas
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+
+class RangeFacetCount(BaseModel):
+    """Venues with ``min <= value < max``; a missing bound is open"""
+    min: Optional[int] = None
+    max: Optional[int] = None
+    count: int
+
+
+class VenueFacets(BaseModel):
+    city: List[FacetCount]
+    capacity: List[RangeFacetCount]
+    hourly_rate: List[RangeFacetCount]
+
+
 class VenueList(BaseModel):
     venues: List[Venue]
     total: int
     page: int
     size: int
+    facets: Optional[VenueFacets] = None
+
+
+class VenueSuggestion(BaseModel):
+    type: str  # city or venue
+    value: str
+    venue_id: Optional[int] = None
+    city: Optional[str] = None
+    venue_count: Optional[int] = None
+
+
+class VenueSuggestionList(BaseModel):
+    suggestions: List[VenueSuggestion]
 
 
 class BookingList(BaseModel):
@@ -156,3 +232,28 @@ class BookingList(BaseModel):
     total: int
     page: int
     size: int
+
+
+# Reporting Schemas
+class RevenueReportRow(BaseModel):
+    venue_id: int
+    period_start: date
+    booking_count: int
+    booked_hours: float
+    revenue: Decimal
+    confirmed_count: int
+    confirmed_revenue: Decimal
+
+
+class RevenueReport(BaseModel):
+    granularity: str
+    rows: List[RevenueReportRow]
+
+
+class OccupancyHeatmap(BaseModel):
+    start: datetime
+    end: datetime
+    venue_ids: List[int]
+    occurrences: List[int]  # how often each hour-of-week occurs in the period
+    occupied_hours: List[List[int]]  # venue x hour-of-week
+    occupancy: List[List[float]]  # venue x hour-of-week, 0..1
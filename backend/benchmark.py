@@ -0,0 +1,222 @@
+"""
+Microbenchmarks for CRUD, auth and serialization hot paths
+
+Seeds a scratch database, times each benchmark and compares the best times with a
+stored baseline. Exits with status 1 when a benchmark got slower than the
+baseline by more than the threshold.
+
+    python benchmark.py --save              # record a new baseline
+    python benchmark.py                     # compare against it (20% threshold)
+    python benchmark.py --threshold 0.1 --only availability
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, selectinload
+
+from app.core.database import Base
+from app.core.security import create_access_token
+from app.models.models import User, Venue, Booking
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".benchmarks", "baseline.json")
+SEED = 20240601
+
+
+def seed_database(db, venues=50, users=200, bookings=5000, seed=SEED):
+    """Fill an empty database with deterministic venues, users and non-overlapping bookings"""
+    rng = random.Random(seed)
+    db.add_all(
+        Venue(
+            name=f"Benchmark Venue {i}",
+            description="Benchmark venue " * 20,
+            address=f"Street {i}",
+            city=rng.choice(["Brno", "Olomouc", "Zlín", "Znojmo", "Břeclav"]),
+            capacity=rng.randint(10, 300),
+            hourly_rate=Decimal(rng.randint(5, 40) * 100),
+            amenities="WiFi, Projector",
+        )
+        for i in range(venues)
+    )
+    db.add_all(
+        User(
+            email=f"bench{i}@example.com",
+            hashed_password="not-a-real-hash",
+            first_name="Bench",
+            last_name=str(i),
+        )
+        for i in range(users)
+    )
+    db.commit()
+
+    start = datetime(2025, 1, 6, 8)
+    rows = []
+    for i in range(bookings):
+        venue_id = i % venues + 1
+        slot = start + timedelta(hours=3 * (i // venues))
+        rows.append({
+            "user_id": rng.randint(1, users),
+            "venue_id": venue_id,
+            "start_datetime": slot,
+            "end_datetime": slot + timedelta(hours=2),
+            "total_cost": Decimal(2000),
+            "status": rng.choice(["pending", "confirmed", "confirmed", "cancelled"]),
+        })
+    db.bulk_insert_mappings(Booking, rows)
+    db.commit()
+
+
+def measure(func, rounds=7, min_time=0.05):
+    """Best seconds per call over several rounds, each long enough to time reliably.
+
+    The minimum is the least noisy estimate on a shared machine; anything
+    slower than it is interference, not the code under test.
+    """
+    func()
+    iterations = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        iterations *= 2
+
+    timings = [elapsed / iterations]
+    for _ in range(rounds - 1):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        timings.append((time.perf_counter() - started) / iterations)
+    return min(timings)
+
+
+def build_benchmarks(db):
+    from app.api.v1.endpoints.auth import get_current_user
+    from app.crud import booking as crud_booking
+    from app.crud import venue as crud_venue
+    from app.schemas.schemas import BookingList, VenueList
+
+    rng = random.Random(SEED)
+    venue_count = db.query(Venue).count()
+    token = create_access_token("bench1@example.com")
+
+    def availability():
+        slot = datetime(2025, 1, 6, 8) + timedelta(hours=rng.randint(0, 2000))
+        crud_venue.check_venue_availability(db, rng.randint(1, venue_count), slot, slot + timedelta(hours=2))
+
+    def current_user():
+        db.expunge_all()
+        get_current_user(db=db, token=token)
+
+    def booking_cost():
+        slot = datetime(2025, 1, 6, 8)
+        crud_booking.calculate_booking_cost(db, rng.randint(1, venue_count), slot, slot + timedelta(hours=3))
+
+    bookings = (
+        db.query(Booking)
+        .options(selectinload(Booking.user), selectinload(Booking.venue))
+        .limit(100)
+        .all()
+    )
+    venues = db.query(Venue).limit(100).all()
+
+    def booking_list():
+        BookingList(bookings=bookings, total=len(bookings), page=1, size=100).json()
+
+    def venue_list():
+        VenueList(venues=venues, total=len(venues), page=1, size=100).json()
+
+    return {
+        "check_venue_availability": availability,
+        "get_current_user": current_user,
+        "calculate_booking_cost": booking_cost,
+        "serialize_booking_list_100": booking_list,
+        "serialize_venue_list_100": venue_list,
+    }
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, seconds in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"  {name:32} {seconds * 1e6:10.1f} µs   (no baseline)")
+            continue
+        change = seconds / previous - 1
+        marker = "REGRESSION" if change > threshold else ""
+        print(f"  {name:32} {seconds * 1e6:10.1f} µs   {change:+7.1%} {marker}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--database-url",
+        help="scratch database to seed; its tables are dropped first (default: temporary SQLite file)"
+    )
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON file")
+    parser.add_argument("--save", action="store_true", help="store the results as the new baseline")
+    parser.add_argument(
+        "--threshold", type=float, default=float(os.environ.get("BENCHMARK_THRESHOLD", 0.2)),
+        help="allowed slowdown before failing, as a fraction (default 0.2)"
+    )
+    parser.add_argument("--only", action="append", help="run benchmarks whose name contains this text")
+    args = parser.parse_args(argv)
+
+    from app.core.config import settings
+    if args.database_url and args.database_url == settings.DATABASE_URL:
+        parser.error("refusing to drop and reseed the application database; pass a scratch database")
+
+    with tempfile.TemporaryDirectory() as scratch:
+        database_url = args.database_url or f"sqlite:///{os.path.join(scratch, 'benchmark.db')}"
+        engine = create_engine(database_url)
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+        try:
+            seed_database(db)
+            benchmarks = build_benchmarks(db)
+            if args.only:
+                benchmarks = {
+                    name: func for name, func in benchmarks.items()
+                    if any(text in name for text in args.only)
+                }
+            print(f"Running {len(benchmarks)} benchmarks against {engine.dialect.name}...")
+            results = {name: measure(func) for name, func in benchmarks.items()}
+        finally:
+            db.close()
+            engine.dispose()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({**baseline, **results}, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
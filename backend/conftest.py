@@ -0,0 +1,23 @@
+"""
+Shared pytest helpers for the API tests
+"""
+import pytest
+from app.core.query_stats import query_count
+
+
+@pytest.fixture
+def query_budget():
+    """Assert that a response was served within a number of SQL queries.
+
+    Reads the count from the ``Server-Timing`` header added by QueryStatsMiddleware.
+    """
+    def check(response, max_queries):
+        count = query_count(response.headers.get("server-timing"))
+        assert count is not None, "Response has no query count; is SQL instrumentation enabled?"
+        assert count <= max_queries, (
+            f"{response.request.method} {response.request.url.path} ran {count} queries, "
+            f"budget is {max_queries}"
+        )
+        return count
+
+    return check
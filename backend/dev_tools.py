@@ -132,6 +132,45 @@ def show_sample_data():
     except Exception as e:
         print(f"❌ Error showing sample data: {e}")
 
+def rebuild_rollups():
+    """Rebuild the per venue, per day booking rollups from the bookings table"""
+    print("🔁 Rebuilding booking rollups...")
+    
+    try:
+        from app.core.database import SessionLocal
+        from app.crud.report import rebuild_rollups as rebuild
+        
+        db = SessionLocal()
+        try:
+            rows = rebuild(db)
+            print(f"✅ Rebuilt {rows} rollup rows")
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"❌ Error rebuilding rollups: {e}")
+
+def expire_bookings():
+    """Expire pending bookings whose hold ran out, like the background sweeper does"""
+    print("⏳ Expiring stale pending bookings...")
+    
+    try:
+        from app.core.sweeper import sweep_expired_bookings
+        
+        print(f"✅ Expired {sweep_expired_bookings()} pending bookings")
+    except Exception as e:
+        print(f"❌ Error expiring bookings: {e}")
+
+def archive_bookings():
+    """Archive old bookings and maintain booking partitions, like the background archiver does"""
+    print("📦 Archiving old bookings...")
+    
+    try:
+        from app.core.archiver import run_archive
+        
+        print(f"✅ Archived {run_archive()} bookings")
+    except Exception as e:
+        print(f"❌ Error archiving bookings: {e}")
+
 async def run_development_checks():
     """Run all development checks"""
     print("🚀 South Moravia Conference Booking - Development Check")
@@ -167,10 +206,19 @@ if __name__ == "__main__":
             show_sample_data()
         elif command == "test-api":
             asyncio.run(test_api_endpoints())
+        elif command == "rebuild-rollups":
+            rebuild_rollups()
+        elif command == "expire-bookings":
+            expire_bookings()
+        elif command == "archive-bookings":
+            archive_bookings()
         else:
             print("Available commands:")
             print("  python dev_tools.py test-db   - Test database connection and show data")
             print("  python dev_tools.py test-api  - Test API endpoints")
+            print("  python dev_tools.py rebuild-rollups - Rebuild booking report rollups")
+            print("  python dev_tools.py expire-bookings - Expire pending bookings past their hold")
+            print("  python dev_tools.py archive-bookings - Archive old bookings, maintain partitions")
             print("  python dev_tools.py           - Run all checks")
     else:
         asyncio.run(run_development_checks())
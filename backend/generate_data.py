@@ -0,0 +1,326 @@
+"""
+Synthetic data generator for load testing
+
+Creates users, venues and non-overlapping bookings with realistic shapes:
+popular venues get most of the bookings (Zipf-like weights), bookings start
+around the morning and early afternoon peaks, last a few hours and a share of
+them is cancelled. Future bookings may still be pending. Output is deterministic
+for a given --seed and options (only the pending/confirmed split of bookings
+near today depends on the current date), so load test runs can be reproduced.
+
+Rows are written in batches with multi-row INSERTs, or with COPY on PostgreSQL
+(into monthly booking partitions created as needed).
+
+    python generate_data.py --users 100000 --venues 2000 --bookings 10000000 --days 1825
+"""
+import argparse
+import csv
+import io
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Dict, Iterator, List
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.partitions import ensure_booking_partitions
+from app.core.security import get_password_hash
+from app.models.models import User, Venue, Booking
+
+CITIES = [
+    ("Brno", 0.45), ("Olomouc", 0.12), ("Zlín", 0.1), ("Znojmo", 0.08), ("Břeclav", 0.06),
+    ("Hodonín", 0.06), ("Vyškov", 0.05), ("Blansko", 0.04), ("Kroměříž", 0.04),
+]
+VENUE_KINDS = ["Conference Center", "Business Hub", "Meeting Rooms", "Hotel Hall", "Tech Space", "Congress Hall"]
+AMENITIES = ["WiFi", "Projector", "Audio System", "Coffee Service", "Catering", "Parking", "Video Conferencing", "Stage"]
+PURPOSES = [("meeting", 0.45), ("workshop", 0.2), ("conference", 0.15), ("training", 0.12), ("party", 0.08)]
+
+# Relative weight of a booking starting at each hour of the day (07:00 - 19:00)
+START_HOUR_WEIGHTS = {7: 2, 8: 6, 9: 10, 10: 9, 11: 6, 12: 3, 13: 7, 14: 8, 15: 5, 16: 3, 17: 2, 18: 1, 19: 1}
+DURATION_WEIGHTS = {1: 20, 2: 35, 3: 20, 4: 12, 6: 6, 8: 7}
+CLOSING_HOUR = 22
+MAX_BOOKINGS_PER_DAY = 5
+
+BOOKING_COLUMNS = [
+    "user_id", "venue_id", "start_datetime", "end_datetime", "total_cost",
+    "status", "purpose", "created_at",
+]
+
+
+def weighted(rng: random.Random, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights=weights)[0]
+
+
+def venue_weights(count: int, skew: float) -> List[float]:
+    """Zipf-like popularity: the n-th most popular venue gets weight 1 / n**skew"""
+    return [1 / (rank ** skew) for rank in range(1, count + 1)]
+
+
+def allocate(total: int, weights: List[float], cap: int) -> List[int]:
+    """Split ``total`` across weights with at most ``cap`` per entry, keeping the exact sum.
+
+    Whatever the most popular venues cannot take is spread over the others in
+    proportion to their weights.
+    """
+    if total > cap * len(weights):
+        raise ValueError(f"{total} bookings do not fit {len(weights)} venues; raise --days or --venues")
+
+    shares = [0.0] * len(weights)
+    active = list(range(len(weights)))
+    remaining = float(total)
+    while active:
+        scale = remaining / sum(weights[i] for i in active)
+        capped = {i for i in active if weights[i] * scale > cap}
+        if not capped:
+            for i in active:
+                shares[i] = weights[i] * scale
+            break
+        for i in capped:
+            shares[i] = cap
+            remaining -= cap
+        active = [i for i in active if i not in capped]
+
+    counts = [int(share) for share in shares]
+    leftover = total - sum(counts)
+    by_fraction = sorted(range(len(shares)), key=lambda i: shares[i] - counts[i], reverse=True)
+    for i in by_fraction[:leftover]:
+        counts[i] += 1
+    return counts
+
+
+def generate_users(rng: random.Random, count: int, seed: int) -> Iterator[dict]:
+    hashed_password = get_password_hash("loadtest123")
+    first_names = ["Jan", "Petr", "Jana", "Eva", "Tomáš", "Lucie", "Martin", "Kateřina", "Pavel", "Tereza"]
+    last_names = ["Novák", "Svoboda", "Dvořák", "Černá", "Procházka", "Kučerová", "Veselý", "Horák"]
+    for i in range(count):
+        yield {
+            "email": f"loadtest-{seed}-{i}@example.com",
+            "hashed_password": hashed_password,
+            "first_name": rng.choice(first_names),
+            "last_name": rng.choice(last_names),
+            "company": f"Company {rng.randint(1, max(count // 20, 1))}" if rng.random() < 0.7 else None,
+            "is_active": rng.random() > 0.02,
+            "is_admin": False,
+        }
+
+
+def generate_venues(rng: random.Random, count: int, seed: int) -> Iterator[dict]:
+    for i in range(count):
+        city = weighted(rng, CITIES)
+        capacity = int(min(max(rng.lognormvariate(3.5, 0.7), 8), 1500))
+        hourly_rate = Decimal(int(300 + capacity * rng.uniform(8, 25)) // 50 * 50)
+        yield {
+            "name": f"{city} {rng.choice(VENUE_KINDS)} {seed}-{i}",
+            "description": f"{rng.choice(VENUE_KINDS)} for up to {capacity} people in {city}.",
+            "address": f"Street {rng.randint(1, 200)}",
+            "city": city,
+            "postal_code": f"{rng.randint(60000, 79999)}",
+            "capacity": capacity,
+            "hourly_rate": hourly_rate,
+            "amenities": ", ".join(rng.sample(AMENITIES, rng.randint(2, 6))),
+            "is_active": True,
+        }
+
+
+def generate_venue_bookings(
+    rng: random.Random,
+    venue_id: int,
+    hourly_rate: Decimal,
+    count: int,
+    user_ids: List[int],
+    start_date: datetime,
+    days: int,
+    now: datetime,
+    cancel_ratio: float
+) -> Iterator[dict]:
+    """Yield ``count`` non-overlapping bookings for one venue spread over ``days`` days"""
+    hours, hour_weights = zip(*START_HOUR_WEIGHTS.items())
+    durations, duration_weights = zip(*DURATION_WEIGHTS.items())
+    per_day = count / days
+    produced = 0
+    day = 0
+
+    while produced < count:
+        # Slots that do not fit before closing are dropped, so a busy venue may run past the period
+        wanted = min(int(per_day) + (rng.random() < per_day % 1), count - produced)
+        starts = sorted(rng.choices(hours, weights=hour_weights, k=wanted))
+        date = start_date + timedelta(days=day)
+        day += 1
+        cursor = 0
+
+        for hour in starts:
+            start_hour = max(hour, cursor)
+            length = rng.choices(durations, weights=duration_weights)[0]
+            if start_hour + length > CLOSING_HOUR:
+                continue
+            cursor = start_hour + length
+
+            start = date + timedelta(hours=start_hour)
+            end = start + timedelta(hours=length)
+            created_at = min(start - timedelta(days=rng.expovariate(1 / 14)), now)
+            if rng.random() < cancel_ratio:
+                status = "cancelled"
+            elif start > now and rng.random() < 0.4:
+                status = "pending"
+            else:
+                status = "confirmed"
+
+            produced += 1
+            yield {
+                "user_id": rng.choice(user_ids),
+                "venue_id": venue_id,
+                "start_datetime": start,
+                "end_datetime": end,
+                "total_cost": hourly_rate * length,
+                "status": status,
+                "purpose": weighted(rng, PURPOSES),
+                "created_at": created_at,
+            }
+
+
+def batched(rows: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert_returning_ids(db, model, rows: List[dict]) -> List[int]:
+    table = model.__table__
+    result = db.execute(insert(table).returning(table.c.id, sort_by_parameter_order=True), rows)
+    return [row[0] for row in result]
+
+
+def copy_bookings(db, rows: List[dict]) -> None:
+    """Stream a batch into the bookings table with PostgreSQL COPY.
+
+    The monthly partitions of the batch are created first, so the rows go
+    straight to their month instead of piling up in the default partition.
+    """
+    starts = [row["start_datetime"] for row in rows]
+    ensure_booking_partitions(db.connection(), min(starts).date(), max(starts).date())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([
+            row[column].isoformat() if isinstance(row[column], datetime) else row[column]
+            for column in BOOKING_COLUMNS
+        ])
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY bookings ({', '.join(BOOKING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+    finally:
+        cursor.close()
+
+
+def generate(
+    database_url: str,
+    users: int,
+    venues: int,
+    bookings: int,
+    seed: int,
+    days: int,
+    start_date: datetime,
+    cancel_ratio: float,
+    popularity_skew: float,
+    batch_size: int,
+    rebuild_rollups: bool = True
+) -> Dict[str, int]:
+    engine = create_engine(database_url)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    postgres = engine.dialect.name == "postgresql"
+    tz = timezone.utc if postgres else None
+    now = datetime.now(timezone.utc).replace(tzinfo=tz)
+    start_date = start_date.replace(tzinfo=tz)
+    rng = random.Random(seed)
+
+    try:
+        user_ids: List[int] = []
+        for batch in batched(generate_users(rng, users, seed), batch_size):
+            user_ids.extend(insert_returning_ids(db, User, batch))
+        db.commit()
+        print(f"Created {len(user_ids)} users")
+
+        venue_rows = list(generate_venues(rng, venues, seed))
+        venue_ids = insert_returning_ids(db, Venue, venue_rows)
+        db.commit()
+        print(f"Created {len(venue_ids)} venues")
+
+        counts = allocate(bookings, venue_weights(venues, popularity_skew), days * MAX_BOOKINGS_PER_DAY)
+        rng.shuffle(counts)
+
+        def all_bookings() -> Iterator[dict]:
+            for venue_id, venue, count in zip(venue_ids, venue_rows, counts):
+                yield from generate_venue_bookings(
+                    rng, venue_id, venue["hourly_rate"], count, user_ids,
+                    start_date, days, now, cancel_ratio
+                )
+
+        started = time.perf_counter()
+        written = 0
+        for batch in batched(all_bookings(), batch_size):
+            if postgres:
+                copy_bookings(db, batch)
+            else:
+                db.execute(insert(Booking.__table__), batch)
+            db.commit()
+            written += len(batch)
+            if written % (batch_size * 20) < batch_size:
+                rate = written / (time.perf_counter() - started)
+                print(f"  {written:,} bookings ({rate:,.0f}/s)")
+        print(f"Created {written:,} bookings in {time.perf_counter() - started:.1f}s")
+
+        if rebuild_rollups:
+            from app.crud.report import rebuild_rollups as rebuild
+            print(f"Rebuilt {rebuild(db)} report rollup rows")
+
+        return {"users": len(user_ids), "venues": len(venue_ids), "bookings": written}
+    finally:
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--venues", type=int, default=100)
+    parser.add_argument("--bookings", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--days", type=int, default=1095, help="length of the booking period in days")
+    parser.add_argument(
+        "--start-date", type=datetime.fromisoformat, default=datetime(2024, 1, 1),
+        help="first day of the booking period (default 2024-01-01)"
+    )
+    parser.add_argument("--cancel-ratio", type=float, default=0.12)
+    parser.add_argument("--popularity-skew", type=float, default=0.8, help="Zipf exponent for venue popularity")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--skip-rollups", action="store_true", help="do not rebuild report rollups afterwards")
+    args = parser.parse_args()
+
+    print("Generating synthetic South Moravia Conference Booking data...")
+    generate(
+        args.database_url,
+        users=args.users,
+        venues=args.venues,
+        bookings=args.bookings,
+        seed=args.seed,
+        days=args.days,
+        start_date=args.start_date,
+        cancel_ratio=args.cancel_ratio,
+        popularity_skew=args.popularity_skew,
+        batch_size=args.batch_size,
+        rebuild_rollups=not args.skip_rollups,
+    )
+    print("Synthetic data generation complete!")
@@ -2,18 +2,21 @@
 Database initialization script
 Run this to create tables and initial data
 """
+import os
 from sqlalchemy import create_engine
 from app.core.config import settings
-from app.core.database import Base
 from app.models.models import User, Venue, Booking
 from app.core.security import get_password_hash
 
 def init_db():
     """Initialize database with tables and sample data"""
-    engine = create_engine(settings.DATABASE_URL)
-    
-    # Create all tables
-    Base.metadata.create_all(bind=engine)
+    # Create the tables by running every migration, so a new database gets
+    # exactly the schema (partitions, indexes, data steps) an upgraded one has
+    from alembic import command
+    from alembic.config import Config
+    alembic_cfg = Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini"))
+    alembic_cfg.set_main_option("script_location", os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic"))
+    command.upgrade(alembic_cfg, "head")
     print("Database tables created successfully!")
 
 def create_sample_data():
@@ -0,0 +1,123 @@
+"""
+Production server for the South Moravia Conference Booking App
+
+Runs gunicorn with uvicorn workers: one worker per available CPU core
+(SERVER_WORKERS overrides it), uvloop and httptools when installed, and the
+app imported once in the master and forked into the workers
+(SERVER_PRELOAD_APP). On SIGTERM workers stop accepting connections and finish
+the requests in flight for up to SERVER_GRACEFUL_TIMEOUT_SECONDS. Without
+gunicorn (e.g. on Windows) it falls back to uvicorn's own process manager,
+which starts each worker from scratch instead of forking a preloaded app.
+
+    python serve.py
+
+start.py remains the auto-reloading development server.
+"""
+import importlib.util
+import os
+
+from app.core.config import settings
+
+APP = "app.main:app"
+
+
+def available_cores() -> int:
+    """CPU cores this process may use, honouring CPU affinity and a cgroup v2 CPU quota"""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as cpu_max:
+            quota, period = cpu_max.read().split()
+        if quota != "max":
+            cores = min(cores, max(int(quota) // int(period), 1))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+def worker_count() -> int:
+    return settings.SERVER_WORKERS if settings.SERVER_WORKERS > 0 else available_cores()
+
+
+def event_loop() -> str:
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+
+def http_protocol() -> str:
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+
+def gunicorn_options() -> dict:
+    return {
+        "bind": f"{settings.SERVER_HOST}:{settings.SERVER_PORT}",
+        "workers": worker_count(),
+        "preload_app": settings.SERVER_PRELOAD_APP,
+        "backlog": settings.SERVER_BACKLOG,
+        "keepalive": settings.SERVER_KEEPALIVE_SECONDS,
+        # A little longer than the workers' own drain, so they are never killed mid-drain
+        "graceful_timeout": settings.SERVER_GRACEFUL_TIMEOUT_SECONDS + 5,
+        "max_requests": settings.SERVER_MAX_REQUESTS,
+        "max_requests_jitter": settings.SERVER_MAX_REQUESTS_JITTER if settings.SERVER_MAX_REQUESTS else 0,
+        "post_fork": post_fork,
+        "accesslog": "-",
+    }
+
+
+def post_fork(server, worker) -> None:
+    """Drop database connections a preloaded master may have opened; each worker needs its own"""
+    from app.core.database import dispose_pools
+    dispose_pools()
+
+
+if importlib.util.find_spec("gunicorn"):
+    from uvicorn.workers import UvicornWorker
+
+    class Worker(UvicornWorker):
+        """Uvicorn worker with the fastest available loop and parser that drains on SIGTERM"""
+        CONFIG_KWARGS = {
+            "loop": event_loop(),
+            "http": http_protocol(),
+            "timeout_graceful_shutdown": settings.SERVER_GRACEFUL_TIMEOUT_SECONDS,
+        }
+
+
+def run_gunicorn() -> None:
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in gunicorn_options().items():
+                self.cfg.set(key, value)
+            self.cfg.set("worker_class", "serve.Worker")
+
+        def load(self):
+            from app.main import app
+            return app
+
+    Server().run()
+
+
+def run_uvicorn() -> None:
+    import uvicorn
+
+    uvicorn.run(
+        APP,
+        host=settings.SERVER_HOST,
+        port=settings.SERVER_PORT,
+        workers=worker_count(),
+        loop=event_loop(),
+        http=http_protocol(),
+        backlog=settings.SERVER_BACKLOG,
+        timeout_keep_alive=settings.SERVER_KEEPALIVE_SECONDS,
+        timeout_graceful_shutdown=settings.SERVER_GRACEFUL_TIMEOUT_SECONDS,
+        limit_max_requests=settings.SERVER_MAX_REQUESTS or None,
+    )
+
+
+if __name__ == "__main__":
+    if importlib.util.find_spec("gunicorn"):
+        run_gunicorn()
+    else:
+        run_uvicorn()
@@ -7,14 +7,76 @@ import httpx
 from fastapi.testclient import TestClient
 import sys
 import os
+import uuid
+import warnings
+from datetime import datetime, timedelta, timezone
 
 # Add the app directory to Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
 
+from sqlalchemy import event
 from app.main import app
+from app.core.database import SessionLocal, engine
+from app.core.security import create_access_token, get_password_hash
+from app.models.models import User
 
 client = TestClient(app)
 
+TEST_PASSWORD_HASH = get_password_hash("testpass")
+
+# On PostgreSQL a write that touches cached data also sends one NOTIFY to the
+# other workers on commit, however many caches it touches (app.core.notifications)
+NOTIFY = 1 if engine.dialect.name == "postgresql" else 0
+
+
+def create_test_user(is_admin=False):
+    """Insert a user straight into the database and return auth headers for it"""
+    db = SessionLocal()
+    try:
+        user = User(
+            email=f"{uuid.uuid4().hex}@example.com",
+            hashed_password=TEST_PASSWORD_HASH,
+            first_name="Test",
+            last_name="Admin" if is_admin else "User",
+            is_admin=is_admin,
+            is_active=True
+        )
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        return user.id, {"Authorization": f"Bearer {create_access_token(user.email)}"}
+    finally:
+        db.close()
+
+
+def create_test_venue(admin_headers, hourly_rate="1000.00"):
+    response = client.post("/api/v1/venues/", headers=admin_headers, json={
+        "name": f"Test Venue {uuid.uuid4().hex[:8]}",
+        "address": "Test Street 1",
+        "city": "Brno",
+        "capacity": 40,
+        "hourly_rate": hourly_rate
+    })
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def booking_slot(days_ahead, hour, hours=2):
+    start = (datetime.utcnow() + timedelta(days=days_ahead)).replace(
+        hour=hour, minute=0, second=0, microsecond=0
+    )
+    return start, start + timedelta(hours=hours)
+
+
+def create_test_booking(headers, venue_id, start, end):
+    response = client.post("/api/v1/bookings/", headers=headers, json={
+        "venue_id": venue_id,
+        "start_datetime": start.isoformat(),
+        "end_datetime": end.isoformat()
+    })
+    assert response.status_code == 200
+    return response.json()
+
 def test_root_endpoint():
     """Test the root endpoint"""
     response = client.get("/")
@@ -77,6 +139,1183 @@ def test_cors_headers():
     # CORS headers should be present or endpoint should be accessible
     assert response.status_code in [200, 405]  # OPTIONS might not be enabled
 
+def test_metrics_endpoint():
+    """Requests are counted per route template and exposed for Prometheus"""
+    _, headers = create_test_user()
+    client.get("/api/v1/bookings/0", headers=headers)
+    client.get("/health")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/api/v1/bookings/{booking_id}",status="404"}' in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/health",le="+Inf"}' in body
+    assert 'threadpool_tokens{state="limit"}' in body
+    assert "db_pool_connections" in body
+
+def test_booking_query_budgets(query_budget):
+    """Booking endpoints stay within their SQL query budgets"""
+    _, admin_headers = create_test_user(is_admin=True)
+    _, user_headers = create_test_user()
+    venue_id = create_test_venue(admin_headers)
+    booking = create_test_booking(user_headers, venue_id, *booking_slot(60, 9))
+    create_test_booking(user_headers, venue_id, *booking_slot(60, 13))
+
+    query_budget(client.get("/api/v1/bookings/", headers=user_headers), 4)
+    query_budget(client.get(f"/api/v1/bookings/{booking['id']}", headers=user_headers), 3)
+    response = client.put(
+        f"/api/v1/bookings/{booking['id']}", headers=user_headers, json={"notes": "Projector please"}
+    )
+    assert response.status_code == 200
+    query_budget(response, 3 + NOTIFY)
+
+def test_write_paths_are_single_statements(query_budget):
+    """Write endpoints update and return a row in one statement"""
+    _, admin_headers = create_test_user(is_admin=True)
+    user_id, user_headers = create_test_user()
+    venue_id = create_test_venue(admin_headers)
+    booking = create_test_booking(user_headers, venue_id, *booking_slot(70, 9))
+
+    # One query loads the authenticated user and one is the write. Booking
+    # writes also update the revenue rollup, and the response lazy loads the
+    # booking's user and venue. Cancel is one UPDATE on PostgreSQL; SQLite cannot
+    # return the previous status from it, so there it tries one UPDATE per status.
+    cancel_budget = 4 + NOTIFY if engine.dialect.name == "postgresql" else 5
+    writes = [
+        (client.put(f"/api/v1/venues/{venue_id}", headers=admin_headers, json={"name": "Renamed hall"}), 2 + NOTIFY),
+        (client.put(f"/api/v1/users/{user_id}", headers=user_headers, json={"first_name": "Renamed"}), 2),
+        (client.post(f"/api/v1/bookings/{booking['id']}/confirm", headers=admin_headers), 5 + NOTIFY),
+        (client.delete(f"/api/v1/bookings/{booking['id']}", headers=user_headers), cancel_budget),
+        (client.delete(f"/api/v1/venues/{venue_id}", headers=admin_headers), 2 + NOTIFY),
+        (client.delete(f"/api/v1/users/{user_id}", headers=admin_headers), 2),
+    ]
+    for response, budget in writes:
+        assert response.status_code == 200, response.text
+        query_budget(response, budget)
+
+    response = client.put(f"/api/v1/venues/{venue_id}", headers=admin_headers, json={"name": "Renamed again"})
+    assert response.json()["version"] == 4
+    response = client.put("/api/v1/venues/999999", headers=admin_headers, json={"name": "Missing"})
+    assert response.status_code == 404
+    response = client.delete("/api/v1/bookings/999999", headers=admin_headers)
+    assert response.status_code == 404
+
+def test_repeated_statements_are_logged(monkeypatch, caplog):
+    """Requests repeating a statement more often than the threshold log a warning"""
+    from app.core.config import settings
+    monkeypatch.setattr(settings, "SQL_REPEATED_STATEMENT_THRESHOLD", 1)
+    _, admin_headers = create_test_user(is_admin=True)
+    _, user_headers = create_test_user()
+    first_venue = create_test_venue(admin_headers)
+    second_venue = create_test_venue(admin_headers)
+    create_test_booking(user_headers, first_venue, *booking_slot(61, 9))
+    create_test_booking(user_headers, second_venue, *booking_slot(61, 9))
+
+    with caplog.at_level("WARNING", logger="app.core.query_stats"):
+        client.get("/api/v1/bookings/", headers=user_headers)
+    assert "Possible N+1 query" in caplog.text
+
+def test_reads_use_replicas_with_read_your_writes(monkeypatch):
+    """Reads go to a replica unless the caller just wrote or no replica is healthy"""
+    from sqlalchemy import create_engine
+    from app.core import database
+    from app.core.config import settings
+    replica = create_engine(settings.DATABASE_URL)
+    replica_statements = []
+    event.listen(replica, "before_cursor_execute", lambda *args: replica_statements.append(args[2]))
+    monkeypatch.setattr(database, "replica_router", database.ReplicaRouter([replica], 30))
+
+    _, admin_headers = create_test_user(is_admin=True)
+    _, user_headers = create_test_user()
+    venue_id = create_test_venue(admin_headers)
+
+    assert client.get(f"/api/v1/venues/{venue_id}", headers=user_headers).status_code == 200
+    assert replica_statements
+
+    replica_statements.clear()
+    booking = create_test_booking(user_headers, venue_id, *booking_slot(62, 9))
+    response = client.get(f"/api/v1/bookings/{booking['id']}", headers=user_headers)
+    assert response.status_code == 200
+    assert not replica_statements
+
+    # The write is remembered by the client's cookie, which only counts for the caller who wrote
+    assert database.WRITE_COOKIE in client.cookies
+    assert client.get(f"/api/v1/bookings/{booking['id']}", headers=admin_headers).status_code == 200
+    assert replica_statements
+    replica_statements.clear()
+    stamp = client.cookies[database.WRITE_COOKIE].rpartition(".")[0]
+    client.cookies.clear()
+    client.cookies.set(database.WRITE_COOKIE, f"{float(stamp) + 60:.3f}.forged")
+    assert client.get(f"/api/v1/bookings/{booking['id']}", headers=user_headers).status_code == 200
+    assert replica_statements
+    client.cookies.clear()
+
+    broken = create_engine("sqlite:////nonexistent/replica.db")
+    router = database.ReplicaRouter([broken], 30)
+    monkeypatch.setattr(database, "replica_router", router)
+    _, reader_headers = create_test_user()
+    assert client.get(f"/api/v1/venues/{venue_id}", headers=reader_headers).status_code == 200
+    assert router.pick() is None
+
+def test_idempotent_booking_retries(monkeypatch):
+    """Retries with the same Idempotency-Key replay the first response instead of booking again"""
+    import threading
+    import time
+    from sqlalchemy.orm.exc import StaleDataError
+    from app.core.config import settings
+    from app.crud import booking as crud_booking
+    from app.api.v1.idempotency import request_fingerprint
+    from app.crud import idempotency as crud_idempotency
+    from app.schemas.schemas import BookingCreate
+    _, admin_headers = create_test_user(is_admin=True)
+    user_id, user_headers = create_test_user()
+    venue_id = create_test_venue(admin_headers)
+    start, end = booking_slot(63, 9)
+    payload = {"venue_id": venue_id, "start_datetime": start.isoformat(), "end_datetime": end.isoformat()}
+    headers = {**user_headers, "Idempotency-Key": "retry-1"}
+
+    first = client.post("/api/v1/bookings/", headers=headers, json=payload)
+    retry = client.post("/api/v1/bookings/", headers=headers, json=payload)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert retry.headers["etag"] == first.headers["etag"] == '"1"'
+    assert client.get("/api/v1/bookings/", headers=user_headers).json()["total"] == 1
+
+    response = client.post("/api/v1/bookings/", headers=headers, json={**payload, "purpose": "party"})
+    assert response.status_code == 422
+
+    # A duplicate of a request that is still running waits for it, then gives up
+    monkeypatch.setattr(settings, "IDEMPOTENCY_WAIT_SECONDS", 0.1)
+    db = SessionLocal()
+    try:
+        fingerprint = request_fingerprint("POST", "/api/v1/bookings/", BookingCreate(**payload))
+        crud_idempotency.claim_idempotency_key(db, user_id, "retry-2", fingerprint)
+    finally:
+        db.close()
+    response = client.post("/api/v1/bookings/", headers={**user_headers, "Idempotency-Key": "retry-2"}, json=payload)
+    assert response.status_code == 409
+
+    # ... and is woken as soon as it completes, without waiting for the next poll
+    monkeypatch.setattr(settings, "IDEMPOTENCY_WAIT_SECONDS", 10.0)
+    db = SessionLocal()
+    try:
+        record, _ = crud_idempotency.claim_idempotency_key(db, user_id, "retry-3", fingerprint)
+        waiting = []
+        duplicate = threading.Thread(target=lambda: waiting.append(client.post(
+            "/api/v1/bookings/", headers={**user_headers, "Idempotency-Key": "retry-3"}, json=payload
+        )))
+        duplicate.start()
+        time.sleep(0.2)
+        started = time.monotonic()
+        crud_idempotency.complete_idempotency_key(db, record, 400, '{"detail": "first"}', {})
+        duplicate.join()
+    finally:
+        db.close()
+    assert time.monotonic() - started < 0.5
+    assert waiting[0].status_code == 400
+    assert waiting[0].json() == {"detail": "first"}
+
+    # Client errors are stored with their headers, version conflicts included
+    booking_id = first.json()["id"]
+    update_headers = {**user_headers, "Idempotency-Key": "update-1", "If-Match": '"7"'}
+    for _ in range(2):
+        response = client.put(f"/api/v1/bookings/{booking_id}", headers=update_headers, json={"purpose": "x"})
+        assert response.status_code == 412
+        assert response.headers["etag"] == '"1"'
+    assert response.headers["idempotent-replayed"] == "true"
+
+    def lose_race(*args, **kwargs):
+        raise StaleDataError("changed meanwhile")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(crud_booking, "update_booking", lose_race)
+        response = client.put(
+            f"/api/v1/bookings/{booking_id}", headers={**user_headers, "Idempotency-Key": "update-2"}, json={}
+        )
+    assert response.status_code == 409
+    response = client.put(
+        f"/api/v1/bookings/{booking_id}", headers={**user_headers, "Idempotency-Key": "update-2"}, json={}
+    )
+    assert response.status_code == 409
+    assert response.headers["idempotent-replayed"] == "true"
+
+    # The booking and its stored response commit together
+    def fail(*args, **kwargs):
+        raise RuntimeError("lost the database")
+
+    start, end = booking_slot(64, 9)
+    payload = {"venue_id": venue_id, "start_datetime": start.isoformat(), "end_datetime": end.isoformat()}
+    with monkeypatch.context() as patch:
+        patch.setattr(crud_idempotency, "complete_idempotency_key", fail)
+        with pytest.raises(RuntimeError):
+            client.post("/api/v1/bookings/", headers={**user_headers, "Idempotency-Key": "retry-4"}, json=payload)
+    assert client.get("/api/v1/bookings/", headers=user_headers).json()["total"] == 1
+    response = client.post("/api/v1/bookings/", headers={**user_headers, "Idempotency-Key": "retry-4"}, json=payload)
+    assert response.status_code == 200
+    assert "idempotent-replayed" not in response.headers
+
+def test_if_match_rejects_outdated_versions():
+    """Writes with an outdated If-Match version fail with 412 instead of overwriting newer data"""
+    from sqlalchemy.orm.exc import StaleDataError
+    from app.models.models import Venue
+    _, admin_headers = create_test_user(is_admin=True)
+    venue_id = create_test_venue(admin_headers)
+
+    response = client.get(f"/api/v1/venues/{venue_id}")
+    assert response.headers["etag"] == '"1"'
+    assert response.json()["version"] == 1
+
+    response = client.put(
+        f"/api/v1/venues/{venue_id}", headers={**admin_headers, "If-Match": '"1"'}, json={"capacity": 50}
+    )
+    assert response.status_code == 200
+    assert response.headers["etag"] == '"2"'
+
+    response = client.put(
+        f"/api/v1/venues/{venue_id}", headers={**admin_headers, "If-Match": '"1"'}, json={"capacity": 60}
+    )
+    assert response.status_code == 412
+    assert response.headers["etag"] == '"2"'
+    assert client.get(f"/api/v1/venues/{venue_id}").json()["capacity"] == 50
+
+    # Two writers that read the same version: the second UPDATE matches no row
+    first, second = SessionLocal(), SessionLocal()
+    try:
+        first_venue = first.get(Venue, venue_id)
+        second_venue = second.get(Venue, venue_id)
+        first_venue.capacity = 70
+        first.commit()
+        second_venue.capacity = 80
+        with pytest.raises(StaleDataError):
+            second.commit()
+    finally:
+        first.close()
+        second.close()
+
+def test_admission_control_prefers_booking_writes():
+    """Queued booking writes are admitted before reads, and reads are shed rather than queued behind them"""
+    import asyncio
+    from app.core.admission import AdmissionController, RouteClass, QUEUE_TIMEOUT, SHED
+
+    async def overload():
+        writes = RouteClass("booking_writes", 0, 2, 10, 1.0)
+        reads = RouteClass("reads", 2, 2, 10, 0.05, shed_when_outranked=True)
+        controller = AdmissionController(2, [writes, reads])
+        assert (await controller.acquire(reads))[0] is None
+        assert (await controller.acquire(reads))[0] is None
+
+        queued_read = asyncio.create_task(controller.acquire(reads))
+        queued_write = asyncio.create_task(controller.acquire(writes))
+        await asyncio.sleep(0)
+        assert (await controller.acquire(reads))[0] == SHED
+
+        controller.release(reads)
+        assert (await queued_write)[0] is None
+        assert (await queued_read)[0] == QUEUE_TIMEOUT
+        assert (writes.in_flight, reads.in_flight) == (1, 1)
+
+    asyncio.run(overload())
+
+def explain(crud_function, *args, **kwargs):
+    """Run a CRUD function, then EXPLAIN the last statement it executed"""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    db = SessionLocal()
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        crud_function(db, *args, **kwargs)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+        db.close()
+
+    statement, parameters = statements[-1]
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            # Test tables are tiny; make the planner show what it would do at scale
+            conn.exec_driver_sql("SET enable_seqscan = off")
+            rows = conn.exec_driver_sql("EXPLAIN " + statement, parameters).all()
+        else:
+            rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+    return "\n".join(str(row[-1]) for row in rows)
+
+def plan_indexes(plan):
+    """Indexes a plan scans. On a partitioned table PostgreSQL scans each partition's
+    own copy of an index, which counts as the parent index it was created from."""
+    import re
+    names = set(re.findall(r"Index (?:Only )?Scan (?:using|on) (\w+)|USING (?:COVERING )?INDEX (\w+)", plan))
+    names = {postgres or sqlite for postgres, sqlite in names}
+    if engine.dialect.name != "postgresql":
+        return names
+    with engine.connect() as conn:
+        parents = dict(conn.exec_driver_sql(
+            "SELECT child.relname, parent.relname FROM pg_inherits"
+            " JOIN pg_class child ON child.oid = pg_inherits.inhrelid"
+            " JOIN pg_class parent ON parent.oid = pg_inherits.inhparent"
+            " WHERE child.relkind = 'i'"
+        ).all())
+    return {parents.get(name, name) for name in names}
+
+def test_booking_queries_use_indexes():
+    """The planner picks the composite and partial booking indexes"""
+    from app.crud import booking as crud_booking
+    from app.crud import venue as crud_venue
+    start, end = booking_slot(90, 9)
+
+    # PostgreSQL tests overlaps as a range, which only the GiST index can take;
+    # elsewhere several composite indexes fit and the statistics pick one
+    if engine.dialect.name == "postgresql":
+        venue_indexes = ("ix_bookings_venue_period_gist",)
+    else:
+        venue_indexes = ("ix_bookings_active_venue_period", "ix_bookings_venue_id_start_datetime")
+    indexes = plan_indexes(explain(crud_venue.check_venue_availability, 1, start, end))
+    assert indexes & set(venue_indexes), indexes
+
+    indexes = plan_indexes(explain(crud_booking.get_user_bookings, user_id=1))
+    assert "ix_bookings_user_id" in indexes, indexes
+
+    indexes = plan_indexes(explain(crud_booking.get_bookings_count, user_id=1))
+    assert "ix_bookings_user_id" in indexes, indexes
+
+    indexes = plan_indexes(explain(crud_booking.get_venue_bookings, venue_id=1, start_date=start, end_date=end))
+    assert indexes & set(venue_indexes), indexes
+
+def test_revenue_rollups_follow_booking_writes():
+    """Rollups are maintained by booking writes and match a full rebuild"""
+    _, admin_headers = create_test_user(is_admin=True)
+    _, user_headers = create_test_user()
+    venue_id = create_test_venue(admin_headers)
+
+    first = create_test_booking(user_headers, venue_id, *booking_slot(30, 9))
+    second = create_test_booking(user_headers, venue_id, *booking_slot(30, 14, hours=3))
+    cancelled = create_test_booking(user_headers, venue_id, *booking_slot(31, 9))
+    client.post(f"/api/v1/bookings/{first['id']}/confirm", headers=admin_headers)
+    client.delete(f"/api/v1/bookings/{cancelled['id']}", headers=user_headers)
+
+    def report(granularity):
+        response = client.get(
+            "/api/v1/reports/revenue",
+            headers=admin_headers,
+            params={"venue_id": venue_id, "granularity": granularity}
+        )
+        assert response.status_code == 200
+        return response.json()["rows"]
+
+    rows = report("day")
+    assert len(rows) == 1
+    assert rows[0]["booking_count"] == 2
+    assert rows[0]["booked_hours"] == 5
+    assert float(rows[0]["revenue"]) == 5000
+    assert rows[0]["confirmed_count"] == 1
+    assert float(rows[0]["confirmed_revenue"]) == 2000
+    assert second["status"] == "pending"
+
+    response = client.post(
+        "/api/v1/reports/rollups/rebuild", headers=admin_headers, params={"venue_id": venue_id}
+    )
+    assert response.status_code == 200
+    assert report("day") == rows
+    assert report("month")[0]["booking_count"] == 2
+
+    response = client.get("/api/v1/reports/revenue", headers=user_headers)
+    assert response.status_code == 403
+
+def test_sweeper_expires_stale_pending_bookings(monkeypatch):
+    """Pending bookings past their hold are expired in batches and free their slot"""
+    from sqlalchemy import update
+    from app.core.config import settings
+    from app.core.sweeper import sweep_expired_bookings
+    from app.models.models import Booking
+    monkeypatch.setattr(settings, "EXPIRY_SWEEP_BATCH_SIZE", 1)
+    _, admin_headers = create_test_user(is_admin=True)
+    _, user_headers = create_test_user()
+    venue_id = create_test_venue(admin_headers)
+    stale_slot = booking_slot(32, 9)
+    stale = [
+        create_test_booking(user_headers, venue_id, *stale_slot),
+        create_test_booking(user_headers, venue_id, *booking_slot(32, 13)),
+    ]
+    fresh = create_test_booking(user_headers, venue_id, *booking_slot(32, 16))
+
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(Booking)
+            .where(Booking.id.in_([booking["id"] for booking in stale]))
+            .values(created_at=datetime.utcnow() - timedelta(minutes=settings.PENDING_BOOKING_HOLD_MINUTES + 5))
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    assert sweep_expired_bookings() == 2
+    bookings = {b["id"]: b for b in client.get("/api/v1/bookings/", headers=user_headers).json()["bookings"]}
+    assert [bookings[b["id"]]["status"] for b in stale] == ["expired", "expired"]
+    assert bookings[fresh["id"]]["status"] == "pending"
+    create_test_booking(user_headers, venue_id, *stale_slot)
+
+    rows = client.get(
+        "/api/v1/reports/revenue", headers=admin_headers, params={"venue_id": venue_id}
+    ).json()["rows"]
+    assert rows[0]["booking_count"] == 2
+    assert "bookings_expired_total 2" in client.get("/metrics").text
+
+def test_bulk_confirm_and_cancel(query_budget):
+    """Bulk endpoints change every matching booking in one go and report which ids changed"""
+    _, admin_headers = create_test_user(is_admin=True)
+    _, user_headers = create_test_user()
+    venue_id = create_test_venue(admin_headers)
+    bookings = [create_test_booking(user_headers, venue_id, *booking_slot(33, hour)) for hour in (8, 11, 14)]
+    ids = [booking["id"] for booking in bookings]
+    client.delete(f"/api/v1/bookings/{ids[2]}", headers=user_headers)
+
+    response = client.post("/api/v1/bookings/bulk/confirm", headers=admin_headers, json={"ids": ids + [0]})
+    assert response.status_code == 200
+    assert response.json() == {"changed_ids": ids[:2], "unchanged_ids": [0, ids[2]], "count": 2}
+    query_budget(response, 3 + NOTIFY)
+
+    start, _ = booking_slot(33, 0)
+    response = client.post("/api/v1/bookings/bulk/cancel", headers=admin_headers, json={
+        "venue_id": venue_id, "start_from": start.isoformat(), "start_before": (start + timedelta(days=1)).isoformat()
+    })
+    assert response.json()["changed_ids"] == ids[:2]
+    statuses = {b["id"]: b["status"] for b in client.get("/api/v1/bookings/", headers=user_headers).json()["bookings"]}
+    assert [statuses[booking_id] for booking_id in ids] == ["cancelled"] * 3
+
+    rows = client.get(
+        "/api/v1/reports/revenue", headers=admin_headers, params={"venue_id": venue_id}
+    ).json()["rows"]
+    assert rows == []
+
+    assert client.post("/api/v1/bookings/bulk/cancel", headers=admin_headers, json={}).status_code == 400
+    assert client.post("/api/v1/bookings/bulk/cancel", headers=user_headers, json={"ids": ids}).status_code == 403
+
+def test_occupancy_heatmap():
+    """Bookings are rasterized into hour-of-week slots per venue"""
+    _, admin_headers = create_test_user(is_admin=True)
+    _, user_headers = create_test_user()
+    venue_id = create_test_venue(admin_headers)
+
+    start, end = booking_slot(40, 9, hours=3)
+    create_test_booking(user_headers, venue_id, start, end)
+    create_test_booking(user_headers, venue_id, start + timedelta(hours=3), end + timedelta(hours=1))
+
+    period_start = start.replace(hour=0) - timedelta(days=start.weekday())
+    response = client.get("/api/v1/reports/occupancy-heatmap", headers=admin_headers, params={
+        "start_datetime": period_start.isoformat(),
+        "end_datetime": (period_start + timedelta(days=14)).isoformat(),
+        "venue_id": venue_id
+    })
+    assert response.status_code == 200
+    data = response.json()
+    assert data["venue_ids"] == [venue_id]
+    assert data["occurrences"] == [2] * 168
+
+    row = data["occupied_hours"][0]
+    first_hour = start.weekday() * 24 + 9
+    assert row[first_hour:first_hour + 4] == [1, 1, 1, 1]
+    assert sum(row) == 4
+    assert data["occupancy"][0][first_hour] == 0.5
+
+def test_booking_quotes_use_current_rates():
+    """Quotes price several slots at once and see venue rate changes immediately"""
+    _, admin_headers = create_test_user(is_admin=True)
+    venue_id = create_test_venue(admin_headers, hourly_rate="1000.00")
+    start, end = booking_slot(50, 10, hours=2)
+
+    def quote(*slots):
+        return client.post("/api/v1/bookings/quote", json={"items": [
+            {"venue_id": venue, "start_datetime": s.isoformat(), "end_datetime": e.isoformat()}
+            for venue, s, e in slots
+        ]})
+
+    response = quote((venue_id, start, end), (venue_id, start, end + timedelta(minutes=30)))
+    assert response.status_code == 200
+    data = response.json()
+    assert [q["hours"] for q in data["quotes"]] == [2, 3]
+    assert float(data["total_cost"]) == 5000
+
+    client.put(f"/api/v1/venues/{venue_id}", headers=admin_headers, json={"hourly_rate": "1500.00"})
+    assert float(quote((venue_id, start, end)).json()["total_cost"]) == 3000
+
+    assert quote((0, start, end)).status_code == 404
+    assert quote((venue_id, end, start)).status_code == 400
+
+    # Naive times are UTC, so they can be mixed with aware ones
+    response = quote((venue_id, start, end.replace(tzinfo=timezone.utc)))
+    assert response.status_code == 200
+    assert response.json()["quotes"][0]["hours"] == 2
+
+    # A rate read before a write is not cached after it
+    from sqlalchemy import event
+    from app.crud import venue as crud_venue
+    crud_venue.invalidate_venue_rate(venue_id)
+
+    def write_during_read(conn, cursor, statement, parameters, context, executemany):
+        crud_venue.invalidate_venue_rate(venue_id)
+
+    event.listen(engine, "after_cursor_execute", write_during_read)
+    try:
+        assert quote((venue_id, start, end)).status_code == 200
+    finally:
+        event.remove(engine, "after_cursor_execute", write_during_read)
+    assert venue_id not in crud_venue._rate_cache
+    assert quote((venue_id, start, end)).status_code == 200
+    assert venue_id in crud_venue._rate_cache
+
+    # Inactive venues are not quoted
+    client.delete(f"/api/v1/venues/{venue_id}", headers=admin_headers)
+    assert quote((venue_id, start, end)).status_code == 404
+
+def test_availability_stream_pushes_booking_changes():
+    """Availability streams get a snapshot, then every committed change in their range"""
+    import asyncio
+    import json
+    from app.core.availability import availability_events, broker
+    from app.crud import venue as crud_venue
+    _, admin_headers = create_test_user(is_admin=True)
+    _, user_headers = create_test_user()
+    venue_id = create_test_venue(admin_headers)
+    existing = create_test_booking(user_headers, venue_id, *booking_slot(80, 9))
+    range_start, _ = booking_slot(80, 0)
+
+    def load_booked_slots():
+        db = SessionLocal()
+        try:
+            return crud_venue.get_booked_slots(db, venue_id, range_start, range_start + timedelta(days=1))
+        finally:
+            db.close()
+
+    async def next_event(events):
+        message = ": keepalive\n\n"
+        while message == ": keepalive\n\n":
+            # Fail rather than hang the run when a change is never pushed
+            message = await asyncio.wait_for(events.__anext__(), timeout=10)
+        event_name, data = message.strip().splitlines()
+        return event_name.split(": ")[1], json.loads(data.split(": ", 1)[1])
+
+    async def watch():
+        events = availability_events(
+            venue_id, range_start, range_start + timedelta(days=1), load_booked_slots, keepalive=0.2
+        )
+        name, snapshot = await next_event(events)
+        assert name == "snapshot"
+        assert len(snapshot["booked"]) == 1
+
+        start, end = booking_slot(80, 13)
+        second = await asyncio.to_thread(create_test_booking, user_headers, venue_id, start, end)
+        name, change = await next_event(events)
+        assert name == "change"
+        assert [datetime.fromisoformat(value).replace(tzinfo=None) for value in change["booked"][0]] == [start, end]
+        assert change["released"] == []
+
+        await asyncio.to_thread(client.delete, f"/api/v1/bookings/{existing['id']}", headers=user_headers)
+        name, change = await next_event(events)
+        assert name == "change"
+        assert change["booked"] == [] and len(change["released"]) == 1
+
+        # Bookings outside the range are not pushed
+        await asyncio.to_thread(create_test_booking, user_headers, venue_id, *booking_slot(81, 9))
+        await asyncio.to_thread(client.delete, f"/api/v1/bookings/{second['id']}", headers=user_headers)
+        name, change = await next_event(events)
+        assert change["booked"] == [] and len(change["released"]) == 1
+        await events.aclose()
+
+    asyncio.run(watch())
+    assert broker.subscriber_counts()[()] == 0
+
+    response = client.get(
+        "/api/v1/venues/999999/availability/stream",
+        params={"start_datetime": "2030-01-01T00:00:00", "end_datetime": "2030-01-02T00:00:00"}
+    )
+    assert response.status_code == 404
+
+def test_server_sizes_workers_from_settings(monkeypatch):
+    """serve.py uses SERVER_WORKERS when set and the available cores otherwise"""
+    import serve
+    from app.core.config import settings
+    monkeypatch.setattr(settings, "SERVER_WORKERS", 3)
+    options = serve.gunicorn_options()
+    assert options["workers"] == 3
+    assert options["graceful_timeout"] > settings.SERVER_GRACEFUL_TIMEOUT_SECONDS
+    assert options["max_requests_jitter"] == 0
+
+    monkeypatch.setattr(settings, "SERVER_WORKERS", 0)
+    assert serve.worker_count() == serve.available_cores() >= 1
+
+def test_startup_warm_up_report(monkeypatch):
+    """The app factory warms up before serving and reports its startup time by phase"""
+    import subprocess
+    from app.core.config import settings
+    from app.main import create_app
+    monkeypatch.setattr(settings, "EXPIRY_SWEEP_INTERVAL_SECONDS", 0)
+    monkeypatch.setattr(settings, "BOOKING_ARCHIVE_INTERVAL_SECONDS", 0)
+    imported = subprocess.run(
+        [sys.executable, "-c", "import sys, app.main; print('numpy' in sys.modules)"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+    )
+    assert imported.stdout.strip() == "False"
+
+    with TestClient(create_app()) as started_client:
+        response = started_client.get("/health/startup")
+        assert response.status_code == 200
+        report = response.json()
+        assert report["ready"] is True
+        assert report["failed"] == []
+        assert set(report["phases"]) == {"import", "database_pool", "security", "typeahead", "openapi"}
+        assert 'app_startup_seconds{phase="openapi"}' in started_client.get("/metrics").text
+
+def test_venue_bookings_overlapping_a_window():
+    """Range reads return every booking overlapping the window, including ones straddling its edges"""
+    from sqlalchemy.dialects import postgresql
+    from app.crud.queries import booking_overlaps
+    _, admin_headers = create_test_user(is_admin=True)
+    _, user_headers = create_test_user()
+    venue_id = create_test_venue(admin_headers)
+    day, _ = booking_slot(95, 0)
+    ids = [
+        create_test_booking(user_headers, venue_id, day + timedelta(hours=start), day + timedelta(hours=end))["id"]
+        for start, end in ((7, 9), (9, 11), (12, 15), (16, 18))
+    ]
+
+    response = client.get(
+        f"/api/v1/bookings/venue/{venue_id}",
+        headers=admin_headers,
+        params={
+            "start_date": (day + timedelta(hours=8)).isoformat(),
+            "end_date": (day + timedelta(hours=13)).isoformat()
+        }
+    )
+    assert response.status_code == 200
+    assert [booking["id"] for booking in response.json()] == ids[:3]
+
+    # Touching the edge of a booking is not an overlap
+    response = client.get(
+        f"/api/v1/bookings/venue/{venue_id}",
+        headers=admin_headers,
+        params={"start_date": (day + timedelta(hours=15)).isoformat()}
+    )
+    assert [booking["id"] for booking in response.json()] == ids[3:]
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    postgres = Session(bind=create_engine("postgresql://"))
+    sql = str(booking_overlaps(postgres, day, None).compile(dialect=postgresql.dialect()))
+    assert sql.startswith("tstzrange(bookings.start_datetime, bookings.end_datetime) && tstzrange(")
+
+
+def test_calendar_feeds_are_cached_until_bookings_change(query_budget):
+    """Feeds render once, answer polls with 304 without SQL, and change with their bookings"""
+    from urllib.parse import urlsplit
+    _, admin_headers = create_test_user(is_admin=True)
+    _, user_headers = create_test_user()
+    venue_id = create_test_venue(admin_headers)
+    booking = create_test_booking(user_headers, venue_id, *booking_slot(100, 9))
+
+    response = client.get("/api/v1/calendar/links", headers=user_headers, params={"venue_id": venue_id})
+    assert response.status_code == 200
+    links = {name: urlsplit(url) for name, url in response.json().items()}
+    user_feed = f"{links['bookings'].path}?{links['bookings'].query}"
+    venue_feed = f"{links['venue'].path}?{links['venue'].query}"
+
+    response = client.get(user_feed)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/calendar")
+    assert f"UID:booking-{booking['id']}@" in response.text
+    assert "LOCATION:" in response.text
+    etag = response.headers["etag"]
+
+    response = client.get(user_feed, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    query_budget(response, 0)
+
+    response = client.get(venue_feed)
+    assert response.status_code == 200
+    assert "SUMMARY:Booked" in response.text and "LOCATION:" not in response.text
+
+    client.put(f"/api/v1/bookings/{booking['id']}", headers=user_headers, json={"notes": "Projector, please"})
+    response = client.get(user_feed, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert "DESCRIPTION:Projector\\, please" in response.text
+
+    assert client.get(f"{links['venue'].path}?token=forged").status_code == 404
+    assert client.get(f"/api/v1/calendar/users/{booking['user_id']}.ics?{links['venue'].query}").status_code == 404
+
+
+def test_archived_bookings_stay_readable():
+    """The archiver moves long-past and cancelled bookings out of bookings; reads by id still find them"""
+    from app.core import archiver
+    from app.crud import booking as crud_booking
+    from app.models.models import Booking
+    user_id, user_headers = create_test_user()
+    _, admin_headers = create_test_user(is_admin=True)
+    venue_id = create_test_venue(admin_headers)
+    cancelled = create_test_booking(user_headers, venue_id, *booking_slot(110, 9))
+    client.delete(f"/api/v1/bookings/{cancelled['id']}", headers=user_headers)
+
+    db = SessionLocal()
+    try:
+        past = Booking(
+            user_id=user_id, venue_id=venue_id, total_cost=2000, status="confirmed",
+            start_datetime=datetime(2001, 5, 1, 9), end_datetime=datetime(2001, 5, 1, 11)
+        )
+        db.add(past)
+        db.commit()
+        past_id = past.id
+    finally:
+        db.close()
+
+    def report():
+        client.post("/api/v1/reports/rollups/rebuild", headers=admin_headers, params={"venue_id": venue_id})
+        response = client.get("/api/v1/reports/revenue", headers=admin_headers, params={"venue_id": venue_id})
+        return response.json()["rows"]
+
+    before = report()
+    assert archiver.run_archive() >= 1
+    db = SessionLocal()
+    try:
+        # Cancelled bookings are kept for BOOKING_ARCHIVE_INACTIVE_AFTER_DAYS first
+        assert crud_booking.get_booking(db, cancelled["id"]) is not None
+        crud_booking.archive_bookings(
+            db, datetime(2000, 1, 1, tzinfo=timezone.utc), datetime.now(timezone.utc) + timedelta(minutes=1), 1000
+        )
+        assert db.query(Booking).filter(Booking.id.in_([past_id, cancelled["id"]])).count() == 0
+    finally:
+        db.close()
+
+    response = client.get(f"/api/v1/bookings/{past_id}", headers=user_headers)
+    assert response.status_code == 200
+    assert response.json()["status"] == "confirmed"
+    assert response.json()["venue"]["id"] == venue_id
+    assert client.get(f"/api/v1/bookings/{cancelled['id']}", headers=user_headers).json()["status"] == "cancelled"
+    assert client.delete(f"/api/v1/bookings/{past_id}", headers=user_headers).status_code == 404
+
+    # Rollups still count archived bookings, also after a rebuild
+    assert report() == before
+
+
+def test_venue_search_responses_are_cached(query_budget):
+    """Repeated venue searches skip the database until a venue changes"""
+    from app.core import venue_cache
+    _, admin_headers = create_test_user(is_admin=True)
+    venue_id = create_test_venue(admin_headers)
+    city = f"Cachetown {uuid.uuid4().hex[:8]}"
+    client.put(f"/api/v1/venues/{venue_id}", headers=admin_headers, json={"city": city})
+
+    first = client.get("/api/v1/venues/", params={"city": city, "min_capacity": 10})
+    assert first.status_code == 200
+    assert first.json()["total"] == 1
+
+    # The same search, spelled differently
+    hit = client.get("/api/v1/venues/", params={"city": f" {city.upper()}", "min_capacity": 10, "min_rate": 0})
+    query_budget(hit, 0)
+    assert hit.json() == first.json()
+    assert client.get("/api/v1/venues/", params={"city": city, "min_capacity": 10, "limit": 5}).json()["size"] == 5
+
+    # A padded city runs the same query as the plain one, whichever fills the cache first
+    padded = client.get("/api/v1/venues/", params={"city": f"  {city} ", "max_capacity": 100})
+    assert padded.json()["total"] == 1
+    plain = client.get("/api/v1/venues/", params={"city": city, "max_capacity": 100})
+    query_budget(plain, 0)
+    assert plain.json() == padded.json()
+
+    client.put(f"/api/v1/venues/{venue_id}", headers=admin_headers, json={"capacity": 5})
+    response = client.get("/api/v1/venues/", params={"city": city, "min_capacity": 10})
+    assert response.json()["total"] == 0
+
+    metrics = client.get("/metrics").text
+    assert 'venue_search_cache_requests_total{result="hit"}' in metrics
+    assert 'venue_search_cache{state="entries"}' in metrics
+    assert venue_cache.venue_search_cache.generation > 0
+
+
+def test_venue_autocomplete(query_budget):
+    """Suggestions match word prefixes regardless of case and accents, and follow venue writes"""
+    from app.core import typeahead
+    typeahead.ensure_loaded()  # as the warm-up does; later lookups never query
+    _, admin_headers = create_test_user(is_admin=True)
+    venue_id = create_test_venue(admin_headers)
+    tag = uuid.uuid4().hex[:6]
+    client.put(
+        f"/api/v1/venues/{venue_id}", headers=admin_headers,
+        json={"name": f"Hotel Zlatá Husa {tag}", "city": f"Břeclav{tag}"}
+    )
+
+    def suggest(q):
+        response = client.get("/api/v1/venues/autocomplete", params={"q": q})
+        assert response.status_code == 200
+        query_budget(response, 0)
+        return response.json()["suggestions"]
+
+    assert suggest(f"zlata husa {tag}") == [
+        {"type": "venue", "value": f"Hotel Zlatá Husa {tag}", "venue_id": venue_id, "city": f"Břeclav{tag}", "venue_count": None}
+    ]
+    assert suggest(f"BRECLAV{tag}") == [
+        {"type": "city", "value": f"Břeclav{tag}", "venue_id": None, "city": None, "venue_count": 1}
+    ]
+
+    client.put(f"/api/v1/venues/{venue_id}", headers=admin_headers, json={"name": f"Grand {tag}"})
+    assert suggest(f"husa {tag}") == []
+    assert [s["venue_id"] for s in suggest(f"grand {tag}")] == [venue_id]
+
+    client.delete(f"/api/v1/venues/{venue_id}", headers=admin_headers)
+    assert suggest(f"grand {tag}") == []
+    assert suggest(f"breclav{tag}") == []
+    assert client.get("/api/v1/venues/autocomplete").status_code == 422
+
+
+def test_venue_search_facets(query_budget):
+    """Facet counts come from one grouped query, each under every filter but its own"""
+    _, admin_headers = create_test_user(is_admin=True)
+    city = f"Facetville {uuid.uuid4().hex[:8]}"
+    for capacity, rate in ((10, "400.00"), (40, "1500.00"), (300, "1500.00")):
+        venue_id = create_test_venue(admin_headers, hourly_rate=rate)
+        client.put(f"/api/v1/venues/{venue_id}", headers=admin_headers, json={"city": city, "capacity": capacity})
+
+    response = client.get("/api/v1/venues/", params={"city": city, "min_capacity": 30, "include_facets": True})
+    assert response.status_code == 200
+    query_budget(response, 2)
+    body = response.json()
+    assert body["total"] == 2 and len(body["venues"]) == 2
+    facets = body["facets"]
+    assert {"value": city, "count": 2} in facets["city"]
+    assert [bucket["count"] for bucket in facets["capacity"]] == [1, 1, 0, 0, 1, 0]
+    assert facets["capacity"][0] == {"min": None, "max": 20, "count": 1}
+    assert facets["capacity"][-1] == {"min": 500, "max": None, "count": 0}
+    assert [bucket["count"] for bucket in facets["hourly_rate"]] == [0, 0, 2, 0, 0]
+
+    assert client.get("/api/v1/venues/", params={"city": city}).json()["facets"] is None
+
+
+def test_sparse_fieldsets(query_budget):
+    """fields= trims both the SELECT and the response, and loads relations only when named"""
+    _, admin_headers = create_test_user(is_admin=True)
+    _, user_headers = create_test_user()
+    venue_id = create_test_venue(admin_headers)
+    create_test_booking(user_headers, venue_id, *booking_slot(95, 9))
+
+    statements = []
+    capture = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        response = client.get("/api/v1/venues/", params={"fields": "name,id,hourly_rate", "limit": 1000})
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    assert response.status_code == 200
+    venue = next(venue for venue in response.json()["venues"] if venue["id"] == venue_id)
+    assert venue == {"id": venue_id, "name": venue["name"], "hourly_rate": 1000.0}
+    assert not any("description" in statement for statement in statements)
+
+    response = client.get("/api/v1/bookings/", headers=user_headers, params={"fields": "id,venue"})
+    assert response.status_code == 200
+    query_budget(response, 4)
+    [booking] = response.json()["bookings"]
+    assert set(booking) == {"id", "venue"} and booking["venue"]["id"] == venue_id
+
+    response = client.get(f"/api/v1/bookings/{booking['id']}", headers=user_headers, params={"fields": "status"})
+    assert response.json() == {"status": "pending"}
+    assert response.headers["etag"] == '"1"'
+
+    response = client.get(f"/api/v1/venues/{venue_id}", params={"fields": "city,nope"})
+    assert response.status_code == 400
+
+@pytest.mark.skipif(engine.dialect.name != "postgresql", reason="LISTEN/NOTIFY needs PostgreSQL")
+def test_notifications_reach_every_worker(monkeypatch):
+    """Other workers' changes arrive through LISTEN, which reconnects and resyncs when dropped"""
+    import time
+    from sqlalchemy import text
+    from app.core import notifications, typeahead, venue_cache
+    from app.core.calendar_feeds import FeedKey, feed_cache
+    from app.core.config import settings
+    from app.main import create_app
+    monkeypatch.setattr(settings, "STARTUP_WARMUP_ENABLED", False)
+    monkeypatch.setattr(settings, "EXPIRY_SWEEP_INTERVAL_SECONDS", 0)
+    monkeypatch.setattr(settings, "BOOKING_ARCHIVE_INTERVAL_SECONDS", 0)
+    key = FeedKey("venue", 0)
+    search_cache = venue_cache.venue_search_cache
+
+    def cache_feed():
+        feed_cache.put(key, b"BEGIN:VCALENDAR", feed_cache.generation(key))
+        assert feed_cache.get(key) is not None
+
+    def cache_search():
+        search_cache.put("search", b"{}", search_cache.generation)
+        assert search_cache.get("search") is not None
+
+    def wait_for(condition):
+        deadline = time.monotonic() + 10
+        while not condition():
+            assert time.monotonic() < deadline, "timed out"
+            time.sleep(0.05)
+
+    def notify_from_another_worker(channel, payload=None):
+        with engine.begin() as connection:
+            connection.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": channel, "payload": "another-worker" if payload is None else f"another-worker:{payload}"}
+            )
+
+    with TestClient(create_app()):
+        assert notifications.listener.listening.is_set()
+        cache_feed()
+        notify_from_another_worker("calendar_feeds", '[["venue", 0]]')
+        wait_for(lambda: feed_cache.get(key) is None)
+        cache_search()
+        notify_from_another_worker("venue_search", "")
+        wait_for(lambda: search_cache.get("search") is None)
+        typeahead.ensure_loaded()
+        notify_from_another_worker(
+            "venue_typeahead", '{"id": -1, "name": "Zwölf Apostel", "city": "Znojmo", "is_active": true}'
+        )
+        wait_for(lambda: typeahead.index.suggest("zwolf", 1))
+        # A payload that was too big for NOTIFY arrives as a bare worker id: resync the channel
+        cache_feed()
+        notify_from_another_worker("calendar_feeds")
+        wait_for(lambda: feed_cache.get(key) is None)
+
+        # Whatever was sent while the connection was down is lost, so the caches start over
+        cache_feed()
+        cache_search()
+        with engine.begin() as connection:
+            connection.execute(
+                text("SELECT pg_terminate_backend(:pid)"), {"pid": notifications.listener.backend_pid}
+            )
+        wait_for(lambda: feed_cache.get(key) is None)
+        wait_for(lambda: search_cache.get("search") is None)
+        wait_for(lambda: not typeahead.index.loaded)
+        wait_for(notifications.listener.listening.is_set)
+        cache_feed()
+        notify_from_another_worker("calendar_feeds", '[["venue", 0]]')
+        wait_for(lambda: feed_cache.get(key) is None)
+    assert not notifications.listener.listening.is_set()
+
+
+def test_oversized_notifications_fit_notify():
+    """Payloads over PostgreSQL's NOTIFY limit are split or sent as a resync instead of failing the commit"""
+    import json
+    import select
+    from types import SimpleNamespace
+    from app.core import calendar_feeds, notifications
+    if engine.dialect.name != "postgresql":
+        pytest.skip("NOTIFY needs PostgreSQL")
+
+    listening = engine.raw_connection()
+    try:
+        listening.dbapi_connection.autocommit = True
+        with listening.dbapi_connection.cursor() as cursor:
+            cursor.execute("LISTEN calendar_feeds")
+            cursor.execute("LISTEN venue_search")
+
+        def received():
+            messages = []
+            while select.select([listening.dbapi_connection], [], [], 1)[0]:
+                listening.dbapi_connection.poll()
+                while listening.dbapi_connection.notifies:
+                    notification = listening.dbapi_connection.notifies.pop(0)
+                    messages.append((notification.channel, notification.payload))
+            return messages
+
+        # A bulk write touching 1000 users' feeds: several payloads, each small enough
+        db = SessionLocal()
+        try:
+            changes = [(None, SimpleNamespace(venue_id=1, user_id=1000000 + i)) for i in range(1000)]
+            calendar_feeds.track_booking_changes(db, changes)
+            db.commit()
+        finally:
+            db.close()
+        messages = received()
+        assert len(messages) > 1
+        keys = set()
+        for channel, message in messages:
+            assert len(message.encode()) < 8000
+            sender, _, payload = message.partition(":")
+            assert sender == notifications.WORKER_ID
+            keys.update(tuple(key) for key in json.loads(payload))
+        assert len(keys) == 1001
+
+        # Anything still too big reaches the other workers as a resync
+        db = SessionLocal()
+        try:
+            notifications.publish_on_commit(db, "venue_search", "x" * 10000)
+            db.commit()
+        finally:
+            db.close()
+        assert received() == [("venue_search", notifications.WORKER_ID)]
+    finally:
+        listening.close()
+
+
+def test_bulk_cancel_of_a_busy_venue_commits():
+    """A bulk cancel too big for one NOTIFY still commits; the venue's streams get a fresh snapshot"""
+    import asyncio
+    import json
+    from app.core.availability import availability_events
+    from app.crud import booking as crud_booking
+    from app.crud import venue as crud_venue
+    from app.schemas.schemas import BookingCreate
+    _, admin_headers = create_test_user(is_admin=True)
+    user_id, _ = create_test_user()
+    venue_id = create_test_venue(admin_headers)
+    first, _ = booking_slot(120, 0)
+    last = first + timedelta(hours=400)
+    db = SessionLocal()
+    try:
+        for hour in range(400):
+            start = first + timedelta(hours=hour)
+            booking = BookingCreate(venue_id=venue_id, start_datetime=start, end_datetime=start + timedelta(hours=1))
+            assert crud_booking.create_booking(db, booking, user_id) is not None
+    finally:
+        db.close()
+
+    def load_booked_slots():
+        db = SessionLocal()
+        try:
+            return crud_venue.get_booked_slots(db, venue_id, first, last)
+        finally:
+            db.close()
+
+    async def next_event(events):
+        message = ": keepalive\n\n"
+        while message == ": keepalive\n\n":
+            message = await asyncio.wait_for(events.__anext__(), timeout=10)
+        event_name, data = message.strip().splitlines()
+        return event_name.split(": ")[1], json.loads(data.split(": ", 1)[1])
+
+    async def watch():
+        events = availability_events(venue_id, first, last, load_booked_slots, keepalive=0.2)
+        name, snapshot = await next_event(events)
+        assert name == "snapshot" and len(snapshot["booked"]) == 400
+        response = await asyncio.to_thread(
+            client.post, "/api/v1/bookings/bulk/cancel", headers=admin_headers, json={"venue_id": venue_id}
+        )
+        assert response.status_code == 200
+        assert response.json()["count"] == 400
+        name, snapshot = await next_event(events)
+        assert name == "snapshot" and snapshot["booked"] == []
+        await events.aclose()
+
+    asyncio.run(watch())
+
+
+def test_calendar_feed_links_can_be_rotated():
+    """Rotating a feed's salt revokes its old URL in place of a cached feed"""
+    from urllib.parse import urlsplit
+
+    def feed_path(url):
+        parts = urlsplit(url)
+        return f"{parts.path}?{parts.query}"
+
+    _, admin_headers = create_test_user(is_admin=True)
+    _, user_headers = create_test_user()
+    venue_id = create_test_venue(admin_headers)
+    links = client.get("/api/v1/calendar/links", headers=user_headers, params={"venue_id": venue_id}).json()
+    old_user_feed, old_venue_feed = feed_path(links["bookings"]), feed_path(links["venue"])
+    assert client.get(old_user_feed).status_code == 200
+    assert client.get(old_venue_feed).status_code == 200
+
+    response = client.post("/api/v1/calendar/links/rotate", headers=user_headers)
+    assert response.status_code == 200
+    new_user_feed = feed_path(response.json()["bookings"])
+    assert new_user_feed != old_user_feed
+    assert client.get(old_user_feed).status_code == 404
+    assert client.get(new_user_feed).status_code == 200
+    assert feed_path(client.get("/api/v1/calendar/links", headers=user_headers).json()["bookings"]) == new_user_feed
+
+    response = client.post("/api/v1/calendar/links/rotate", headers=user_headers, params={"venue_id": venue_id})
+    assert response.status_code == 403
+    assert client.get(old_venue_feed).status_code == 200
+    response = client.post("/api/v1/calendar/links/rotate", headers=admin_headers, params={"venue_id": venue_id})
+    assert response.status_code == 200
+    assert client.get(old_venue_feed).status_code == 404
+    assert client.get(feed_path(response.json()["venue"])).status_code == 200
+
+
+@pytest.mark.skipif(engine.dialect.name != "postgresql", reason="advisory locks need PostgreSQL")
+def test_archive_runs_in_one_worker_at_a_time():
+    """A run skips while another worker holds the archiver lock; partition upkeep commits month by month"""
+    from datetime import date
+    from app.core import archiver, partitions
+    from app.core.database import job_lock
+    from app.core.sweeper import sweep_expired_bookings
+
+    with job_lock("booking_archiver") as acquired:
+        assert acquired
+        with job_lock("booking_archiver") as racing:
+            assert not racing
+        assert archiver.run_archive() == 0
+    with job_lock("booking_expiry_sweep"):
+        assert sweep_expired_bookings() == 0
+
+    month = date(1990, 1, 1)
+    with engine.connect() as connection:
+        assert partitions.ensure_booking_partitions(connection, month, month) == [partitions.partition_name(month)]
+        assert partitions.ensure_booking_partitions(connection, month, month) == []
+    with engine.connect() as connection:
+        assert partitions.partition_name(month) in partitions.existing_partitions(connection)
+    with engine.connect() as connection:
+        assert partitions.drop_empty_booking_partitions(connection, partitions.add_months(month, 1)) == [
+            partitions.partition_name(month)
+        ]
+    with engine.connect() as connection:
+        assert partitions.partition_name(month) not in partitions.existing_partitions(connection)
+
+
+def test_models_match_migrations():
+    """init_db builds the schema by running the migrations; the models describe the same schema"""
+    from alembic import command
+    from alembic.config import Config
+    config = Config(os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic"))
+    with warnings.catch_warnings():
+        # SQLite cannot reflect the expression index only PostgreSQL has
+        warnings.simplefilter("ignore", UserWarning)
+        command.check(config)
+
+
+def test_occupancy_heatmap_of_a_long_period(monkeypatch):
+    """Long periods rasterize fewer venues at a time, with the same result"""
+    from app.crud import analytics as crud_analytics
+    _, admin_headers = create_test_user(is_admin=True)
+    _, user_headers = create_test_user()
+    venue_ids = [create_test_venue(admin_headers) for _ in range(3)]
+    for days, venue_id in enumerate(venue_ids):
+        create_test_booking(user_headers, venue_id, *booking_slot(60 + days, 10, hours=2))
+
+    start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    params = {
+        "start_datetime": start.isoformat(),
+        "end_datetime": (start + timedelta(days=3 * 365)).isoformat(),
+        "venue_id": venue_ids,
+    }
+    whole = client.get("/api/v1/reports/occupancy-heatmap", headers=admin_headers, params=params).json()
+    assert all(sum(row) >= 2 for row in whole["occupied_hours"])
+
+    # Three years of hours only fit one venue per chunk
+    monkeypatch.setattr(crud_analytics, "MAX_CHUNK_SLOTS", 3 * 365 * 24 + 2 * crud_analytics.HOURS_PER_WEEK)
+    response = client.get("/api/v1/reports/occupancy-heatmap", headers=admin_headers, params=params)
+    assert response.status_code == 200
+    assert response.json() == whole
+
+
+def test_every_api_write_has_an_admission_class():
+    """Venue and user writes are limited like booking writes, in a class of their own"""
+    from app.core.admission import default_controller, route_class_name
+    classes = default_controller().classes
+    prefix = "/api/v1"
+    assert route_class_name("POST", f"{prefix}/bookings/") == "booking_writes"
+    for method, path in [
+        ("POST", "/venues/"), ("PUT", "/venues/3"), ("DELETE", "/venues/3"),
+        ("PUT", "/users/5"), ("DELETE", "/users/5"), ("POST", "/calendar/links/rotate"),
+    ]:
+        assert route_class_name(method, prefix + path) == "other_writes"
+    assert classes["booking_writes"].priority < classes["other_writes"].priority < classes["reads"].priority
+    assert route_class_name("GET", f"{prefix}/venues/3/availability/stream") is None
+
+
 if __name__ == "__main__":
     # Run tests manually
     print("🧪 Running basic API tests...")